@@ -0,0 +1,163 @@
+# analytics.py
+import os
+import re
+
+# Grades are free text ("87", "87%", "17/20", "B+", "Pending"); grade_score
+# turns them into a 0-100 number kept in Submission.ai_score/final_score,
+# so statistics read numeric columns instead of parsing strings per row.
+# Mid-band values for letter grades.
+LETTER_GRADES = {
+    "A+": 98.0, "A": 95.0, "A-": 91.0,
+    "B+": 88.0, "B": 85.0, "B-": 81.0,
+    "C+": 78.0, "C": 75.0, "C-": 71.0,
+    "D+": 68.0, "D": 65.0, "D-": 61.0,
+    "F": 50.0,
+}
+# AI and final grades this many points apart are reported as outliers,
+# as are differences far from the usual one (robust z-score above 3.5).
+GRADE_OUTLIER_POINTS = float(os.getenv("GRADE_OUTLIER_POINTS", "10"))
+GRADE_OUTLIER_Z = 3.5
+GRADE_HISTOGRAM_BINS = 10
+
+_NUMBER = re.compile(r"^(-?\d+(?:\.\d+)?)\s*(%|/\s*(\d+(?:\.\d+)?))?$")
+
+
+def grade_score(grade) -> float | None:
+    """
+    Numeric 0-100 score of a grade string, or None when it isn't one
+    ("Pending", empty, unrecognized). Fractions are scaled to 100.
+    """
+    text = str(grade if grade is not None else "").strip()
+    if not text:
+        return None
+    letter = LETTER_GRADES.get(text.upper())
+    if letter is not None:
+        return letter
+    m = _NUMBER.match(text)
+    if m is None:
+        return None
+    value = float(m.group(1))
+    if m.group(3) is not None:
+        total = float(m.group(3))
+        return round(value / total * 100, 2) if total else None
+    return value
+
+
+# ---------- STATISTICS ----------
+# numpy loads on the first analytics request, not at app import.
+
+def describe(values) -> dict:
+    """count/mean/median/stddev/min/max/quartiles of a float array, NaNs skipped."""
+    import numpy as np
+
+    x = values[~np.isnan(values)]
+    if not x.size:
+        return {"count": 0, "mean": None, "median": None, "stddev": None,
+                "min": None, "max": None, "p25": None, "p75": None}
+    p25, median, p75 = np.percentile(x, [25, 50, 75])
+    return {
+        "count": int(x.size),
+        "mean": round(float(x.mean()), 2),
+        "median": round(float(median), 2),
+        "stddev": round(float(x.std(ddof=1)), 2) if x.size > 1 else 0.0,
+        "min": round(float(x.min()), 2),
+        "max": round(float(x.max()), 2),
+        "p25": round(float(p25), 2),
+        "p75": round(float(p75), 2),
+    }
+
+
+def histogram(values, bins: int = GRADE_HISTOGRAM_BINS) -> list[dict]:
+    """Counts over equal-width 0-100 bins; scores outside 0-100 count in the end bins."""
+    import numpy as np
+
+    x = values[~np.isnan(values)]
+    edges = np.linspace(0, 100, bins + 1)
+    counts, _ = np.histogram(np.clip(x, 0, 100), bins=edges)
+    return [
+        {"from": round(float(lo), 2), "to": round(float(hi), 2), "count": int(n)}
+        for lo, hi, n in zip(edges[:-1], edges[1:], counts)
+    ]
+
+
+def agreement(ai, final) -> dict:
+    """How closely final grades follow AI grades, over submissions that have both."""
+    import numpy as np
+
+    both = ~np.isnan(ai) & ~np.isnan(final)
+    diff = final[both] - ai[both]
+    n = int(diff.size)
+    if not n:
+        return {"pairs": 0, "mean_difference": None, "mean_abs_difference": None,
+                "exact": None, "within_5": None, "correlation": None}
+    correlation = None
+    if n > 1 and ai[both].std() > 0 and final[both].std() > 0:
+        correlation = round(float(np.corrcoef(ai[both], final[both])[0, 1]), 4)
+    return {
+        "pairs": n,
+        "mean_difference": round(float(diff.mean()), 2),    # final minus AI
+        "mean_abs_difference": round(float(np.abs(diff).mean()), 2),
+        "exact": round(float((diff == 0).mean()), 4),
+        "within_5": round(float((np.abs(diff) <= 5).mean()), 4),
+        "correlation": correlation,
+    }
+
+
+def divergent(ai, final, points: float = GRADE_OUTLIER_POINTS):
+    """
+    Indexes of submissions whose final grade is at least `points` away from
+    the AI grade, or whose difference is an outlier among all differences
+    (robust z-score on the median absolute deviation). Largest gap first.
+    """
+    import numpy as np
+
+    diff = final - ai
+    gap = np.abs(diff)
+    flagged = gap >= points
+    both = ~np.isnan(diff)
+    if both.sum() > 2:
+        center = np.median(diff[both])
+        mad = np.median(np.abs(diff[both] - center))
+        if mad > 0:
+            z = 0.6745 * np.abs(diff - center) / mad
+            flagged |= z > GRADE_OUTLIER_Z
+    flagged &= both
+    idx = np.flatnonzero(flagged)
+    return idx[np.argsort(-gap[idx], kind="stable")]
+
+
+def grade_report(rows, outlier_points: float = GRADE_OUTLIER_POINTS, max_outliers: int = 50) -> dict:
+    """
+    Statistics over (submission id, student name, ai_score, final_score)
+    rows, fetched in one query. "effective" is the final grade where
+    there is one and the AI grade otherwise.
+    """
+    import numpy as np
+
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    ai = np.array([r[2] for r in rows], dtype=float)      # None -> NaN
+    final = np.array([r[3] for r in rows], dtype=float)
+    effective = np.where(np.isnan(final), ai, final)
+
+    outliers = divergent(ai, final, outlier_points)
+    return {
+        "submissions": int(ids.size),
+        "ungraded": int(np.isnan(effective).sum()),
+        "ai": describe(ai),
+        "final": describe(final),
+        "effective": describe(effective),
+        "histogram": histogram(effective),
+        "agreement": agreement(ai, final),
+        "outlier_points": outlier_points,
+        "outliers": [
+            {
+                "submission_id": int(ids[i]),
+                "student_name": rows[i][1],
+                "ai_score": float(ai[i]),
+                "final_score": float(final[i]),
+                "difference": round(float(final[i] - ai[i]), 2),
+            }
+            for i in outliers[:max_outliers]
+        ],
+        "outlier_count": int(outliers.size),
+    }
@@ -1,17 +1,19 @@
-import os, json, datetime
+import os, json, time, datetime
+import hashlib
+import zipfile
+import functools
+import click
 from pathlib import Path
-from sqlalchemy import or_
+from sqlalchemy import or_, func, select
+from sqlalchemy.orm import selectinload, validates
 from auth import require_professor
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Blueprint, Response, request, jsonify, send_file, current_app, stream_with_context
 from extensions import db              # ✅ shared SQLAlchemy instance
 from dotenv import load_dotenv
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from openai import OpenAI
-from pypdf import PdfReader
-from docx import Document  # python-docx
-from flask_migrate import Migrate
 from filename_utils import parse_submission_filename  # Edit 12-3
+from extraction import extract_text, extract_many  # cached by file hash
 
 
 # =========================
@@ -23,37 +25,79 @@ DB_URL = os.getenv("DATABASE_URL", "sqlite:///virtualta.db")
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Point at a local fake/proxy server for testing, e.g. http://127.0.0.1:8080/v1
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# Frontends allowed by CORS (Netlify + local dev), comma-separated
+FRONTEND_ORIGINS = os.getenv("FRONTEND_ORIGINS", "https://virtualteacher.netlify.app")
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-
-app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = DB_URL
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
-app.config["MAX_CONTENT_LENGTH"] = 32 * 1024 * 1024  # 32MB
-
-# Enable CORS for your frontend (Netlify + local dev)
-CORS(
-    app,
-    supports_credentials=True,
-    origins=os.getenv(
-        "FRONTEND_ORIGINS",
-        "https://virtualteacher.netlify.app"
-    ).split(","),
-)
+# Every route and CLI command in this file hangs off this blueprint;
+# create_app() at the bottom builds the Flask app around it.
+bp = Blueprint("api", __name__, cli_group=None)
+
+# ✅ OpenAI client: pooled, one per process (rebuilt after fork), and
+# created on first use since the SDK alone takes ~0.6s to import.
+# Pool size, timeouts and retries come from OPENAI_* env vars (openai_client.py).
+from openai_client import bp as openai_client_bp, OpenAIClientManager
+
+openai_clients = OpenAIClientManager(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
-# ✅ initialize db with the app (using extensions.db)
-db.init_app(app)
 
-# ✅ ADD THIS LINE (required for flask db migrate/upgrade)
-migrate = Migrate(app, db)
+def get_client():
+    return openai_clients.get()
 
-# ✅ create OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
 
-# ✅ NOW import and register the blueprint (no circular import)
 from pins import bp as pins_bp
-app.register_blueprint(pins_bp)
+from models.submission_pin import SubmissionPin  # noqa: F401  (registers the table)
+
+from jobs import (
+    bp as jobs_bp, enqueue_job, run_worker, set_phase, PHASE_GRADING,
+    sse_event, job_events, event_stream_response, wants_event_stream,
+)
+
+from batch_grading import (
+    GradeResult, grade_batch, run_concurrently, add_usage, empty_usage, usage_cost, GRADING_MAX_IN_FLIGHT,
+)
+from multi_grading import GRADING_MULTI_MAX_CHARS, multi_enabled, pack, grade_multi
+from chunked_grading import (
+    rubric_system, GRADING_MODES, DEFAULT_GRADING_MODE, GRADING_CHUNK_TOKENS, CHUNKED_CHAR_BUDGET,
+    count_tokens, grade_chunked, summarize_chunks,
+)
+
+from rate_limit import bp as rate_limit_bp, get_limiter, estimate_tokens, retry_after_seconds
+
+from grading_cache import (
+    bp as grading_cache_bp, GRADING_CACHE_ENABLED, cached_grade, cache_key, lookup, store, record_bypass,
+)
+
+from storage import (
+    bp as storage_bp, StagedUpload, save_upload, stage_upload, store_staged, discard_staged,
+    release, recount,
+)
+
+from openai_batch import (
+    bp as openai_batch_bp, ITEM_FAILED, create_batches, advance_batches, wait_for_batches,
+    open_batch_submission_ids,
+)
+
+from similarity import (
+    SIMILARITY_THRESHOLD, SIMILARITY_CHAR_BUDGET, index_submission, forget as forget_signatures, similar_to, similar_pairs,
+    indexed_ids, stale_ids,
+)
+
+from analytics import GRADE_OUTLIER_POINTS, grade_score, grade_report
+from export import XLSX_MIMETYPE, xlsx_available, stream_rows, csv_chunks, xlsx_file
+from zip_import import ZIP_MAX_UPLOAD_BYTES, ZipLimitError, stage_archive
+from metrics import bp as metrics_bp, span, timed, record_tokens
+
+from schema import migrate_database, new_revision
+
+from pagination import (
+    PaginationError, page_args, parse_fields, defer_unrequested, keyset_page,
+    select_fields, page_response,
+)
+
+# How many times a 429 is waited out (per Retry-After) before giving up.
+OPENAI_RATE_LIMIT_RETRIES = int(os.getenv("OPENAI_RATE_LIMIT_RETRIES", "5"))
 
 
 # =========================
@@ -68,6 +112,8 @@ class Assignment(db.Model):
     owner_email = db.Column(db.String(255), nullable=True, index=True)
     rubric_id = db.Column(db.Integer, db.ForeignKey("rubric.id"), nullable=True)
     due_date = db.Column(db.DateTime, nullable=True)
+    # truncate | chunk | summarize (see grade_text); None = DEFAULT_GRADING_MODE
+    grading_mode = db.Column(db.String(20), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     submissions = db.relationship(
         "Submission",
@@ -76,6 +122,11 @@ class Assignment(db.Model):
         lazy=True,
     )
 
+    # keyset pagination of the (owner-filtered) list, newest first
+    __table_args__ = (
+        db.Index("ix_assignments_owner_created_id", "owner_email", "created_at", "id"),
+    )
+
 
 class Submission(db.Model):
     __tablename__ = "submissions"
@@ -86,7 +137,38 @@ class Submission(db.Model):
     ai_feedback = db.Column(db.Text)
     ai_grade = db.Column(db.String(20))
     final_grade = db.Column(db.String(20))
+    # grade_score() of the two grades above (None for "Pending" and the like)
+    ai_score = db.Column(db.Float, nullable=True)
+    final_score = db.Column(db.Float, nullable=True)
+    # sha256 of the rubric the AI grade was made against (None = never graded OK)
+    rubric_hash = db.Column(db.String(64), nullable=True)
+    # OpenAI tokens spent on the latest AI grade (0 when served from cache)
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    cached_tokens = db.Column(db.Integer, nullable=True)    # part of prompt_tokens billed as cached
+    completion_tokens = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    jobs = db.relationship(
+        "GradingJob",
+        backref="submission",
+        cascade="all, delete-orphan",
+        lazy=True,
+    )
+
+    __table_args__ = (
+        db.Index("ix_submissions_assignment_created_id", "assignment_id", "created_at", "id"),
+    )
+
+    @validates("ai_grade", "final_grade")
+    def _sync_score(self, key, value):
+        setattr(self, "ai_score" if key == "ai_grade" else "final_score", grade_score(value))
+        return value
+
+    def usage(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens or 0,
+            "cached_tokens": self.cached_tokens or 0,
+            "completion_tokens": self.completion_tokens or 0,
+        }
 
     def to_dict_short(self):
         return {
@@ -106,6 +188,13 @@ class Submission(db.Model):
             "ai_feedback": self.ai_feedback,
             "ai_grade": self.ai_grade,
             "final_grade": self.final_grade,
+            "ai_score": self.ai_score,
+            "final_score": self.final_score,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost_usd": round(usage_cost(self.usage()), 6),
+            "rubric_hash": self.rubric_hash,
             "created_at": self.created_at.isoformat(),
         }
 
@@ -115,10 +204,19 @@ class Rubric(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False, unique=True)
     body = db.Column(db.Text, nullable=False)  # the rubric text
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_rubric_created_id", "created_at", "id"),
+    )
 
-with app.app_context():
-    db.create_all()
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "body": self.body,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
 
 
 # =========================
@@ -131,13 +229,17 @@ def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def assignment_to_dict(a: Assignment):
+def assignment_to_dict(a: Assignment, include_submissions: bool = True,
+                       submission_count: int | None = None):
     """
     Safe serializer for Assignment. Uses the real rubric column and
     Submission.to_dict_short(), fixing the previous NameError.
+
+    With include_submissions=False the submissions relationship is never
+    touched; pass submission_count (e.g. from a grouped query) instead.
     """
     rubric_value = getattr(a, "rubric", None) or getattr(a, "rubric_text", None)
-    return {
+    out = {
         "id": a.id,
         "name": a.name,
         "rubric": rubric_value,
@@ -145,9 +247,27 @@ def assignment_to_dict(a: Assignment):
         "created_at": a.created_at.isoformat() if a.created_at else None,
         "due_date": a.due_date.isoformat() if a.due_date else None,
         "owner_email": getattr(a, "owner_email", None),
-        "submissions": [s.to_dict_short() for s in a.submissions],
-        "submission_count": len(a.submissions),
+        "grading_mode": grading_mode_for(a),
     }
+    if include_submissions:
+        out["submissions"] = [s.to_dict_short() for s in a.submissions]
+        out["submission_count"] = len(a.submissions)
+    else:
+        out["submission_count"] = submission_count if submission_count is not None else 0
+    return out
+
+
+# Names accepted by ?fields= on the list endpoints
+RUBRIC_FIELDS = ("id", "name", "body", "created_at")
+ASSIGNMENT_FIELDS = (
+    "id", "name", "rubric", "rubric_id", "created_at", "due_date", "owner_email",
+    "grading_mode", "submission_count", "submissions",
+)
+SUBMISSION_FIELDS = (
+    "id", "assignment_id", "student_name", "file_path", "ai_feedback", "ai_grade",
+    "final_grade", "ai_score", "final_score", "prompt_tokens", "cached_tokens", "completion_tokens",
+    "cost_usd", "rubric_hash", "created_at",
+)
 
 
 def infer_student_name(fname: str) -> str:
@@ -158,56 +278,6 @@ def infer_student_name(fname: str) -> str:
     return base
 
 
-def extract_text(file_path: str) -> str:
-    ext = file_path.rsplit(".", 1)[1].lower()
-    if ext == "txt":
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-    if ext == "pdf":
-        text = []
-        with open(file_path, "rb") as f:
-            reader = PdfReader(f)
-            for page in reader.pages:
-                text.append(page.extract_text() or "")
-        return "\n".join(text)
-    if ext == "docx":
-        doc = Document(file_path)
-        return "\n".join(p.text for p in doc.paragraphs)
-    return ""
-
-
-def extract_rubric_from_upload(file_storage):
-    """
-    Return plain text from an uploaded rubric file (PDF, DOCX, or TXT).
-    Expects a Werkzeug FileStorage object (request.files[...] item).
-    """
-    if not file_storage:
-        return ""
-
-    filename = (file_storage.filename or "").lower()
-    ext = os.path.splitext(filename)[1]
-
-    # PDF -> use PdfReader
-    if ext == ".pdf":
-        parts = []
-        reader = PdfReader(file_storage)
-        for page in reader.pages:
-            parts.append(page.extract_text() or "")
-        return "\n\n".join(parts).strip()
-
-    # DOCX/DOC -> python-docx
-    if ext in (".docx", ".doc"):
-        doc = Document(file_storage)
-        return "\n".join(p.text for p in doc.paragraphs).strip()
-
-    # Fallback -> treat as plain text
-    data = file_storage.read()
-    try:
-        return data.decode("utf-8").strip()
-    except UnicodeDecodeError:
-        return data.decode("latin-1", errors="ignore").strip()
-
-
 def get_request_email() -> str | None:
     """
     Get the current user's email.
@@ -227,50 +297,533 @@ def get_request_email() -> str | None:
 
     return None
 
-def grade_with_openai(submission_text: str, rubric_text: str) -> tuple[str, str]:
+class GradingError(Exception):
+    """Raised by request_grade when the model call or its JSON can't be used."""
+
+
+# Characters of a submission sent to the model. Extraction stops here too,
+# so the tail of a 100-page PDF is never parsed just to be thrown away.
+SUBMISSION_CHAR_BUDGET = int(os.getenv("SUBMISSION_CHAR_BUDGET", "12000"))
+
+# Bump whenever the prompt or output format changes so cached grades from
+# the old prompt stop matching.
+PROMPT_VERSION = "v2"
+
+# Send a prompt_cache_key derived from the system prefix so requests that
+# share a rubric are routed to the same provider-side prompt cache. Turn off
+# for OpenAI-compatible proxies that reject unknown parameters.
+OPENAI_PROMPT_CACHE_KEY = os.getenv("OPENAI_PROMPT_CACHE_KEY", "1") not in ("0", "false", "False")
+
+
+def chat_request(system: str, user: str) -> dict:
+    """chat.completions parameters for one JSON-mode grading call (also a Batch API line body)."""
+    params = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        "response_format": {"type": "json_object"},
+        "temperature": 0.2,
+    }
+    if OPENAI_PROMPT_CACHE_KEY:
+        params["prompt_cache_key"] = hashlib.sha256(system.encode("utf-8")).hexdigest()[:32]
+    return params
+
+
+def parse_chat_content(content) -> dict:
+    try:
+        data = json.loads(content)
+    except Exception as e:
+        raise GradingError(str(e)) from e
+    if not isinstance(data, dict):
+        raise GradingError("model did not return a JSON object")
+    return data
+
+
+def chat_json(system: str, user: str) -> tuple[dict, dict]:
     """
-    Returns (feedback, grade_str). On API/quota error, returns ("[AI error ...]", "Pending").
+    One JSON-mode chat completion, scheduled through the shared rate limiter.
+    Returns (parsed JSON object, usage dict). Raises GradingError on
+    API/quota/parse errors so callers that can retry (the job worker) know.
     """
     if not OPENAI_API_KEY:
-        return "[AI error or parse issue] Missing OPENAI_API_KEY", "Pending"
+        raise GradingError("Missing OPENAI_API_KEY")
 
-    system = (
-        "You are a fair, consistent teaching assistant. "
-        "Grade student work strictly by the rubric. Be constructive and specific."
-    )
+    from openai import RateLimitError
+
+    # Wait for shared RPM/TPM budget instead of firing and eating a 429
+    limiter = get_limiter(OPENAI_MODEL)
+    estimated = estimate_tokens(system, user)
+    for attempt in range(OPENAI_RATE_LIMIT_RETRIES + 1):
+        try:
+            limiter.acquire(estimated)
+            with span("openai_chat", model=OPENAI_MODEL):
+                resp = get_client().chat.completions.create(**chat_request(system, user))
+            break
+        except RateLimitError as e:
+            # insufficient_quota is also a 429 but waiting won't fix it
+            if getattr(e, "code", None) == "insufficient_quota" or attempt == OPENAI_RATE_LIMIT_RETRIES:
+                raise GradingError(str(e)) from e
+            limiter.penalize(retry_after_seconds(e))
+        except Exception as e:
+            # includes RateLimitTimeout when the budget never freed up and
+            # RateLimitBusy when the limiter state stayed locked
+            raise GradingError(str(e)) from e
+
+    usage = getattr(resp, "usage", None)
+    limiter.settle(estimated, getattr(usage, "total_tokens", None))
+    try:
+        content = resp.choices[0].message.content
+    except Exception as e:
+        raise GradingError(str(e)) from e
+    data = parse_chat_content(content)
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    usage = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+    record_tokens(usage)
+    return data, usage
 
-    user = f"""
-Rubric:
-\"\"\"{rubric_text}\"\"\"
 
+def _normalize_grade(value) -> str:
+    grade = str(value if value is not None else "")
+    if not grade or grade.lower() == "none":
+        return "Pending"
+    return grade
 
+
+def grading_prompt(submission_text: str, rubric_text: str) -> tuple[str, str]:
+    """(system, user) messages for grading one submission in a single call."""
+    user = f"""
 Student Submission (may be truncated):
-\"\"\"{submission_text[:12000]}\"\"\"
+\"\"\"{submission_text}\"\"\"
 
 Return a JSON object with:
 - "feedback": string with concrete, actionable comments
 - "grade": integer 0-100
 """
+    return rubric_system(rubric_text), user
+
+
+def _openai_grade(submission_text: str, rubric_text: str) -> tuple[str, str, dict]:
+    """Single-call grading of the text as given. Returns (feedback, grade, usage)."""
+    data, usage = chat_json(*grading_prompt(submission_text, rubric_text))
+    return str(data.get("feedback", "")).strip(), _normalize_grade(data.get("grade")), usage
+
+
+def grade_text(submission_text: str, rubric_text: str, mode: str = "truncate") -> tuple[str, str, dict]:
+    """
+    Grade in one of GRADING_MODES:
+      - truncate:  first SUBMISSION_CHAR_BUDGET characters, one call
+      - chunk:     grade token-sized chunks in parallel, then merge
+      - summarize: summarize chunks in parallel, then grade the summaries
+    Texts that fit in one chunk are graded whole in a single call.
+    Returns (feedback, grade, usage summed over every call).
+    """
+    if mode == "truncate":
+        return _openai_grade(submission_text[:SUBMISSION_CHAR_BUDGET], rubric_text)
+    if count_tokens(submission_text, OPENAI_MODEL) <= GRADING_CHUNK_TOKENS:
+        return _openai_grade(submission_text, rubric_text)
+
     try:
-        resp = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": user},
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.2,
-        )
-        content = resp.choices[0].message.content
-        data = json.loads(content)
-        feedback = str(data.get("feedback", "")).strip()
-        grade = str(data.get("grade", ""))
-        if not grade or grade.lower() == "none":
-            grade = "Pending"
-        return feedback, grade
-    except Exception as e:
-        # e.g., 429 insufficient_quota; keep app usable
-        return f"[AI error or parse issue] {e}", "Pending"
+        if mode == "chunk":
+            feedback, grade, usage = grade_chunked(chat_json, submission_text, rubric_text, OPENAI_MODEL)
+            return feedback, _normalize_grade(grade), usage
+        summary, usage = summarize_chunks(chat_json, submission_text, OPENAI_MODEL)
+    except RuntimeError as e:
+        raise GradingError(str(e)) from e
+    feedback, grade, grade_usage = _openai_grade(summary, rubric_text)
+    return feedback, grade, add_usage(usage, grade_usage)
+
+
+def request_grade(submission_text: str, rubric_text: str, mode: str = "truncate",
+                  force: bool = False) -> tuple[str, str, dict]:
+    """
+    Grade through the content-hash cache: identical text + rubric + model +
+    prompt version + mode returns the stored result without an OpenAI call
+    (usage is then zero). force=True skips the lookup. Raises GradingError.
+    """
+    return cached_grade(
+        functools.partial(grade_text, mode=mode), submission_text, rubric_text,
+        model=OPENAI_MODEL, prompt_version=prompt_version_for(mode), force=force,
+    )
+
+
+def prompt_version_for(mode: str) -> str:
+    """Grading cache prompt version: chunked modes also depend on the chunk size."""
+    return PROMPT_VERSION if mode == "truncate" else f"{PROMPT_VERSION}:{mode}:{GRADING_CHUNK_TOKENS}"
+
+
+def grade_with_openai(submission_text: str, rubric_text: str, mode: str = "truncate") -> tuple[str, str, dict]:
+    """
+    Returns (feedback, grade_str, usage). On API/quota error, returns ("[AI error ...]", "Pending", zero usage).
+    """
+    with span("grade_with_openai", mode=mode) as info:
+        try:
+            feedback, grade, usage = request_grade(submission_text, rubric_text, mode=mode)
+        except GradingError as e:
+            # e.g., 429 insufficient_quota; keep app usable
+            info["error"] = type(e).__name__
+            return f"[AI error or parse issue] {e}", "Pending", empty_usage()
+        info.update(prompt_tokens=usage.get("prompt_tokens", 0),
+                    completion_tokens=usage.get("completion_tokens", 0))
+        return feedback, grade, usage
+
+
+@timed("grade_items")
+def grade_items(items, force: bool = False) -> list[GradeResult]:
+    """
+    grade_batch(items, request_grade) for (text, rubric, mode) items.
+
+    With GRADING_SUBMISSIONS_PER_REQUEST > 1, short truncate-mode items that
+    miss the cache are first graded several per request (grouped by rubric,
+    so every request starts with the same system prefix). Anything the model
+    leaves out of its answer is then graded one by one as usual.
+    """
+    grade_fn = functools.partial(request_grade, force=force)
+    if not multi_enabled():
+        return grade_batch(items, grade_fn)
+
+    results = [None] * len(items)
+    entries, keys = [], {}   # packable cache misses; str(index) -> cache key
+    for i, (text, rubric_text, mode) in enumerate(items):
+        if mode != "truncate" or len(text) > GRADING_MULTI_MAX_CHARS:
+            continue
+        key = cache_key(text, rubric_text, OPENAI_MODEL, PROMPT_VERSION)
+        hit = None
+        if GRADING_CACHE_ENABLED:
+            if force:
+                record_bypass()
+            else:
+                hit = lookup(key)
+        if hit is not None:
+            results[i] = GradeResult(index=i, feedback=hit[0], grade=hit[1])
+        else:
+            entries.append((str(i), rubric_text, text))
+            keys[str(i)] = key
+
+    def timed_multi(rubric_text, group):
+        started = time.monotonic()
+        answers, unanswered = grade_multi(chat_json, rubric_text, group)
+        # stored from the worker thread, whose session run_concurrently commits
+        for k, (feedback, grade, _) in answers.items():
+            if GRADING_CACHE_ENABLED and _normalize_grade(grade) != "Pending":
+                store(keys[k], OPENAI_MODEL, PROMPT_VERSION, feedback, _normalize_grade(grade))
+        return answers, unanswered, time.monotonic() - started
+
+    spent = {}   # str(index) -> usage share of a request that didn't answer it
+    for value, error in run_concurrently(timed_multi, pack(entries)):
+        if error is not None:
+            continue   # whole request failed: its members are graded singly below
+        answers, unanswered, seconds = value
+        spent.update(unanswered)
+        for k, (feedback, grade, usage) in answers.items():
+            i = int(k)
+            grade = _normalize_grade(grade)
+            results[i] = GradeResult(index=i, feedback=feedback, grade=grade, usage=usage, seconds=seconds)
+
+    def grade_single(i, text, rubric_text, mode):
+        # packable items were already looked up above; don't count a second miss
+        if str(i) in keys:
+            feedback, grade, usage = grade_text(text, rubric_text, mode)
+            if GRADING_CACHE_ENABLED and grade != "Pending":
+                store(keys[str(i)], OPENAI_MODEL, PROMPT_VERSION, feedback, grade)
+            return feedback, grade, usage
+        return grade_fn(text, rubric_text, mode)
+
+    rest = [i for i, r in enumerate(results) if r is None]
+    for i, result in zip(rest, grade_batch([(i, *items[i]) for i in rest], grade_single)):
+        result.index = i
+        if str(i) in spent:
+            result.usage = add_usage(result.usage or empty_usage(), spent[str(i)])
+        results[i] = result
+    return results
+
+
+def rubric_text_for(a: Assignment) -> str:
+    return a.rubric or (Rubric.query.get(a.rubric_id).body if a.rubric_id else "")
+
+
+def grading_mode_for(a: Assignment) -> str:
+    return a.grading_mode or DEFAULT_GRADING_MODE
+
+
+def char_budget_for(mode: str) -> int:
+    return SUBMISSION_CHAR_BUDGET if mode == "truncate" else CHUNKED_CHAR_BUDGET
+
+
+def index_for_similarity(subs) -> tuple[int, int]:
+    """
+    (Re)build the similarity signatures of submissions, in the caller's
+    transaction, from up to SIMILARITY_CHAR_BUDGET characters of their text
+    whatever their grading mode truncates to. Texts come through the text
+    store, so files already extracted whole are not parsed again. Returns
+    (signatures written, extraction failures).
+    """
+    indexed = failed = 0
+    for s, (text, error) in zip(subs, extract_many([s.file_path for s in subs], max_chars=SIMILARITY_CHAR_BUDGET)):
+        if error is not None:
+            failed += 1
+            continue
+        indexed += index_submission(s.id, s.assignment_id, text)
+    return indexed, failed
+
+
+def extract_for_grading(subs) -> list[tuple[str | None, str | None]]:
+    """
+    extract_many for submissions that may belong to assignments with
+    different grading modes, each read up to its mode's character budget.
+    """
+    results = [None] * len(subs)
+    by_budget = {}
+    for i, s in enumerate(subs):
+        by_budget.setdefault(char_budget_for(grading_mode_for(s.assignment)), []).append(i)
+    for budget, idxs in by_budget.items():
+        for i, res in zip(idxs, extract_many([subs[i].file_path for i in idxs], max_chars=budget)):
+            results[i] = res
+    return results
+
+
+def rubric_fingerprint(rubric_text: str | None) -> str:
+    """sha256 of the rubric a submission was graded against (see Submission.rubric_hash)."""
+    return hashlib.sha256((rubric_text or "").strip().encode("utf-8")).hexdigest()
+
+
+def apply_grade(s: Submission, feedback: str, grade: str, usage: dict | None,
+                rubric_text: str | None = None) -> None:
+    """
+    Store an AI grade. rubric_text is the rubric it was graded against; a
+    failed ("Pending") grade clears the fingerprint so a regrade picks it up.
+    """
+    s.ai_feedback = feedback
+    s.ai_grade = grade
+    s.prompt_tokens = (usage or {}).get("prompt_tokens", 0)
+    s.cached_tokens = (usage or {}).get("cached_tokens", 0)
+    s.completion_tokens = (usage or {}).get("completion_tokens", 0)
+    graded = rubric_text is not None and grade != "Pending"
+    s.rubric_hash = rubric_fingerprint(rubric_text) if graded else None
+
+
+# =========================
+# Grading worker
+# =========================
+def process_grading_jobs(jobs) -> list[str | None]:
+    """
+    Extract + grade a batch of queued submissions, OpenAI calls running
+    concurrently. Returns one entry per job: None on success, else the error.
+    """
+    errors: list[str | None] = [None] * len(jobs)
+    found = []   # (job index, submission)
+    for i, job in enumerate(jobs):
+        s = db.session.get(Submission, job.submission_id)
+        if s is not None:
+            found.append((i, s))
+
+    # Parse every file of the batch in the extractor process pool
+    texts = extract_for_grading([s for _, s in found])
+
+    items, slots, subs, rubrics = [], [], [], []
+    for (i, s), (sub_text, error) in zip(found, texts):
+        if error is not None:
+            errors[i] = f"text extraction failed: {error}"
+            continue
+        rubric_text = rubric_text_for(s.assignment)
+        items.append((sub_text, rubric_text or "No rubric provided", grading_mode_for(s.assignment)))
+        slots.append(i)
+        subs.append(s)
+        rubrics.append(rubric_text)
+
+    index_for_similarity(subs)
+    # signatures go in now: no write transaction stays open while grading
+    db.session.commit()
+    set_phase([jobs[i].id for i in slots], PHASE_GRADING)
+    for i, s, rubric_text, result in zip(slots, subs, rubrics, grade_items(items)):
+        if not result.ok:
+            errors[i] = result.error
+            continue
+        apply_grade(s, result.feedback, result.grade, result.usage, rubric_text)
+    return errors
+
+
+def submit_grading_batch(a: Assignment, subs, raw_rubric: str, force: bool = False) -> dict:
+    """
+    Grade submissions of one assignment through the OpenAI Batch API instead
+    of one synchronous call each. Grading cache hits are applied at once,
+    texts that need several calls in the assignment's grading mode go to
+    the job queue, and the rest are recorded as batches for
+    advance_batches() (run by grade-worker) to submit, poll and ingest.
+    Submissions already waiting on a batch are left alone. Commits.
+    """
+    waiting = open_batch_submission_ids(s.id for s in subs)
+    subs = [s for s in subs if s.id not in waiting]
+    mode = grading_mode_for(a)
+    rubric_text = raw_rubric or "No rubric provided"
+    fingerprint = rubric_fingerprint(raw_rubric)
+
+    requests, errors, jobs, cached = [], {}, [], 0
+    texts = extract_many([s.file_path for s in subs], max_chars=char_budget_for(mode))
+    for s, (sub_text, error) in zip(subs, texts):
+        if error is not None:
+            errors[s.id] = f"text extraction failed: {error}"
+            continue
+        if mode != "truncate" and count_tokens(sub_text, OPENAI_MODEL) > GRADING_CHUNK_TOKENS:
+            jobs.append(enqueue_job(s.id, a.id))
+            continue
+        key = cache_key(sub_text, rubric_text, OPENAI_MODEL, prompt_version_for(mode))
+        if GRADING_CACHE_ENABLED and force:
+            record_bypass()
+        elif GRADING_CACHE_ENABLED:
+            hit = lookup(key)
+            if hit is not None:
+                apply_grade(s, hit[0], hit[1], empty_usage(), raw_rubric)
+                cached += 1
+                continue
+        if mode == "truncate":
+            sub_text = sub_text[:SUBMISSION_CHAR_BUDGET]
+        requests.append({
+            "submission_id": s.id,
+            "body": chat_request(*grading_prompt(sub_text, rubric_text)),
+            "rubric_hash": fingerprint,
+            "cache_key": key,
+        })
+
+    batches = create_batches(requests, assignment_id=a.id)
+    return {
+        "batched": len(requests),
+        "batch_ids": [b.id for b in batches],
+        "cached": cached,
+        "job_ids": [j.id for j in jobs],
+        "already_batched": len(waiting),
+        "errors": errors,
+        "status": "batched",
+    }
+
+
+def apply_batch_result(item, content: str | None, usage: dict | None, error: str | None):
+    """
+    advance_batches() callback: store one Batch API result on its submission.
+    Requests that failed or came back unparseable are queued for the
+    worker to grade synchronously.
+    """
+    s = db.session.get(Submission, item.submission_id)
+    if s is None:
+        return   # deleted while the batch ran
+    data = None
+    if error is None:
+        try:
+            data = parse_chat_content(content)
+        except GradingError as e:
+            item.status, item.error = ITEM_FAILED, str(e)
+    if data is None:
+        enqueue_job(s.id, s.assignment_id)
+        return
+
+    feedback = str(data.get("feedback", "")).strip()
+    grade = _normalize_grade(data.get("grade"))
+    apply_grade(s, feedback, grade, usage)
+    s.rubric_hash = item.rubric_hash if grade != "Pending" else None
+    if GRADING_CACHE_ENABLED and grade != "Pending" and item.cache_key:
+        store(item.cache_key, OPENAI_MODEL, prompt_version_for(grading_mode_for(s.assignment)), feedback, grade)
+
+
+def advance_openai_batches():
+    return advance_batches(get_client(), apply_batch_result, logger=current_app.logger)
+
+
+def record_grading_failure(job, error: str):
+    """Out of retries: store the error the same way inline grading used to."""
+    s = db.session.get(Submission, job.submission_id)
+    if s is not None:
+        apply_grade(s, f"[AI error or parse issue] {error}", "Pending", None)
+
+
+@bp.cli.command("grade-worker")
+@click.option("--poll-interval", default=2.0, show_default=True, help="Seconds to sleep when the queue is empty.")
+@click.option("--batch-size", default=GRADING_MAX_IN_FLIGHT, show_default=True, help="Jobs claimed and graded concurrently.")
+@click.option("--once", is_flag=True, help="Drain runnable jobs and exit instead of polling forever.")
+def grade_worker(poll_interval, batch_size, once):
+    """Run the background grading worker (flask --app app grade-worker)."""
+    n = run_worker(
+        process_grading_jobs,
+        on_give_up=record_grading_failure,
+        batch_size=batch_size,
+        poll_interval=poll_interval,
+        once=once,
+        logger=current_app.logger,
+        on_tick=advance_openai_batches,
+    )
+    click.echo(f"processed {n} job(s)")
+
+
+@bp.cli.command("batch-grade")
+@click.argument("assignment_id", type=int)
+@click.option("--all", "regrade_all", is_flag=True, help="Every submission, not only ungraded/stale ones.")
+@click.option("--force", is_flag=True, help="Include finalized submissions and skip the grading cache.")
+def batch_grade(assignment_id, regrade_all, force):
+    """Grade an assignment through the OpenAI Batch API (grade-worker ingests the results)."""
+    a = db.session.get(Assignment, assignment_id)
+    if a is None:
+        raise click.ClickException("assignment not found")
+    raw_rubric = rubric_text_for(a)
+    subs, summary = select_for_regrade(a, raw_rubric, regrade_all, force)
+    summary.update(submit_grading_batch(a, subs, raw_rubric, force=force))
+    click.echo(json.dumps(summary))
+
+
+@bp.cli.command("batch-poll")
+@click.option("--wait", is_flag=True, help="Keep polling until every batch is ingested.")
+@click.option("--poll-interval", default=None, type=float, help="Seconds between status checks of one batch.")
+def batch_poll(wait, poll_interval):
+    """Submit, poll and ingest unfinished OpenAI batches once (or until done with --wait)."""
+    if wait:
+        n = wait_for_batches(get_client(), apply_batch_result, poll_seconds=poll_interval, logger=current_app.logger)
+    else:
+        n = advance_batches(get_client(), apply_batch_result, poll_seconds=poll_interval, logger=current_app.logger)
+    click.echo(f"ingested {n} batch(es)")
+
+
+@bp.cli.command("similarity-index")
+@click.option("--assignment", "assignment_id", type=int, default=None, help="Only this assignment.")
+@click.option("--batch-size", default=50, show_default=True, help="Submissions extracted and committed at a time.")
+def similarity_index(assignment_id, batch_size):
+    """Build missing or outdated similarity signatures (new uploads get theirs when graded)."""
+    q = db.session.query(Submission.id).order_by(Submission.id)
+    if assignment_id is not None:
+        q = q.filter(Submission.assignment_id == assignment_id)
+    todo = stale_ids(sid for (sid,) in q)
+    indexed = failed = 0
+    for start in range(0, len(todo), batch_size):
+        subs = [db.session.get(Submission, sid) for sid in todo[start:start + batch_size]]
+        done, errors = index_for_similarity(subs)
+        indexed, failed = indexed + done, failed + errors
+        db.session.commit()
+    click.echo(f"indexed {indexed} submission(s), {failed} failed extraction")
+
+
+@bp.cli.command("init-db")
+def init_db():
+    """Create the schema on a fresh database, else apply pending migrations."""
+    click.echo(f"database {migrate_database()}")
+
+
+@bp.cli.command("db-revision")
+@click.option("-m", "--message", required=True, help="what the revision changes")
+@click.option("--empty", is_flag=True, help="write an empty revision instead of autogenerating one")
+def db_revision(message, empty):
+    """Write a migration for model changes (run init-db first so the database is at head)."""
+    click.echo(f"created {new_revision(message, autogenerate=not empty)}")
+
+
+@bp.cli.command("storage-gc")
+def storage_gc():
+    """Recount stored-upload references from submissions and delete orphans."""
+    paths = [p for (p,) in db.session.query(Submission.file_path)]
+    result = recount(paths)
+    click.echo(f"fixed {result['fixed']} refcount(s), removed {result['removed']} orphaned object(s)")
 
 
 # =========================
@@ -278,19 +831,33 @@ Return a JSON object with:
 # =========================
 
 # Health
-@app.get("/api/health")
+@bp.get("/api/health")
 def health():
     return jsonify({"ok": True, "time": datetime.datetime.utcnow().isoformat()})
 
 
 # ----- Rubrics -----
-@app.get("/api/rubrics")
+@bp.get("/api/rubrics")
 def list_rubrics():
-    items = Rubric.query.order_by(Rubric.name.asc()).all()
-    return jsonify([{"id": r.id, "name": r.name, "body": r.body} for r in items])
-
-
-@app.post("/api/rubrics")
+    """
+    All rubrics by name, or with ?limit=/&cursor= one page (newest first)
+    wrapped as {"items", "next_cursor", "limit"}. ?fields=id,name skips
+    loading the rubric bodies.
+    """
+    try:
+        limit, cursor = page_args()
+        fields = parse_fields(RUBRIC_FIELDS)
+        q = defer_unrequested(Rubric.query, fields, {"body": Rubric.body})
+        if limit is None:
+            items = q.order_by(Rubric.name.asc()).all()
+            return jsonify([select_fields(r.to_dict(), fields) for r in items])
+        items, next_cursor = keyset_page(q, Rubric, limit, cursor)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page_response([select_fields(r.to_dict(), fields) for r in items], next_cursor, limit))
+
+
+@bp.post("/api/rubrics")
 def create_rubric():
     data = request.get_json(force=True)
     name = (data or {}).get("name")
@@ -303,7 +870,7 @@ def create_rubric():
     return jsonify({"id": r.id, "name": r.name}), 201
 
 
-@app.delete("/api/rubrics/<int:rid>")
+@bp.delete("/api/rubrics/<int:rid>")
 def delete_rubric(rid):
     r = Rubric.query.get(rid)
     if not r:
@@ -318,28 +885,69 @@ def delete_rubric(rid):
 
 
 # ----- Assignments -----
-@app.get("/api/assignments")
+def visible_assignments(email: str | None):
+    """Filter for the assignments a user sees in lists (theirs + unowned ones)."""
+    if email:
+        # Logged-in user: see assignments you own + any “global” ones
+        return or_(
+            Assignment.owner_email == email,
+            Assignment.owner_email.is_(None),
+        )
+    # Not logged in: only see “global” assignments (no owner)
+    return Assignment.owner_email.is_(None)
+
+
+@bp.get("/api/assignments")
 def get_assignments():
     email = get_request_email()
 
-    q = Assignment.query
+    q = Assignment.query.filter(visible_assignments(email))
 
-    if email:
-        # Logged-in user: see assignments you own + any “global” ones
-        q = q.filter(
-            or_(
-                Assignment.owner_email == email,
-                Assignment.owner_email.is_(None),
+    # ?include=submissions adds the per-submission list (one extra SELECT
+    # ... IN for all assignments); otherwise only counts, via one GROUP BY.
+    include = {p.strip() for p in (request.args.get("include") or "").split(",") if p.strip()}
+    with_submissions = "submissions" in include
+    try:
+        limit, cursor = page_args()
+        fields = parse_fields(ASSIGNMENT_FIELDS)
+        if fields is not None and with_submissions:
+            fields.add("submissions")
+        q = defer_unrequested(q, fields, {"rubric": Assignment.rubric})
+        if with_submissions:
+            q = q.options(
+                selectinload(Assignment.submissions).load_only(
+                    Submission.id, Submission.assignment_id, Submission.student_name,
+                    Submission.ai_grade, Submission.final_grade, Submission.created_at,
+                )
             )
-        )
-    else:
-        # Not logged in: only see “global” assignments (no owner)
-        q = q.filter(Assignment.owner_email.is_(None))
+        if limit is None:
+            items, next_cursor = q.order_by(Assignment.created_at.desc(), Assignment.id.desc()).all(), None
+        else:
+            items, next_cursor = keyset_page(q, Assignment, limit, cursor)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
 
-    items = q.order_by(Assignment.created_at.desc()).all()
-    return jsonify([assignment_to_dict(a) for a in items])
+    if with_submissions:
+        out = [select_fields(assignment_to_dict(a), fields) for a in items]
+    else:
+        counts = dict(
+            db.session.query(Submission.assignment_id, func.count(Submission.id))
+            .filter(Submission.assignment_id.in_([a.id for a in items]))
+            .group_by(Submission.assignment_id)
+            .all()
+        ) if items else {}
+        out = [
+            select_fields(
+                assignment_to_dict(a, include_submissions=False, submission_count=counts.get(a.id, 0)),
+                fields,
+            )
+            for a in items
+        ]
+    if limit is None:
+        return jsonify(out)
+    return jsonify(page_response(out, next_cursor, limit))
 
-@app.post("/api/assignments")
+@bp.post("/api/assignments")
 def create_assignment():
     """
     Create a new assignment.
@@ -361,6 +969,7 @@ def create_assignment():
     rubric_text = (src.get("rubric") or "") or None
     rubric_id = src.get("rubric_id")
     due_date_str = src.get("due_date")
+    grading_mode = (src.get("grading_mode") or "").strip() or None
 
     if not name or (not rubric_text and not rubric_id):
         return (
@@ -370,6 +979,9 @@ def create_assignment():
             400,
         )
 
+    if grading_mode and grading_mode not in GRADING_MODES:
+        return jsonify({"error": f"grading_mode must be one of {', '.join(GRADING_MODES)}"}), 400
+
     # 1) Try Netlify Identity header/cookie
     owner_email = get_request_email()
 
@@ -395,13 +1007,14 @@ def create_assignment():
         rubric_id=rubric_id,
         due_date=due_date,
         owner_email=owner_email or None,  # None = global assignment
+        grading_mode=grading_mode,
     )
 
     db.session.add(a)
     db.session.commit()
     return jsonify(assignment_to_dict(a)), 201
 
-@app.get("/api/assignments/<int:aid>")
+@bp.get("/api/assignments/<int:aid>")
 def get_assignment(aid):
     try:
         # Prefer session.get (SQLAlchemy 2.x) but fallback to query.get if needed
@@ -419,10 +1032,10 @@ def get_assignment(aid):
             "rubric": rubric_value
         })
     except Exception as e:
-        app.logger.exception("GET /api/assignments/%s failed", aid)
+        current_app.logger.exception("GET /api/assignments/%s failed", aid)
         return jsonify({"error": "internal", "detail": str(e)}), 500
 
-@app.get("/api/whoami")
+@bp.get("/api/whoami")
 def whoami():
     """Debug: see what email the backend thinks you are."""
     from pprint import pformat
@@ -431,7 +1044,7 @@ def whoami():
         "headers_seen": dict(request.headers),
     })
 
-@app.patch("/api/assignments/<int:aid>")
+@bp.patch("/api/assignments/<int:aid>")
 def update_assignment(aid):
     a = Assignment.query.get(aid)
     if not a:
@@ -443,6 +1056,11 @@ def update_assignment(aid):
         a.rubric = (data["rubric"] or "").strip()
     if "rubric_id" in data:
         a.rubric_id = int(data["rubric_id"]) if data["rubric_id"] is not None else None
+    if "grading_mode" in data:
+        mode = (data["grading_mode"] or "").strip() or None
+        if mode and mode not in GRADING_MODES:
+            return jsonify({"error": f"grading_mode must be one of {', '.join(GRADING_MODES)}"}), 400
+        a.grading_mode = mode
 
     # due_date handling
     if "due_date" in data:
@@ -463,18 +1081,325 @@ def update_assignment(aid):
     return jsonify({"ok": True})
 
 
-@app.delete("/api/assignments/<int:aid>")
+def _flag(data: dict, name: str) -> bool:
+    """Boolean option from the JSON body or the query string."""
+    return str(data.get(name, request.args.get(name, ""))).lower() in ("1", "true", "yes")
+
+
+def select_for_regrade(a: Assignment, raw_rubric: str, regrade_all: bool = False,
+                       force: bool = False) -> tuple[list, dict]:
+    """
+    Submissions of a to regrade: those not graded against raw_rubric (or
+    all with regrade_all), skipping finalized ones unless force. Returns
+    (submissions, summary counts).
+    """
+    current = rubric_fingerprint(raw_rubric)
+    subs, unchanged, finalized = [], 0, 0
+    for s in a.submissions:
+        if s.final_grade and not force:
+            finalized += 1
+        elif not regrade_all and s.rubric_hash == current:
+            unchanged += 1
+        else:
+            subs.append(s)
+    return subs, {"selected": len(subs), "unchanged": unchanged, "skipped_finalized": finalized}
+
+
+@bp.post("/api/assignments/<int:aid>/regrade")
+def regrade_assignment(aid):
+    """
+    Re-run AI grading for the submissions that were graded against a
+    different rubric than the assignment's current one (Assignment.rubric
+    or the linked Rubric.body), or never successfully graded. OpenAI calls
+    run concurrently (GRADING_MAX_IN_FLIGHT). Per-submission failures are
+    reported without aborting the rest.
+
+    Optional JSON/query flags:
+      - "all": regrade every submission, not only the stale ones
+      - "force": also regrade submissions that already have a final_grade,
+        and bypass the grading cache
+      - "queue": enqueue grading jobs for the worker and return 202 with
+        job_ids instead of grading inside the request
+      - "batch": send them through the OpenAI Batch API (cheaper, results
+        within the completion window) and return 202 with batch_ids
+    """
+    a = db.session.get(Assignment, aid)
+    if not a:
+        return jsonify({"error": "assignment not found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    force = _flag(data, "force")
+    raw_rubric = rubric_text_for(a)
+    subs, summary = select_for_regrade(a, raw_rubric, _flag(data, "all"), force)
+
+    if _flag(data, "queue"):
+        jobs = [enqueue_job(s.id, a.id) for s in subs]
+        db.session.commit()
+        return jsonify({**summary, "job_ids": [j.id for j in jobs], "status": "queued"}), 202
+    if _flag(data, "batch"):
+        return jsonify({**summary, **submit_grading_batch(a, subs, raw_rubric, force=force)}), 202
+
+    mode = grading_mode_for(a)
+    rubric_text = raw_rubric or "No rubric provided"
+    errors = {}
+    regraded = 0
+    pairs, graded = [], []
+    texts = extract_many([s.file_path for s in subs], max_chars=char_budget_for(mode))
+    for s, (sub_text, error) in zip(subs, texts):
+        if error is not None:
+            errors[s.id] = f"text extraction failed: {error}"
+            continue
+        pairs.append((sub_text, rubric_text, mode))
+        graded.append(s)
+    index_for_similarity(graded)
+    # signatures go in now: no write transaction stays open while grading
+    db.session.commit()
+
+    for s, result in zip(graded, grade_items(pairs, force=force)):
+        if result.ok:
+            apply_grade(s, result.feedback, result.grade, result.usage, raw_rubric)
+            regraded += 1
+        else:
+            errors[s.id] = result.error
+            apply_grade(s, f"[AI error or parse issue] {result.error}", "Pending", None)
+
+    db.session.commit()
+    return jsonify({**summary, "regraded": regraded, "errors": errors})
+
+
+@bp.get("/api/assignments/<int:aid>/usage")
+def assignment_usage(aid):
+    """
+    OpenAI tokens and cost of the current AI grades of an assignment, to
+    check what prompt caching and multi-submission grading save.
+    cached_ratio is the share of prompt tokens served from the provider's
+    prompt cache.
+    """
+    if not db.session.get(Assignment, aid):
+        return jsonify({"error": "assignment not found"}), 404
+    n, graded, prompt, cached, completion = db.session.query(
+        func.count(Submission.id),
+        func.count(Submission.rubric_hash),
+        func.coalesce(func.sum(Submission.prompt_tokens), 0),
+        func.coalesce(func.sum(Submission.cached_tokens), 0),
+        func.coalesce(func.sum(Submission.completion_tokens), 0),
+    ).filter(Submission.assignment_id == aid).one()
+    usage = {"prompt_tokens": int(prompt), "cached_tokens": int(cached), "completion_tokens": int(completion)}
+    cost = usage_cost(usage)
+    return jsonify({
+        "assignment_id": aid,
+        "submissions": n,
+        "graded": graded,
+        **usage,
+        "cached_ratio": round(usage["cached_tokens"] / usage["prompt_tokens"], 4) if usage["prompt_tokens"] else 0.0,
+        "cost_usd": round(cost, 6),
+        "cost_per_graded_usd": round(cost / graded, 6) if graded else 0.0,
+        "prompt_tokens_per_graded": round(usage["prompt_tokens"] / graded, 1) if graded else 0.0,
+    })
+
+
+def _similarity_args():
+    """(threshold, limit, error) from ?threshold= (0-1) and ?limit= (1-100)."""
+    try:
+        threshold = float(request.args.get("threshold", SIMILARITY_THRESHOLD))
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return None, None, "threshold must be a number and limit an integer"
+    if not 0 <= threshold <= 1 or not 1 <= limit <= 100:
+        return None, None, "threshold must be between 0 and 1 and limit between 1 and 100"
+    return threshold, limit, None
+
+
+@bp.get("/api/assignments/<int:aid>/similarity")
+def assignment_similarity(aid):
+    """
+    Pairs of this assignment's submissions whose texts look alike
+    (estimated Jaccard similarity of 5-word shingles at or above
+    ?threshold=, default SIMILARITY_THRESHOLD), most similar first. Only
+    indexed submissions take part; "unindexed" counts the rest (not graded
+    yet, or waiting for `flask similarity-index`).
+    """
+    if not db.session.get(Assignment, aid):
+        return jsonify({"error": "assignment not found"}), 404
+    threshold, _, error = _similarity_args()
+    if error:
+        return jsonify({"error": error}), 400
+    names = dict(db.session.query(Submission.id, Submission.student_name).filter(Submission.assignment_id == aid))
+    indexed = indexed_ids(aid) & names.keys()
+    pairs = [
+        {
+            "submission_ids": [x, y],
+            "student_names": [names[x], names[y]],
+            "similarity": round(score, 3),
+        }
+        for x, y, score in similar_pairs(aid, threshold)
+        if x in names and y in names
+    ]
+    return jsonify({
+        "assignment_id": aid,
+        "threshold": threshold,
+        "submissions": len(names),
+        "indexed": len(indexed),
+        "unindexed": len(names) - len(indexed),
+        "pairs": pairs,
+    })
+
+
+def _outlier_points_arg():
+    """(points, error) from ?outlier_points= (default GRADE_OUTLIER_POINTS)."""
+    try:
+        points = float(request.args.get("outlier_points", GRADE_OUTLIER_POINTS))
+    except ValueError:
+        return None, "outlier_points must be a number"
+    if points <= 0:
+        return None, "outlier_points must be positive"
+    return points, None
+
+
+def _score_rows(*criteria):
+    """(id, student_name, ai_score, final_score) of matching submissions, one query."""
+    return db.session.query(
+        Submission.id, Submission.student_name, Submission.ai_score, Submission.final_score,
+    ).join(Assignment, Assignment.id == Submission.assignment_id).filter(*criteria).all()
+
+
+@bp.get("/api/assignments/<int:aid>/analytics")
+def assignment_analytics(aid):
+    """
+    Grade statistics of one assignment: mean/median/stddev/quartiles of
+    the AI, final and effective (final, else AI) scores, a 0-100
+    histogram of effective scores, AI-vs-final agreement, and the
+    submissions whose final grade diverges from the AI grade by
+    ?outlier_points= or more (or is a statistical outlier).
+    """
+    if not db.session.get(Assignment, aid):
+        return jsonify({"error": "assignment not found"}), 404
+    points, error = _outlier_points_arg()
+    if error:
+        return jsonify({"error": error}), 400
+    rows = _score_rows(Submission.assignment_id == aid)
+    return jsonify({"assignment_id": aid, **grade_report(rows, points)})
+
+
+@bp.get("/api/analytics")
+def owner_analytics():
+    """
+    The statistics of /api/assignments/<id>/analytics over every
+    submission of the assignments the caller sees in /api/assignments,
+    plus per-assignment counts and averages aggregated in SQL.
+    """
+    points, error = _outlier_points_arg()
+    if error:
+        return jsonify({"error": error}), 400
+    visible = visible_assignments(get_request_email())
+    effective = func.coalesce(Submission.final_score, Submission.ai_score)
+    per_assignment = db.session.query(
+        Assignment.id, Assignment.name,
+        func.count(Submission.id), func.count(effective),
+        func.avg(Submission.ai_score), func.avg(Submission.final_score),
+        func.avg(effective), func.min(effective), func.max(effective),
+    ).outerjoin(Submission, Submission.assignment_id == Assignment.id).filter(visible).group_by(
+        Assignment.id, Assignment.name,
+    ).order_by(Assignment.id).all()
+
+    def rounded(value):
+        return round(float(value), 2) if value is not None else None
+
+    return jsonify({
+        **grade_report(_score_rows(visible), points),
+        "assignments": [
+            {
+                "assignment_id": aid, "name": name, "submissions": n, "graded": graded,
+                "mean_ai": rounded(mean_ai), "mean_final": rounded(mean_final),
+                "mean_effective": rounded(mean_eff), "min_effective": rounded(low),
+                "max_effective": rounded(high),
+            }
+            for aid, name, n, graded, mean_ai, mean_final, mean_eff, low, high in per_assignment
+        ],
+    })
+
+
+# Gradebook export columns: (header, column). ?feedback=1 adds ai_feedback.
+EXPORT_COLUMNS = (
+    ("assignment_id", Assignment.id),
+    ("assignment", Assignment.name),
+    ("submission_id", Submission.id),
+    ("student_name", Submission.student_name),
+    ("ai_grade", Submission.ai_grade),
+    ("ai_score", Submission.ai_score),
+    ("final_grade", Submission.final_grade),
+    ("final_score", Submission.final_score),
+    ("submitted_at", Submission.created_at),
+)
+
+
+def gradebook_response(criteria, name: str):
+    """
+    Gradebook of the submissions matching criteria as a download:
+    ?format=csv (default) streams rows from the cursor as they are read,
+    ?format=xlsx builds the workbook in constant memory, then sends it.
+    """
+    fmt = (request.args.get("format") or "csv").lower()
+    if fmt not in ("csv", "xlsx"):
+        return jsonify({"error": "format must be csv or xlsx"}), 400
+    if fmt == "xlsx" and not xlsx_available():
+        return jsonify({"error": "XLSX export needs the xlsxwriter package"}), 501
+
+    columns = list(EXPORT_COLUMNS)
+    if _flag({}, "feedback"):
+        columns.append(("ai_feedback", Submission.ai_feedback))
+    header = [h for h, _ in columns]
+    stmt = (
+        select(*(c for _, c in columns))
+        .select_from(Submission)
+        .join(Assignment, Assignment.id == Submission.assignment_id)
+        .where(*criteria)
+        .order_by(Assignment.id, Submission.student_name, Submission.id)
+    )
+    filename = secure_filename(f"{name}-gradebook") or "gradebook"
+    if fmt == "xlsx":
+        return send_file(xlsx_file(header, stream_rows(stmt)), mimetype=XLSX_MIMETYPE,
+                         as_attachment=True, download_name=f"{filename}.xlsx")
+    return Response(
+        stream_with_context(csv_chunks(header, stream_rows(stmt))),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}.csv"', "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.get("/api/assignments/<int:aid>/export")
+def export_assignment(aid):
+    """One assignment's gradebook as CSV or XLSX (see gradebook_response)."""
+    a = db.session.get(Assignment, aid)
+    if not a:
+        return jsonify({"error": "assignment not found"}), 404
+    return gradebook_response([Submission.assignment_id == aid], a.name)
+
+
+@bp.get("/api/export")
+def export_gradebook():
+    """Gradebook of every assignment the caller (X-User-Email) owns, as CSV or XLSX."""
+    email = get_request_email()
+    if not email:
+        return jsonify({"error": "X-User-Email is required to export your gradebook"}), 401
+    return gradebook_response([Assignment.owner_email == email], email.split("@")[0])
+
+
+@bp.delete("/api/assignments/<int:aid>")
 def delete_assignment(aid):
     a = Assignment.query.get(aid)
     if not a:
         return jsonify({"error": "assignment not found"}), 404
+    for s in a.submissions:
+        release(s.file_path)
+    forget_signatures(s.id for s in a.submissions)
     db.session.delete(a)
     db.session.commit()
     return jsonify({"ok": True})
 
 
 # ----- Submissions: single upload -----
-@app.post("/api/upload_submission")
+@bp.post("/api/upload_submission")
 def upload_submission():
     """
     multipart/form-data:
@@ -491,10 +1416,8 @@ def upload_submission():
     if not allowed_file(f.filename):
         return jsonify({"error": "Invalid file type. Allowed: txt, pdf, docx"}), 400
 
-    # Save file
-    safe_name = secure_filename(f.filename)
-    dest = os.path.join(app.config["UPLOAD_FOLDER"], safe_name)
-    f.save(dest)
+    # Stream to content-addressed storage (identical bytes are stored once)
+    dest, _ = save_upload(f)
 
     # Create submission
     s = Submission(
@@ -503,21 +1426,26 @@ def upload_submission():
         file_path=dest,
     )
     db.session.add(s)
+    # Commit the upload (and its storage reference) before the slow OpenAI
+    # call so no write transaction stays open while grading.
+    db.session.commit()
 
     # Grade (safe on errors / quota)
     a = Assignment.query.get(int(assignment_id))
     rubric_text = a.rubric or (Rubric.query.get(a.rubric_id).body if a.rubric_id else "")
-    sub_text = extract_text(dest)
-    feedback, grade = grade_with_openai(sub_text, rubric_text or "No rubric provided")
-    s.ai_feedback = feedback
-    s.ai_grade = grade
+    mode = grading_mode_for(a)
+    sub_text = extract_text(dest, max_chars=char_budget_for(mode))
+    index_for_similarity([s])
+    db.session.commit()
+    feedback, grade, usage = grade_with_openai(sub_text, rubric_text or "No rubric provided", mode=mode)
+    apply_grade(s, feedback, grade, usage, rubric_text)
 
     db.session.commit()
     return jsonify({"id": s.id, "message": "uploaded and graded"}), 201
 
 
 # ----- Submissions: multi upload (drag & drop many) -----
-@app.post("/api/upload_submissions")
+@bp.post("/api/upload_submissions")
 def upload_submissions():
     """
     multipart/form-data:
@@ -527,6 +1455,14 @@ def upload_submissions():
     Filename rule:
       - If name has "_" or "-" then student_name = everything after the LAST one
       - If it has neither, student_name = "" (blank)
+
+    Files are saved and queued; grading runs in the worker. Returns 202 with
+    job_ids the client can poll at /api/jobs?ids=...
+
+    With "Accept: text/event-stream" (or ?stream=1) the response is instead
+    a Server-Sent Events stream: a "saved" event per file as it is stored
+    and queued, an "uploaded" summary, then the grading progress of those
+    jobs exactly as /api/jobs/stream reports it.
     """
     assignment_id = request.form.get("assignment_id")
     if not assignment_id:
@@ -536,52 +1472,210 @@ def upload_submissions():
     if not files:
         return jsonify({"error": "files[] are required"}), 400
 
-    created_ids = []
     a = Assignment.query.get(int(assignment_id))
-    rubric_text = a.rubric or (Rubric.query.get(a.rubric_id).body if a.rubric_id else "")
+    if not a:
+        return jsonify({"error": "assignment not found"}), 404
+
+    if wants_event_stream():
+        # Werkzeug closes the uploaded files when this view returns, so copy
+        # them out now; the stream then stores and queues them one by one.
+        staged = [stage_upload(f) if f and allowed_file(f.filename) else getattr(f, "filename", None)
+                  for f in files]
+        return event_stream_response(upload_events(a, staged))
+
+    created_ids = []
+    jobs = []
 
     for f in files:
         if not f or not allowed_file(f.filename):
             continue
+        s, job, _ = save_and_enqueue(a, f)
+        created_ids.append(s.id)
+        jobs.append(job)
+
+    db.session.commit()
+    job_ids = [j.id for j in jobs]
+    return jsonify({"created_ids": created_ids, "job_ids": job_ids, "status": "queued"}), 202
 
-        safe_name = secure_filename(f.filename)
-        dest = os.path.join(app.config["UPLOAD_FOLDER"], safe_name)
-        f.save(dest)
 
-        # Use the parser on the ORIGINAL filename
-        submission_title, student_name = parse_submission_filename(f.filename or safe_name)
+# ----- Submissions: one ZIP of many (LMS export) -----
+@bp.post("/api/upload_submissions_zip")
+def upload_submissions_zip():
+    """
+    multipart/form-data:
+      - assignment_id
+      - file (.zip)
+
+    Each txt/pdf/docx entry becomes a submission named by the same filename
+    rule as /api/upload_submissions (folders inside the archive are ignored)
+    and is queued for grading. Entries are decompressed one at a time; an
+    archive over the ZIP_MAX_* entry count or total size limits (or whose
+    entries decompress past their declared size) is rejected whole with
+    413, while a single entry over the per-entry limits is only skipped.
+    """
+    request.max_content_length = ZIP_MAX_UPLOAD_BYTES
+    assignment_id = request.form.get("assignment_id")
+    f = request.files.get("file")
+    if not assignment_id or not f:
+        return jsonify({"error": "assignment_id and file are required"}), 400
 
-        # Normalize according to your rule:
-        # - When there is no "_" or "-" → parser returns (None, None) → student_name becomes ""
-        # - When it works → strip whitespace like " Jed Cooper " → "Jed Cooper"
-        student_name = (student_name or "").strip()
+    a = db.session.get(Assignment, int(assignment_id))
+    if not a:
+        return jsonify({"error": "assignment not found"}), 404
 
-        s = Submission(
-            student_name=student_name,
-            assignment_id=int(assignment_id),
-            file_path=dest,
-        )
-        db.session.add(s)
-        db.session.flush()
-        created_ids.append(s.id)
+    try:
+        staged, skipped = stage_archive(f.stream, allowed_file)
+    except ZipLimitError as e:
+        return jsonify({"error": str(e)}), 413
+    except zipfile.BadZipFile as e:
+        return jsonify({"error": f"not a valid ZIP archive: {e}"}), 400
 
-        sub_text = extract_text(dest)
-        feedback, grade = grade_with_openai(sub_text, rubric_text or "No rubric provided")
-        s.ai_feedback = feedback
-        s.ai_grade = grade
+    created_ids, jobs = [], []
+    try:
+        while staged:
+            s, job, _ = save_and_enqueue(a, staged[0])
+            staged.pop(0)
+            created_ids.append(s.id)
+            jobs.append(job)
+        db.session.commit()
+    finally:
+        for item in staged:
+            discard_staged(item)
+    return jsonify({
+        "created_ids": created_ids,
+        "job_ids": [j.id for j in jobs],
+        "skipped": skipped,
+        "status": "queued",
+    }), 202
 
-    db.session.commit()
-    return jsonify({"created_ids": created_ids}), 201
+
+def save_and_enqueue(a: Assignment, f):
+    """
+    Store one uploaded file (a FileStorage, or a StagedUpload already copied
+    to disk) as a Submission and queue its grading. Caller commits.
+    """
+    safe_name = secure_filename(f.filename)
+    dest, deduped = store_staged(f) if isinstance(f, StagedUpload) else save_upload(f)
+
+    # Use the parser on the ORIGINAL filename
+    submission_title, student_name = parse_submission_filename(f.filename or safe_name)
+
+    # Normalize according to your rule:
+    # - When there is no "_" or "-" → parser returns (None, None) → student_name becomes ""
+    # - When it works → strip whitespace like " Jed Cooper " → "Jed Cooper"
+    student_name = (student_name or "").strip()
+
+    s = Submission(
+        student_name=student_name,
+        assignment_id=a.id,
+        file_path=dest,
+        ai_grade="Pending",
+    )
+    db.session.add(s)
+    db.session.flush()
+
+    # Grading happens in the background worker (flask grade-worker)
+    return s, enqueue_job(s.id, a.id), deduped
+
+
+def upload_events(a: Assignment, staged):
+    """
+    SSE body for a streamed bulk upload (see upload_submissions). staged
+    holds a StagedUpload per accepted file and the filename of rejected ones.
+    """
+    created_ids, job_ids = [], []
+    pending = list(staged)
+    try:
+        while pending:
+            f = pending.pop(0)
+            if not isinstance(f, StagedUpload):
+                yield sse_event("skipped", {"filename": f, "error": "invalid file type"})
+                continue
+            started = time.monotonic()
+            s, job, deduped = save_and_enqueue(a, f)
+            # commit per file so the worker can start on it right away
+            db.session.commit()
+            created_ids.append(s.id)
+            job_ids.append(job.id)
+            yield sse_event("saved", {
+                "filename": f.filename,
+                "submission_id": s.id,
+                "job_id": job.id,
+                "student_name": s.student_name,
+                "deduped": deduped,
+                "bytes": f.size,
+                "seconds": round(f.seconds + time.monotonic() - started, 3),
+            })
+    finally:
+        # client went away mid-upload: don't leave temp copies behind
+        for f in pending:
+            if isinstance(f, StagedUpload):
+                discard_staged(f)
+    yield sse_event("uploaded", {"created_ids": created_ids, "job_ids": job_ids, "status": "queued"})
+    yield from job_events(job_ids)
 
 
 # ----- Submissions: read / finalize / delete -----
-@app.get("/api/submissions/<int:sid>")
+@bp.get("/api/assignments/<int:aid>/submissions")
+def list_assignment_submissions(aid):
+    """
+    Submissions of one assignment, newest first. Same ?limit=/&cursor=
+    and ?fields= conventions as /api/assignments; leave ai_feedback out
+    of fields to skip loading it.
+    """
+    if not db.session.get(Assignment, aid):
+        return jsonify({"error": "assignment not found"}), 404
+    q = Submission.query.filter(Submission.assignment_id == aid)
+    try:
+        limit, cursor = page_args()
+        fields = parse_fields(SUBMISSION_FIELDS)
+        q = defer_unrequested(q, fields, {"ai_feedback": Submission.ai_feedback})
+        if limit is None:
+            items, next_cursor = q.order_by(Submission.created_at.desc(), Submission.id.desc()).all(), None
+        else:
+            items, next_cursor = keyset_page(q, Submission, limit, cursor)
+    except PaginationError as e:
+        return jsonify({"error": str(e)}), 400
+    out = [select_fields(s.to_dict_full(), fields) for s in items]
+    if limit is None:
+        return jsonify(out)
+    return jsonify(page_response(out, next_cursor, limit))
+
+
+@bp.get("/api/submissions/<int:sid>")
 def get_submission(sid):
     s = Submission.query.get_or_404(sid)
     return jsonify(s.to_dict_full())
 
 
-@app.post("/api/submissions/<int:sid>/finalize")
+@bp.get("/api/submissions/<int:sid>/similar")
+def submission_similar(sid):
+    """
+    Up to ?limit= submissions of the same assignment most similar to this
+    one, at or above ?threshold=. "indexed" is false (and the list empty)
+    until the submission's signature has been built.
+    """
+    s = Submission.query.get_or_404(sid)
+    threshold, limit, error = _similarity_args()
+    if error:
+        return jsonify({"error": error}), 400
+    matches = similar_to(s.id, threshold, limit)
+    names = dict(db.session.query(Submission.id, Submission.student_name).filter(
+        Submission.id.in_([m for m, _ in matches or []])
+    ))
+    return jsonify({
+        "submission_id": s.id,
+        "assignment_id": s.assignment_id,
+        "threshold": threshold,
+        "indexed": matches is not None,
+        "similar": [
+            {"submission_id": m, "student_name": names[m], "similarity": round(score, 3)}
+            for m, score in matches or [] if m in names
+        ],
+    })
+
+
+@bp.post("/api/submissions/<int:sid>/finalize")
 def finalize_submission(sid):
     s = Submission.query.get_or_404(sid)
     data = request.get_json(silent=True) or {}
@@ -593,14 +1687,51 @@ def finalize_submission(sid):
     return jsonify({"ok": True})
 
 
-@app.delete("/api/submissions/<int:sid>")
+@bp.delete("/api/submissions/<int:sid>")
 def delete_submission(sid):
     s = Submission.query.get_or_404(sid)
+    release(s.file_path)
+    forget_signatures([s.id])
     db.session.delete(s)
     db.session.commit()
     return jsonify({"ok": True})
 
 
+# =========================
+# App factory
+# =========================
+BLUEPRINTS = (
+    bp, pins_bp, jobs_bp, rate_limit_bp, grading_cache_bp, storage_bp, openai_batch_bp, openai_client_bp,
+    metrics_bp,
+)
+
+
+def create_app(config: dict | None = None) -> Flask:
+    """
+    Build the Flask app. Nothing slow runs here: the OpenAI SDK and the
+    PDF/DOCX parsers load on first use, and the schema is created or
+    migrated by `flask --app app init-db` before the server starts.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = DB_URL
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    app.config["MAX_CONTENT_LENGTH"] = 32 * 1024 * 1024  # 32MB
+    app.config.update(config or {})
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+    CORS(app, supports_credentials=True, origins=FRONTEND_ORIGINS.split(","))
+    db.init_app(app)
+    app.extensions["openai_clients"] = openai_clients
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
+    return app
+
+
+# gunicorn app:app / flask --app app ...
+app = create_app()
+
+
 # =========================
 # Entrypoint
 # =========================
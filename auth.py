@@ -1,10 +1,47 @@
 # auth.py
 import os
+import time
+import hashlib
 import functools
-import requests
+import threading
+from collections import OrderedDict
 from flask import request, g, jsonify
 
 NETLIFY_ISSUER = os.getenv("NETLIFY_ISSUER", "").rstrip("/")
+# Netlify Identity signs access tokens with the site's JWT secret (HS256).
+# With it set, tokens are verified locally instead of calling {issuer}/user.
+NETLIFY_JWT_SECRET = os.getenv("NETLIFY_JWT_SECRET") or None
+# Optional JWKS endpoint for asymmetric (RS256/ES256) issuers.
+NETLIFY_JWKS_URL = os.getenv("NETLIFY_JWKS_URL") or None
+NETLIFY_JWT_AUDIENCE = os.getenv("NETLIFY_JWT_AUDIENCE") or None
+JWKS_CACHE_TTL = float(os.getenv("JWKS_CACHE_TTL", "3600"))
+# Validated tokens are remembered (by sha256) for at most this long, and
+# never past their own exp.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "2048"))
+IDENTITY_TIMEOUT = float(os.getenv("IDENTITY_TIMEOUT", "10"))
+
+HS_ALGORITHMS = ["HS256"]
+JWKS_ALGORITHMS = ["RS256", "ES256"]
+
+# One pooled keep-alive session for every call to the issuer, built on
+# first use (requests and jose are only imported once a token shows up).
+_session = None
+_session_lock = threading.Lock()
+
+
+def _http():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            _session = session
+        return _session
+
 
 def _bearer_token(auth_header: str) -> str | None:
     if not auth_header:
@@ -14,21 +51,148 @@ def _bearer_token(auth_header: str) -> str | None:
         return parts[1]
     return None
 
-def _fetch_netlify_user(token: str) -> dict:
-    """Ask Netlify Identity to validate the token and return the user JSON."""
-    url = f"{NETLIFY_ISSUER}/user"
-    resp = requests.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=10)
-    if resp.status_code != 200:
-        raise ValueError(f"Identity /user status {resp.status_code}")
-    data = resp.json()  # contains email, app_metadata.roles, etc.
+
+def _user_from(data: dict) -> dict:
+    """Same shape for /user JSON and JWT claims (both carry app_metadata)."""
     roles = (data.get("app_metadata") or {}).get("roles") or []
     return {
-        "id": data.get("id"),
+        "id": data.get("id") or data.get("sub"),
         "email": data.get("email"),
         "roles": roles,
         "raw": data,
     }
 
+
+def _fetch_netlify_user(token: str) -> dict:
+    """Ask Netlify Identity to validate the token and return the user JSON."""
+    url = f"{NETLIFY_ISSUER}/user"
+    resp = _http().get(url, headers={"Authorization": f"Bearer {token}"}, timeout=IDENTITY_TIMEOUT)
+    if resp.status_code != 200:
+        raise ValueError(f"Identity /user status {resp.status_code}")
+    return _user_from(resp.json())  # contains email, app_metadata.roles, etc.
+
+
+# ---------- LOCAL VERIFICATION ----------
+
+class _JWKSCache:
+    """Issuer signing keys by kid, refetched after JWKS_CACHE_TTL or on an unknown kid."""
+
+    def __init__(self):
+        self._keys: dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        resp = _http().get(NETLIFY_JWKS_URL, timeout=IDENTITY_TIMEOUT)
+        resp.raise_for_status()
+        self._keys = {k.get("kid", ""): k for k in resp.json().get("keys", [])}
+        self._fetched_at = time.monotonic()
+
+    def get(self, kid: str) -> dict | None:
+        with self._lock:
+            if time.monotonic() - self._fetched_at > JWKS_CACHE_TTL:
+                self._refresh()
+            if kid not in self._keys:
+                # key rotation: look once more, at most every 30s
+                if time.monotonic() - self._fetched_at > 30:
+                    self._refresh()
+            return self._keys.get(kid)
+
+
+_jwks = _JWKSCache()
+
+
+def _verify_locally(token: str) -> dict | None:
+    """
+    Verify signature, exp and (if configured) aud without a network hop.
+    Returns the claims, None when no local key applies (caller falls back
+    to the issuer), and raises JWTError for a bad or expired token.
+    """
+    from jose import jwt
+    header = jwt.get_unverified_header(token)
+    alg = header.get("alg")
+    options = {"verify_aud": NETLIFY_JWT_AUDIENCE is not None}
+    if alg in HS_ALGORITHMS and NETLIFY_JWT_SECRET:
+        return jwt.decode(token, NETLIFY_JWT_SECRET, algorithms=HS_ALGORITHMS,
+                          audience=NETLIFY_JWT_AUDIENCE, options=options)
+    if alg in JWKS_ALGORITHMS and NETLIFY_JWKS_URL:
+        key = _jwks.get(header.get("kid", ""))
+        if key is None:
+            return None
+        return jwt.decode(token, key, algorithms=JWKS_ALGORITHMS,
+                          audience=NETLIFY_JWT_AUDIENCE, options=options)
+    return None
+
+
+# ---------- TOKEN CACHE ----------
+
+class _TokenCache:
+    """Bounded LRU of validated users keyed by sha256(token)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: str, user: dict, expires_at: float):
+        with self._lock:
+            self._items[key] = (expires_at, user)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_token_cache = _TokenCache(AUTH_CACHE_MAX_ENTRIES)
+
+
+def validate_token(token: str) -> dict:
+    """
+    User dict for a bearer token: from the cache, else verified locally,
+    else via the issuer's /user endpoint. Raises on an invalid token.
+    """
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    user = _token_cache.get(key)
+    if user is not None:
+        return user
+
+    expires_at = time.time() + AUTH_CACHE_TTL
+    claims = _verify_locally(token)
+    if claims is not None:
+        user = _user_from(claims)
+        if claims.get("exp"):
+            expires_at = min(expires_at, float(claims["exp"]))
+    else:
+        from jose import jwt, JWTError
+        user = _fetch_netlify_user(token)
+        try:
+            exp = jwt.get_unverified_claims(token).get("exp")
+            if exp:
+                expires_at = min(expires_at, float(exp))
+        except JWTError:
+            pass
+
+    _token_cache.put(key, user, expires_at)
+    return user
+
+
 def require_professor(view_fn):
     """Decorator that requires a valid Netlify Identity token with role 'professor' or 'admin'."""
     @functools.wraps(view_fn)
@@ -37,7 +201,7 @@ def require_professor(view_fn):
         if not token:
             return jsonify({"error": "missing bearer token"}), 401
         try:
-            user = _fetch_netlify_user(token)
+            user = validate_token(token)
         except Exception as e:
             return jsonify({"error": "invalid token", "detail": str(e)}), 401
 
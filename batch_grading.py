@@ -0,0 +1,133 @@
+# batch_grading.py
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from flask import current_app, has_app_context
+from extensions import db
+from metrics import current_trace, adopt_trace
+
+# How many OpenAI calls may be outstanding at once per process.
+GRADING_MAX_IN_FLIGHT = int(os.getenv("GRADING_MAX_IN_FLIGHT", "4"))
+
+# USD per million tokens for OPENAI_MODEL (defaults: gpt-4o-mini list prices).
+# Cached prompt tokens are the part of prompt_tokens served from the
+# provider's prompt cache and billed at the lower rate.
+OPENAI_PRICE_INPUT = float(os.getenv("OPENAI_PRICE_INPUT", "0.15"))
+OPENAI_PRICE_CACHED_INPUT = float(os.getenv("OPENAI_PRICE_CACHED_INPUT", "0.075"))
+OPENAI_PRICE_OUTPUT = float(os.getenv("OPENAI_PRICE_OUTPUT", "0.60"))
+
+# Marks run_concurrently's pool threads, so a nested call (e.g. chunked
+# grading inside grade_batch) runs on its worker instead of opening
+# another pool and multiplying the calls in flight.
+_pool_thread = threading.local()
+
+USAGE_KEYS = ("prompt_tokens", "cached_tokens", "completion_tokens")
+
+
+def empty_usage() -> dict:
+    return {k: 0 for k in USAGE_KEYS}
+
+
+def add_usage(total: dict, usage: dict | None) -> dict:
+    """Accumulate an OpenAI usage dict into `total` (in place) and return it."""
+    for k in USAGE_KEYS:
+        total[k] = total.get(k, 0) + int((usage or {}).get(k) or 0)
+    return total
+
+
+def usage_cost(usage: dict | None) -> float:
+    """USD cost of a usage dict at the configured prices."""
+    usage = usage or {}
+    prompt = int(usage.get("prompt_tokens") or 0)
+    cached = min(prompt, int(usage.get("cached_tokens") or 0))
+    completion = int(usage.get("completion_tokens") or 0)
+    return (
+        (prompt - cached) * OPENAI_PRICE_INPUT
+        + cached * OPENAI_PRICE_CACHED_INPUT
+        + completion * OPENAI_PRICE_OUTPUT
+    ) / 1_000_000
+
+
+@dataclass
+class GradeResult:
+    index: int
+    feedback: str | None = None
+    grade: str | None = None
+    usage: dict = field(default_factory=empty_usage)
+    error: str | None = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _mark_pool_thread():
+    _pool_thread.active = True
+
+
+def run_concurrently(fn, items, max_in_flight: int | None = None) -> list[tuple[object, str | None]]:
+    """
+    Call fn(*item) for every item on a thread pool, at most max_in_flight at
+    once. Returns [(value, error)] in input order; an exception from one
+    item is stored as its error string and never affects the others.
+
+    If called inside a Flask app context, each worker thread gets its own
+    context so fn may use the database; what fn wrote (e.g. grading cache
+    entries) is committed when it returns and rolled back if it raises.
+    The threads' spans and SQL count toward the calling request's trace.
+
+    Called from one of its own worker threads, it runs the items serially,
+    so nesting never puts more than max_in_flight calls in flight.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    limit = 1 if getattr(_pool_thread, "active", False) else max(1, max_in_flight or GRADING_MAX_IN_FLIGHT)
+    app = current_app._get_current_object() if has_app_context() else None
+    trace = current_trace()
+
+    def run_one(args):
+        try:
+            if app is not None:
+                with app.app_context():
+                    adopt_trace(trace)
+                    value = fn(*args)
+                    db.session.commit()
+                    return value, None
+            return fn(*args), None
+        except Exception as e:
+            return None, str(e) or e.__class__.__name__
+
+    if limit == 1 or len(items) == 1:
+        return [run_one(args) for args in items]
+
+    with ThreadPoolExecutor(max_workers=min(limit, len(items)), thread_name_prefix="grade",
+                            initializer=_mark_pool_thread) as pool:
+        return list(pool.map(run_one, items))
+
+
+def grade_batch(pairs, grade_fn, max_in_flight: int | None = None) -> list[GradeResult]:
+    """
+    Grade many (submission_text, rubric_text) pairs concurrently. Items may
+    carry extra positional args for grade_fn (e.g. a grading mode).
+
+    grade_fn(submission_text, rubric_text, ...) -> (feedback, grade, usage)
+    runs through run_concurrently. Results come back in input order with
+    per-item errors kept on GradeResult.error.
+    """
+    def timed(*args):
+        started = time.monotonic()
+        value = grade_fn(*args)
+        return value, time.monotonic() - started
+
+    results = []
+    for index, (value, error) in enumerate(run_concurrently(timed, pairs, max_in_flight)):
+        result = GradeResult(index=index, error=error)
+        if error is None:
+            (result.feedback, result.grade, result.usage), result.seconds = value
+        results.append(result)
+    return results
@@ -0,0 +1,114 @@
+"""
+Assignment grade statistics: parsing grade strings row by row vs the numeric columns.
+
+    python benchmarks/bench_analytics.py [--submissions 20000] [--runs 5]
+
+Fills a throwaway SQLite database with one assignment of --submissions
+graded submissions (a mix of "87", "87%", "17/20", letter grades and
+"Pending", with final grades near the AI grade and a few far off), then
+computes mean/median/stddev/histogram/agreement/outliers two ways: loading
+every Submission and parsing its strings in Python, and through
+GET /api/assignments/<id>/analytics (one columnar query of ai_score and
+final_score, NumPy over the arrays). Prints the best time of --runs and
+checks both agree.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def fake_grade(rng, score: float) -> str:
+    style = rng.random()
+    if style < 0.5:
+        return str(round(score))
+    if style < 0.7:
+        return f"{round(score)}%"
+    if style < 0.9:
+        return f"{round(score / 5)}/20"
+    return {9: "A", 8: "B", 7: "C", 6: "D"}.get(int(score // 10), "F")
+
+
+def row_by_row(A, aid, grade_score, points):
+    """The pre-analytics way: every ORM row, strings parsed in Python."""
+    subs = A.Submission.query.filter_by(assignment_id=aid).all()
+    ai = [grade_score(s.ai_grade) for s in subs]
+    final = [grade_score(s.final_grade) for s in subs]
+    effective = [f if f is not None else a for a, f in zip(ai, final)]
+    values = [v for v in effective if v is not None]
+    hist = [0] * 10
+    for v in values:
+        hist[min(9, max(0, int(v // 10)))] += 1
+    pairs = [(a, f) for a, f in zip(ai, final) if a is not None and f is not None]
+    diffs = [f - a for a, f in pairs]
+    return {
+        "mean": statistics.fmean(values), "median": statistics.median(values),
+        "stddev": statistics.stdev(values), "histogram": hist,
+        "mean_abs_difference": statistics.fmean(abs(d) for d in diffs),
+        "outliers": sum(abs(d) >= points for d in diffs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=20000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_analytics_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+    from analytics import grade_score, GRADE_OUTLIER_POINTS
+
+    rng = random.Random(5)
+    with A.app.app_context():
+        A.migrate_database()
+        a = A.Assignment(name="Bench", rubric="r")
+        A.db.session.add(a)
+        A.db.session.flush()
+        for i in range(args.submissions):
+            score = min(100.0, max(30.0, rng.gauss(78, 10)))
+            ai = "Pending" if rng.random() < 0.05 else fake_grade(rng, score)
+            final = None
+            if rng.random() < 0.6:
+                final = str(round(score + (rng.gauss(0, 25) if rng.random() < 0.03 else rng.gauss(1, 3))))
+            A.db.session.add(A.Submission(assignment_id=a.id, student_name=f"S{i}", file_path="-",
+                                          ai_grade=ai, final_grade=final))
+        A.db.session.commit()
+        aid = a.id
+        client = A.app.test_client()
+
+        def best(fn):
+            times = []
+            for _ in range(args.runs):
+                A.db.session.expunge_all()
+                started = time.perf_counter()
+                result = fn()
+                times.append(time.perf_counter() - started)
+            return min(times), result
+
+        slow, old = best(lambda: row_by_row(A, aid, grade_score, GRADE_OUTLIER_POINTS))
+        fast, new = best(lambda: client.get(f"/api/assignments/{aid}/analytics").get_json())
+        print(f"row by row, parse strings:  {slow * 1e3:8.1f} ms")
+        print(f"analytics endpoint (NumPy): {fast * 1e3:8.1f} ms  ({slow / fast:.1f}x)")
+
+        eff = new["effective"]
+        same = (
+            abs(old["mean"] - eff["mean"]) < 0.01 and abs(old["median"] - eff["median"]) < 0.01
+            and abs(old["stddev"] - eff["stddev"]) < 0.01
+            and old["histogram"] == [b["count"] for b in new["histogram"]]
+            and abs(old["mean_abs_difference"] - new["agreement"]["mean_abs_difference"]) < 0.01
+        )
+        print(f"results agree: {same}  (mean {eff['mean']}, median {eff['median']}, stddev {eff['stddev']}, "
+              f"outliers {new['outlier_count']} incl. robust-z vs {old['outliers']} by points alone)")
+
+
+if __name__ == "__main__":
+    main()
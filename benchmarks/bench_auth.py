@@ -0,0 +1,62 @@
+"""
+Token validation latency against a local stub Netlify Identity issuer.
+
+    python benchmarks/bench_auth.py [--requests 200] [--issuer-delay 0.05]
+
+Starts a stub issuer on 127.0.0.1 that serves /user (after --issuer-delay
+seconds, like a remote hop) and an empty JWKS. Then it times
+require_professor on a tiny Flask app for the /user fallback and for local
+HS256 verification, each with the token cache off and on.
+"""
+import os
+import sys
+import time
+import argparse
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from tests.stubs import SECRET, CLAIMS, start_stub_issuer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--issuer-delay", type=float, default=0.05, help="seconds the stub /user takes")
+    args = parser.parse_args()
+
+    os.environ["NETLIFY_ISSUER"], _ = start_stub_issuer(args.issuer_delay)
+    import auth  # noqa: E402  (reads NETLIFY_ISSUER at import)
+    from flask import Flask
+    from jose import jwt
+
+    app = Flask(__name__)
+
+    @app.get("/protected")
+    @auth.require_professor
+    def protected():
+        return {"email": auth.g.email}
+
+    client = app.test_client()
+    token = jwt.encode({**CLAIMS, "exp": int(time.time()) + 3600}, SECRET, algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def run(label, cache_ttl, secret):
+        auth.AUTH_CACHE_TTL = cache_ttl
+        auth.NETLIFY_JWT_SECRET = secret
+        auth._token_cache.clear()
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            assert client.get("/protected", headers=headers).status_code == 200
+        elapsed = time.perf_counter() - started
+        print(f"{label:<22} {args.requests:>5} req  {elapsed:8.3f}s  {elapsed / args.requests * 1000:8.2f} ms/req")
+
+    run("issuer /user, no cache", 0, None)
+    run("issuer /user, cached", 300, None)
+    run("local HS256, no cache", 0, SECRET)
+    run("local HS256, cached", 300, SECRET)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Synchronous grading vs the OpenAI Batch API path, against a local stub.
+
+    python benchmarks/bench_batch.py [--submissions 200] [--chat-delay 0.05] [--polls 3]
+
+Starts a stub OpenAI server on 127.0.0.1 that answers chat completions
+(after --chat-delay seconds) and implements the Files + Batches endpoints:
+a batch reports in_progress for --polls status checks, then completes with
+an output file built from its input lines. Grades the same submissions
+both ways in a throwaway SQLite database and prints HTTP requests made,
+wall time and tokens. The batch run uses a fresh OpenAI client for every
+step, like a worker restarting between polls.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from tests.stubs import start_stub_openai  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=200)
+    parser.add_argument("--chat-delay", type=float, default=0.05, help="seconds one stub chat completion takes")
+    parser.add_argument("--polls", type=int, default=3, help="status checks before a stub batch completes")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_batch_")
+    base_url, calls = start_stub_openai(args.chat_delay, args.polls)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+        "UPLOAD_FOLDER": os.path.join(tmp, "uploads"),
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": "stub",
+        "GRADING_CACHE_ENABLED": "0",
+    })
+    import app as A  # noqa: E402  (reads the environment at import)
+    from openai import OpenAI
+    from openai_batch import advance_batches, OpenAIBatch, BATCH_INGESTED
+
+    with A.app.app_context():
+        A.migrate_database()
+        a = A.Assignment(name="Bench", rubric="Thesis 40, evidence 40, style 20.", owner_email="bench@example.edu")
+        A.db.session.add(a)
+        A.db.session.flush()
+        for i in range(args.submissions):
+            path = os.path.join(tmp, f"essay{i}.txt")
+            with open(path, "w") as f:
+                f.write(f"Essay {i}. " + "The argument develops over several paragraphs. " * (20 + i % 10))
+            A.db.session.add(A.Submission(assignment_id=a.id, student_name=f"S{i}", file_path=path, ai_grade="Pending"))
+        A.db.session.commit()
+        aid = a.id
+        client = A.app.test_client()
+
+        def report(label, elapsed, before):
+            usage = A.db.session.query(A.db.func.sum(A.Submission.prompt_tokens),
+                                       A.db.func.sum(A.Submission.completion_tokens)).one()
+            graded = A.Submission.query.filter(A.Submission.ai_grade != "Pending").count()
+            made = {k: calls[k] - before[k] for k in calls}
+            print(f"{label:<6} graded={graded:>5}  http: chat={made['chat']:>5} files={made['files']:>3} "
+                  f"batches={made['batches']:>3}  {elapsed:8.3f}s  tokens in/out={usage[0]}/{usage[1]}")
+
+        before = dict(calls)
+        started = time.perf_counter()
+        resp = client.post(f"/api/assignments/{aid}/regrade", json={"all": True})
+        assert resp.status_code == 200, resp.get_json()
+        report("sync", time.perf_counter() - started, before)
+
+        A.Submission.query.update({"ai_grade": "Pending", "ai_score": None, "prompt_tokens": 0, "completion_tokens": 0})
+        A.db.session.commit()
+        before = dict(calls)
+        started = time.perf_counter()
+        resp = client.post(f"/api/assignments/{aid}/regrade", json={"all": True, "batch": True})
+        assert resp.status_code == 202, resp.get_json()
+        steps = 0
+        while OpenAIBatch.query.filter(OpenAIBatch.status != BATCH_INGESTED).count():
+            # a new client per step: nothing but the database carries state
+            advance_batches(OpenAI(api_key="stub", base_url=base_url), A.apply_batch_result, poll_seconds=0)
+            steps += 1
+        report("batch", time.perf_counter() - started, before)
+        print(f"{'':<6} worker steps until ingested: {steps}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Gradebook export: building the whole file in memory vs streaming it.
+
+    python benchmarks/bench_export.py [--submissions 5000] [--feedback-kb 4]
+
+Fills a throwaway SQLite database with one assignment of --submissions
+graded submissions, each with --feedback-kb of AI feedback, then exports
+the gradebook with feedback three ways: loading every Submission object
+and writing the CSV into one string (the naive way), and through
+GET /api/assignments/<id>/export as streamed CSV and as constant-memory
+XLSX. Prints the time and the peak Python memory (tracemalloc) of each.
+"""
+import io
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def naive_csv(A, aid) -> int:
+    """Every ORM row loaded, the whole CSV built in memory before sending."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["submission_id", "student_name", "ai_grade", "final_grade", "ai_feedback"])
+    for s in A.Submission.query.filter_by(assignment_id=aid).order_by(A.Submission.student_name).all():
+        writer.writerow([s.id, s.student_name, s.ai_grade, s.final_grade or "", s.ai_feedback or ""])
+    return len(buf.getvalue().encode("utf-8"))
+
+
+def streamed(client, url) -> int:
+    """Consume the response piece by piece, as a client download would."""
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return size
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=5000)
+    parser.add_argument("--feedback-kb", type=int, default=4, help="AI feedback per submission")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_export_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+
+    rng = random.Random(3)
+    words = ["thesis", "evidence", "clear", "argument", "citation", "structure", "grammar", "strong"]
+    with A.app.app_context():
+        A.migrate_database()
+        a = A.Assignment(name="Bench", rubric="r")
+        A.db.session.add(a)
+        A.db.session.flush()
+        aid = a.id
+        for i in range(args.submissions):
+            feedback = " ".join(rng.choice(words) for _ in range(args.feedback_kb * 1024 // 8))
+            A.db.session.add(A.Submission(assignment_id=aid, student_name=f"Student {i:05d}", file_path="-",
+                                          ai_grade=str(rng.randint(50, 100)), ai_feedback=feedback))
+        A.db.session.commit()
+        A.db.session.expunge_all()
+        client = A.app.test_client()
+
+        runs = [
+            ("naive CSV (ORM, in memory)", lambda: naive_csv(A, aid)),
+            ("streamed CSV", lambda: streamed(client, f"/api/assignments/{aid}/export?feedback=1")),
+            ("XLSX (constant_memory)", lambda: streamed(client, f"/api/assignments/{aid}/export?format=xlsx&feedback=1")),
+        ]
+        for label, fn in runs:
+            A.db.session.expunge_all()
+            elapsed, peak, size = measure(fn)
+            print(f"{label:28} {elapsed:6.2f}s  peak {peak / 2**20:7.1f} MiB  output {size / 2**20:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Serial vs process-pool text extraction throughput.
+
+    python benchmarks/bench_extract.py [--copies 8] [--workers 1,2,4]
+
+Uses the sample DOCX files under uploads/, repeated --copies times to make
+a bulk-upload sized batch. Parsing only; the extracted-text store is not
+involved.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from extraction import parse_files  # noqa: E402
+
+
+def run(label, paths, workers):
+    started = time.perf_counter()
+    results = parse_files(paths, workers=workers)
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for r in results if r.error)
+    print(f"{label:<14} {len(paths):>5} files  {elapsed:8.3f}s  {len(paths) / elapsed:8.1f} files/s  failed={failed}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--copies", type=int, default=8, help="times each sample file is repeated")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated pool sizes to try")
+    args = parser.parse_args()
+
+    samples = sorted(glob.glob(os.path.join(BASE_DIR, "uploads", "**", "*.docx"), recursive=True))
+    if not samples:
+        sys.exit("no sample .docx files under uploads/")
+    paths = samples * args.copies
+    print(f"{len(samples)} sample files x {args.copies} copies, {os.cpu_count()} CPUs\n")
+
+    serial = run("serial", paths, workers=0)
+    for n in [int(x) for x in args.workers.split(",") if x.strip()]:
+        pooled = run(f"pool x{n}", paths, workers=n)
+        print(f"{'':<14} speedup vs serial: {serial / pooled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Cold import time of the Flask app, with a budget.
+
+    python benchmarks/bench_import.py [--runs 5] [--budget-ms 800] [--top 10]
+
+Runs `python -X importtime -c "import app"` in fresh interpreters and
+reports the best cumulative time for `app` plus the slowest modules it
+pulls in. Exits with status 1 when the best run is over --budget-ms or
+when a module that must load lazily (OpenAI SDK, document parsers,
+alembic, jose, numpy, ...) was imported, so CI can run it as a check.
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Only needed once a request actually grades, parses or verifies something.
+LAZY_MODULES = (
+    "openai", "pypdf", "docx", "lxml", "alembic", "flask_migrate", "jose", "requests", "tiktoken", "numpy",
+    "xlsxwriter",
+)
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure() -> list[tuple[int, int, str]]:
+    """[(cumulative_us, depth, module)] for one cold `import app`."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(proc.stderr[-2000:])
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=800.0)
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports of app to list")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(max(1, args.runs))]
+    totals = [next(us for us, depth, name in rows if name == "app" and depth == 0) for rows in runs]
+    best = min(range(len(runs)), key=totals.__getitem__)
+    rows = runs[best]
+    total_ms = totals[best] / 1000
+
+    print(f"import app: best {total_ms:.1f} ms, worst {max(totals) / 1000:.1f} ms over {len(runs)} runs "
+          f"(budget {args.budget_ms:.0f} ms)\n")
+    direct = sorted((r for r in rows if r[1] == 1), reverse=True)[:args.top]
+    for us, _, name in direct:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    loaded = {name.split(".")[0] for _, _, name in rows}
+    eager = [m for m in LAZY_MODULES if m in loaded]
+    failed = False
+    if eager:
+        print(f"\nFAIL: imported at startup but should load lazily: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"\nFAIL: {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
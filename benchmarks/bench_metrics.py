@@ -0,0 +1,61 @@
+"""
+Instrumentation overhead: request latency with and without metrics.
+
+    python benchmarks/bench_metrics.py [--requests 2000] [--assignments 50]
+
+Fills a throwaway SQLite database with --assignments assignments, then
+sends --requests GET /api/assignments and GET /api/health requests with
+metrics switched off and on (request hooks, SQL event hooks and spans).
+Prints the mean time per request each way, the difference, and how long
+rendering /api/metrics takes afterwards.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--assignments", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_metrics_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+    import metrics
+
+    with A.app.app_context():
+        A.migrate_database()
+        A.db.session.add_all([A.Assignment(name=f"A{i}", rubric="r") for i in range(args.assignments)])
+        A.db.session.commit()
+    client = A.app.test_client()
+
+    def run(url):
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            client.get(url)
+        return (time.perf_counter() - started) / args.requests
+
+    for url in ("/api/health", "/api/assignments"):
+        run(url)    # warm up
+        metrics.METRICS_ENABLED = False
+        off = min(run(url) for _ in range(3))
+        metrics.METRICS_ENABLED = True
+        on = min(run(url) for _ in range(3))
+        print(f"{url:18} off {off * 1e6:7.1f} us  on {on * 1e6:7.1f} us  overhead {(on - off) * 1e6:6.1f} us "
+              f"({(on - off) / off:.1%})")
+
+    started = time.perf_counter()
+    body = client.get("/api/metrics").data
+    print(f"/api/metrics render: {(time.perf_counter() - started) * 1e3:.2f} ms, {len(body.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main()
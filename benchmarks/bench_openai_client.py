@@ -0,0 +1,127 @@
+"""
+Connection reuse of the pooled OpenAI client under parallel grading.
+
+    python benchmarks/bench_openai_client.py [--requests 200] [--threads 8] [--delay 0.02]
+
+Starts a keep-alive stub chat completions server on 127.0.0.1 that counts
+the TCP connections it accepts, then sends --requests completions from
+--threads threads three ways: a new OpenAI client per call, one client with
+the SDK defaults, and OpenAIClientManager. Afterwards it checks that a
+forked child builds its own client and that a hung request is cut off at
+OPENAI_READ_TIMEOUT instead of holding the thread.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+BODY = json.dumps({
+    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": "{\"feedback\": \"ok\", \"grade\": 90}"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+}).encode()
+
+
+def start_stub(delay: float) -> tuple[str, dict]:
+    counts = {"connections": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counts["connections"] += 1
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("content-length", 0)))
+            time.sleep(30 if self.path.startswith("/hang") else delay)
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", counts
+
+
+def complete(client):
+    client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "grade this"}])
+
+
+def run(label, get_client, n, threads, counts):
+    before = counts["connections"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: complete(get_client()), range(n)))
+    elapsed = time.perf_counter() - started
+    opened = counts["connections"] - before
+    print(f"{label:<22} {n:>5} req  {elapsed:7.3f}s  {n / elapsed:8.1f} req/s  "
+          f"connections={opened:>4}  reuse={1 - opened / n:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--delay", type=float, default=0.02, help="seconds the stub takes per completion")
+    args = parser.parse_args()
+
+    base, counts = start_stub(args.delay)
+    os.environ["OPENAI_READ_TIMEOUT"] = "1"
+    import openai
+    import openai_client  # noqa: E402  (reads OPENAI_* at import)
+
+    base_url = f"{base}/v1"
+    run("new client per call", lambda: openai.OpenAI(api_key="stub", base_url=base_url),
+        args.requests, args.threads, counts)
+    shared = openai.OpenAI(api_key="stub", base_url=base_url)
+    run("one client, defaults", lambda: shared, args.requests, args.threads, counts)
+    manager = openai_client.OpenAIClientManager(api_key="stub", base_url=base_url)
+    run("OpenAIClientManager", manager.get, args.requests, args.threads, counts)
+    print(f"{'':<22} manager stats: {json.dumps(manager.stats.to_dict())}")
+
+    # fork safety: the child must not reuse the parent's client or sockets
+    parent_client = manager.get()
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        child_client = manager.get()
+        complete(child_client)
+        os.write(w, json.dumps({"own_client": child_client is not parent_client,
+                                "requests": manager.stats.requests}).encode())
+        os._exit(0)
+    os.close(w)
+    os.waitpid(pid, 0)
+    print(f"forked child: {os.read(r, 4096).decode()}")
+
+    hung = openai_client.OpenAIClientManager(api_key="stub", base_url=f"{base}/hang/v1")
+    started = time.perf_counter()
+    try:
+        complete(hung.get().with_options(max_retries=0))
+        outcome = "completed?!"
+    except openai.APITimeoutError:
+        outcome = "APITimeoutError"
+    print(f"hung request: {outcome} after {time.perf_counter() - started:.2f}s "
+          f"(read timeout {openai_client.OPENAI_READ_TIMEOUT}s), timeouts={hung.stats.timeouts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+A class of students entering the same PIN at once, with and without the lookup cache.
+
+    python benchmarks/bench_pin_lookup.py [--students 200] [--threads 50] [--typos 0.1] [--db-latency-ms 2]
+
+Creates a class PIN (plus --students per-student submission PINs) in a
+throwaway SQLite database, then fires one GET /api/pins/<code> per
+student from --threads threads: most enter the class PIN, their own
+submission PIN every fifth time, and a --typos share first mistype it
+three times in a row. A guessing script tries 50 wrong codes five times
+each alongside. Every SQL statement sleeps --db-latency-ms to stand in for
+a database across the network. Prints statements run, latency percentiles
+and wall time with the cache off and on.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--typos", type=float, default=0.1, help="share of students who mistype the PIN first")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="added to every SQL statement")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_pin_lookup_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+    from sqlalchemy import event
+    from models.submission_pin import SubmissionPin
+    import pins as P
+
+    db = A.db
+    rng = random.Random(7)
+    with A.app.app_context():
+        A.migrate_database()
+        class_pin = P.allocate_pins(1, 4850)[0].pin_code
+        own = [f"{900000 + i:06d}" for i in range(args.students)]
+        db.session.add_all(SubmissionPin(pin=code, class_id=4850, assignment_id=1, student_id=i)
+                           for i, code in enumerate(own))
+        db.session.commit()
+
+        statements = {"n": 0}
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def slow_statement(*_):
+            statements["n"] += 1
+            time.sleep(args.db_latency_ms / 1000)
+
+        wrong = [f"{rng.randrange(100000, 900000):06d}" for _ in range(50)]
+        plan = []
+        for i in range(args.students):
+            if rng.random() < args.typos:
+                plan += [class_pin[:-1] + str((int(class_pin[-1]) + 1) % 10)] * 3
+            plan.append(own[i] if i % 5 == 0 else class_pin)
+        plan += [code for code in wrong for _ in range(5)]
+        rng.shuffle(plan)
+        client = A.app.test_client()
+
+        def enter(code):
+            started = time.perf_counter()
+            status = client.get(f"/api/pins/{code}").status_code
+            return status, time.perf_counter() - started
+
+        for enabled in (False, True):
+            P.PIN_CACHE_ENABLED = enabled
+            P.pin_cache.invalidate()
+            statements["n"] = 0
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                results = list(pool.map(enter, plan))
+            elapsed = time.perf_counter() - started
+            latencies = [t * 1e3 for _, t in results]
+            found = sum(s == 200 for s, _ in results)
+            print(f"cache {'on ' if enabled else 'off'}  {len(plan)} lookups ({found} found)  "
+                  f"statements={statements['n']:>5}  p50={percentile(latencies, 0.5):7.2f} ms  "
+                  f"p95={percentile(latencies, 0.95):7.2f} ms  wall={elapsed:6.3f}s")
+        stats = P.pin_cache.to_dict()
+        print(f"          hits={stats['hits']} negative_hits={stats['negative_hits']} "
+              f"coalesced={stats['coalesced']} misses={stats['misses']} entries={stats['entries']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+PIN allocation at high fill ratios: the old random-and-check loop vs the allocator.
+
+    python benchmarks/bench_pins.py [--pins 2000] [--fills 0.5,0.9,0.99] [--threads 8]
+
+For each fill ratio the throwaway SQLite `pins` table is filled to that
+share of the 10^6 code space, then --pins PINs are created one per
+transaction both ways, counting SQL statements, unique-constraint
+conflicts and wall time. "allocated" fills come from the allocator itself
+(a deployment that has only ever used it); "legacy" fills are random codes
+like the ones the old loop left behind, which the allocator has to skip.
+Last, --threads threads POST /api/pins and /api/pins/bulk at the fullest
+fill and the created codes are checked for errors and duplicates.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def legacy_create(db, Pin, assignment_id: int) -> None:
+    """What POST /api/pins did before the allocator."""
+    code = "".join(random.choice("0123456789") for _ in range(6))
+    while Pin.query.filter_by(pin_code=code).first() is not None:
+        code = "".join(random.choice("0123456789") for _ in range(6))
+    db.session.add(Pin(assignment_id=assignment_id, pin_code=code))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pins", type=int, default=2000, help="PINs created per fill ratio and method")
+    parser.add_argument("--fills", default="0.5,0.9,0.99", help="comma-separated shares of the code space in use")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_pins_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+    from sqlalchemy import event
+    from sqlalchemy.exc import IntegrityError
+    import pins as P
+
+    db, Pin = A.db, P.Pin
+    stats = {"statements": 0, "conflicts": 0}
+
+    with A.app.app_context():
+        A.migrate_database()
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def count_statement(*_):
+            stats["statements"] += 1
+
+        @event.listens_for(db.engine, "handle_error")
+        def count_conflict(ctx):
+            if isinstance(ctx.sqlalchemy_exception, IntegrityError):
+                stats["conflicts"] += 1
+
+        def fill(codes, counter: int):
+            db.session.execute(Pin.__table__.delete())
+            db.session.execute(P.PinCounter.__table__.delete())
+            db.session.execute(Pin.__table__.insert(), [{"assignment_id": 0, "pin_code": c} for c in codes])
+            db.session.add(P.PinCounter(name="pins", next_value=counter))
+            db.session.commit()
+
+        def run(label, create):
+            stats.update(statements=0, conflicts=0)
+            started = time.perf_counter()
+            for _ in range(args.pins):
+                create()
+            elapsed = time.perf_counter() - started
+            print(f"  {label:<10} {elapsed:7.3f}s  {elapsed / args.pins * 1e3:7.3f} ms/pin  "
+                  f"statements/pin={stats['statements'] / args.pins:7.2f}  conflicts={stats['conflicts']}")
+            db.session.execute(Pin.__table__.delete().where(Pin.assignment_id == 1))
+            db.session.commit()
+
+        def allocate_one():
+            P.allocate_pins(1, None)
+            db.session.commit()
+
+        fills = [float(f) for f in args.fills.split(",")]
+        for f in fills:
+            used = int(P.PIN_SPACE * f)
+            for kind in ("allocated", "legacy"):
+                if kind == "allocated":
+                    fill([P.permute_pin(v) for v in range(used)], used)
+                else:
+                    fill([f"{c:06d}" for c in random.sample(range(P.PIN_SPACE), used)], 0)
+                print(f"fill {f:.0%} ({kind}, {used} codes in use)")
+                counter = db.session.get(P.PinCounter, "pins").next_value
+                run("old loop", lambda: legacy_create(db, Pin, 1))
+                db.session.execute(P.PinCounter.__table__.update().values(next_value=counter))
+                db.session.commit()
+                try:
+                    run("allocator", allocate_one)
+                except P.PinAllocationError as e:
+                    db.session.rollback()
+                    print(f"  allocator  failed: {e}")
+
+        # concurrent requests at the fullest allocator-made fill
+        used = int(P.PIN_SPACE * max(fills))
+        fill([P.permute_pin(v) for v in range(used)], used)
+        client = A.app.test_client()
+
+        def post(i):
+            if i % 10 == 0:
+                return client.post("/api/pins/bulk", json={"assignment_id": 2, "class_id": i, "count": 30})
+            return client.post("/api/pins", json={"assignment_id": 2})
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            statuses = [r.status_code for r in pool.map(post, range(200))]
+        elapsed = time.perf_counter() - started
+        codes = [c for (c,) in db.session.query(Pin.pin_code).filter(Pin.assignment_id == 2)]
+        print(f"concurrent: {len(statuses)} requests from {args.threads} threads in {elapsed:.3f}s, "
+              f"errors={sum(s != 201 for s in statuses)}, pins={len(codes)}, duplicates={len(codes) - len(set(codes))}")
+
+
+if __name__ == "__main__":
+    main()
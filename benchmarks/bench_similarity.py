@@ -0,0 +1,101 @@
+"""
+Near-duplicate search: LSH index vs comparing every pair of submissions.
+
+    python benchmarks/bench_similarity.py [--submissions 500] [--words 800] [--copies 0.05] [--threshold 0.5]
+
+Generates --submissions essays of --words random words in a throwaway
+SQLite database, a --copies share of them lightly edited copies of
+another essay (1-15% of words replaced), and indexes them all. Then finds
+the pairs at or above --threshold twice: by exact Jaccard similarity of
+every pair's shingle sets, and through the LSH index (similar_pairs and
+one similar_to per submission). Prints build and query times and the
+recall of the LSH results against the exact pairs.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=500)
+    parser.add_argument("--words", type=int, default=800, help="words per essay")
+    parser.add_argument("--copies", type=float, default=0.05, help="share of essays that are edited copies")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_similarity_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+    import similarity as S
+
+    rng = random.Random(11)
+    vocab = [f"w{i}" for i in range(20000)]
+    texts = []
+    for i in range(args.submissions):
+        if texts and rng.random() < args.copies:
+            rate = rng.uniform(0.01, 0.15)
+            texts.append(" ".join(rng.choice(vocab) if rng.random() < rate else w
+                                  for w in rng.choice(texts).split()))
+        else:
+            texts.append(" ".join(rng.choice(vocab) for _ in range(args.words)))
+
+    with A.app.app_context():
+        A.migrate_database()
+        a = A.Assignment(name="Bench", rubric="r")
+        A.db.session.add(a)
+        A.db.session.flush()
+        subs = [A.Submission(assignment_id=a.id, student_name=f"S{i}", file_path="-") for i in range(len(texts))]
+        A.db.session.add_all(subs)
+        A.db.session.flush()
+        ids = [s.id for s in subs]
+
+        started = time.perf_counter()
+        for sid, text in zip(ids, texts):
+            S.index_submission(sid, a.id, text)
+        A.db.session.commit()
+        build = time.perf_counter() - started
+        print(f"index {len(ids)} essays: {build:.2f}s ({build / len(ids) * 1e3:.1f} ms each)")
+
+        shingle_sets = {sid: S.shingles(text) for sid, text in zip(ids, texts)}
+        started = time.perf_counter()
+        exact = {}
+        for i, x in enumerate(ids):
+            sx = shingle_sets[x]
+            for y in ids[i + 1:]:
+                sy = shingle_sets[y]
+                score = len(sx & sy) / len(sx | sy)
+                if score >= args.threshold:
+                    exact[(x, y)] = score
+        brute = time.perf_counter() - started
+        n_pairs = len(ids) * (len(ids) - 1) // 2
+        print(f"all pairs, exact:       {brute:7.3f}s  {n_pairs} comparisons  {len(exact)} pairs >= {args.threshold}")
+
+        started = time.perf_counter()
+        found = {(x, y): score for x, y, score in S.similar_pairs(a.id, args.threshold)}
+        lsh = time.perf_counter() - started
+        hit = exact.keys() & found.keys()
+        print(f"similar_pairs (LSH):    {lsh:7.3f}s  {len(found)} pairs  recall={len(hit) / max(1, len(exact)):.1%}  "
+              f"not exact >= threshold: {len(found.keys() - exact.keys())}")
+        errors = [abs(found[p] - exact[p]) for p in hit]
+        if errors:
+            print(f"{'':24}mean |estimate - exact| = {sum(errors) / len(errors):.3f}")
+
+        started = time.perf_counter()
+        per_sub = {sid: S.similar_to(sid, args.threshold, limit=100) for sid in ids}
+        query = time.perf_counter() - started
+        found_one = {tuple(sorted((sid, m))) for sid, matches in per_sub.items() for m, _ in matches}
+        print(f"similar_to per essay:   {query / len(ids) * 1e3:7.2f} ms each  "
+              f"recall={len(exact.keys() & found_one) / max(1, len(exact)):.1%}  "
+              f"(exact scan per essay: {brute / len(ids) * 2e3:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Bulk ZIP import: reading every entry into memory vs staging entries one at a time.
+
+    python benchmarks/bench_zip_import.py [--files 200] [--kb 512]
+
+Builds an LMS-style ZIP of --files text submissions of --kb each (in a
+folder, with a few non-submission entries), then imports it into a
+throwaway SQLite database two ways: the naive way (ZipFile.read of every
+entry, all held in memory, then stored) and through
+POST /api/upload_submissions_zip, which decompresses one entry at a time
+into the upload store. Prints the time and peak Python memory
+(tracemalloc) of each, and checks a zip bomb is refused up front.
+"""
+import io
+import os
+import sys
+import time
+import random
+import zipfile
+import argparse
+import tempfile
+import tracemalloc
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def build_zip(files: int, kb: int) -> bytes:
+    rng = random.Random(9)
+    words = [f"w{i}" for i in range(5000)]
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("Essay 1 Downloads/", "")
+        zf.writestr("Essay 1 Downloads/index.html", "<html></html>")
+        for i in range(files):
+            text = " ".join(rng.choice(words) for _ in range(kb * 1024 // 6))
+            zf.writestr(f"Essay 1 Downloads/Essay 1_Student {i:04d}.txt", text)
+    return buf.getvalue()
+
+
+def measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--kb", type=int, default=512, help="size of each submission")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_zip_import_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{tmp}/bench.db", "UPLOAD_FOLDER": os.path.join(tmp, "uploads")})
+    import app as A  # noqa: E402  (reads the environment at import)
+    from werkzeug.datastructures import FileStorage
+
+    data = build_zip(args.files, args.kb)
+    print(f"archive: {len(data) / 2**20:.1f} MiB, {args.files} x {args.kb} KiB submissions")
+
+    with A.app.app_context():
+        A.migrate_database()
+        a = A.Assignment(name="Essay 1", rubric="r")
+        A.db.session.add(a)
+        A.db.session.commit()
+        aid = a.id
+        client = A.app.test_client()
+
+        def naive():
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                entries = {info.filename: zf.read(info) for info in zf.infolist() if not info.is_dir()}
+            created = 0
+            for name, body in entries.items():
+                name = name.rsplit("/", 1)[-1]
+                if A.allowed_file(name):
+                    A.save_and_enqueue(A.db.session.get(A.Assignment, aid), FileStorage(io.BytesIO(body), name))
+                    created += 1
+            A.db.session.commit()
+            return created
+
+        def streamed():
+            r = client.post("/api/upload_submissions_zip", content_type="multipart/form-data",
+                            data={"assignment_id": str(aid), "file": (io.BytesIO(data), "export.zip")})
+            return len(r.get_json()["created_ids"])
+
+        for label, fn in (("read all entries", naive), ("upload_submissions_zip", streamed)):
+            elapsed, peak, created = measure(fn)
+            print(f"{label:24} {elapsed:6.2f}s  peak {peak / 2**20:7.1f} MiB  {created} submissions")
+
+        bomb = io.BytesIO()
+        with zipfile.ZipFile(bomb, "w", zipfile.ZIP_DEFLATED) as zf:
+            for i in range(10):
+                zf.writestr(f"Essay 1_Bomb {i}.txt", b"\0" * (20 * 1024 * 1024))
+        bomb_kb = len(bomb.getvalue()) / 1024
+        bomb.seek(0)
+        elapsed, peak, r = measure(lambda: client.post(
+            "/api/upload_submissions_zip", content_type="multipart/form-data",
+            data={"assignment_id": str(aid), "file": (bomb, "bomb.zip")}))
+        print(f"zip bomb ({bomb_kb:.0f} KiB -> 200 MiB): HTTP {r.status_code} in "
+              f"{elapsed * 1e3:.0f} ms, peak {peak / 2**20:.1f} MiB  {r.get_json()['error']}")
+
+
+if __name__ == "__main__":
+    main()
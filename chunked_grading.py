@@ -0,0 +1,186 @@
+# chunked_grading.py
+import os
+from batch_grading import run_concurrently, add_usage, empty_usage
+
+GRADING_MODES = ("truncate", "chunk", "summarize")
+DEFAULT_GRADING_MODE = os.getenv("DEFAULT_GRADING_MODE", "truncate")
+
+# Max submission tokens per chunk sent with the rubric in chunk/summarize modes.
+GRADING_CHUNK_TOKENS = int(os.getenv("GRADING_CHUNK_TOKENS", "6000"))
+# Hard cap on submission text read for chunk/summarize modes (~100k tokens).
+CHUNKED_CHAR_BUDGET = int(os.getenv("CHUNKED_CHAR_BUDGET", "400000"))
+
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding(model: str):
+    """tiktoken encoding for the model, or None to fall back to chars/4."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # not installed, or the BPE file can't be downloaded
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str, model: str) -> int:
+    enc = _get_encoding(model)
+    if enc is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def _split_long(text: str, max_tokens: int, model: str) -> list[str]:
+    enc = _get_encoding(model)
+    if enc is None:
+        step = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    tokens = enc.encode(text, disallowed_special=())
+    return [enc.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def split_into_chunks(text: str, max_tokens: int, model: str) -> list[str]:
+    """
+    Pack whole paragraphs into chunks of at most max_tokens tokens. A single
+    paragraph longer than that is split on token boundaries.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for para in text.split("\n"):
+        n = count_tokens(para, model) + 1
+        if n > max_tokens:
+            if current:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(_split_long(para, max_tokens, model))
+            continue
+        if current_tokens + n > max_tokens and current:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(para)
+        current_tokens += n
+    if current and any(p.strip() for p in current):
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# ---------- PROMPTS ----------
+
+GRADER_SYSTEM = (
+    "You are a fair, consistent teaching assistant. "
+    "Grade student work strictly by the rubric. Be constructive and specific."
+)
+
+
+def rubric_system(rubric_text: str) -> str:
+    """
+    System message for every grading call: instructions, then the rubric.
+    It depends on nothing but the rubric, so it is byte-identical across a
+    batch and the provider can reuse its cached prefix; everything
+    per-submission goes in the user message after it.
+    """
+    return f"""{GRADER_SYSTEM}
+
+Rubric:
+\"\"\"{rubric_text}\"\"\"
+"""
+
+
+SUMMARIZER_SYSTEM = (
+    "You condense student writing for a grader. Be faithful: keep the thesis, "
+    "every main argument, the evidence and citations used, the structure, and "
+    "any notable errors. Never evaluate or improve the work."
+)
+
+
+def _chunk_prompt(chunk: str, i: int, n: int) -> str:
+    return f"""
+This is part {i} of {n} of one long student submission:
+\"\"\"{chunk}\"\"\"
+
+Assess only what appears in this part against the rubric. Return a JSON object with:
+- "notes": string listing strengths and weaknesses per rubric criterion, citing this part
+- "grade": integer 0-100 for how well this part meets the rubric
+"""
+
+
+def _merge_prompt(notes: list[str]) -> str:
+    parts = "\n\n".join(f"Part {i + 1}:\n{note}" for i, note in enumerate(notes))
+    return f"""
+A long student submission was assessed in {len(notes)} consecutive parts:
+\"\"\"{parts}\"\"\"
+
+Combine these into one assessment of the whole submission. Return a JSON object with:
+- "feedback": string with concrete, actionable comments on the submission as a whole
+- "grade": integer 0-100
+"""
+
+
+def _summary_prompt(chunk: str, i: int, n: int, max_words: int) -> str:
+    return f"""
+Part {i} of {n} of a student submission:
+\"\"\"{chunk}\"\"\"
+
+Summarize this part in at most {max_words} words. Return a JSON object with:
+- "summary": string
+"""
+
+
+# ---------- MODES ----------
+
+def grade_chunked(chat_fn, submission_text: str, rubric_text: str, model: str,
+                  chunk_tokens: int = GRADING_CHUNK_TOKENS) -> tuple[str, str, dict]:
+    """
+    Grade each chunk against the rubric in parallel (serially when already on
+    a grade_batch worker), then merge the partial assessments with one more
+    call. chat_fn(system, user) -> (dict, usage).
+    Returns (feedback, grade, usage) with usage summed over every call.
+    """
+    chunks = split_into_chunks(submission_text, chunk_tokens, model) or [""]
+    usage = empty_usage()
+    n = len(chunks)
+    system = rubric_system(rubric_text)
+    calls = [(system, _chunk_prompt(c, i + 1, n)) for i, c in enumerate(chunks)]
+
+    notes = []
+    for i, (value, error) in enumerate(run_concurrently(chat_fn, calls)):
+        if error is not None:
+            raise RuntimeError(f"chunk {i + 1}/{n} failed: {error}")
+        data, call_usage = value
+        add_usage(usage, call_usage)
+        notes.append(f"{data.get('notes', '')}\n(part grade: {data.get('grade', 'n/a')})")
+
+    data, call_usage = chat_fn(system, _merge_prompt(notes))
+    add_usage(usage, call_usage)
+    return str(data.get("feedback", "")).strip(), str(data.get("grade", "")), usage
+
+
+def summarize_chunks(chat_fn, submission_text: str, model: str,
+                     chunk_tokens: int = GRADING_CHUNK_TOKENS,
+                     target_tokens: int = GRADING_CHUNK_TOKENS) -> tuple[str, dict]:
+    """
+    Summarize chunks in parallel so the joined summaries fit target_tokens.
+    Returns (summary_text, usage).
+    """
+    chunks = split_into_chunks(submission_text, chunk_tokens, model) or [""]
+    n = len(chunks)
+    max_words = max(80, int(target_tokens * 0.75 / n))
+    calls = [(SUMMARIZER_SYSTEM, _summary_prompt(c, i + 1, n, max_words)) for i, c in enumerate(chunks)]
+
+    usage = empty_usage()
+    summaries = []
+    for i, (value, error) in enumerate(run_concurrently(chat_fn, calls)):
+        if error is not None:
+            raise RuntimeError(f"summary of part {i + 1}/{n} failed: {error}")
+        data, call_usage = value
+        add_usage(usage, call_usage)
+        summaries.append(f"[Part {i + 1} of {n}, summarized]\n{str(data.get('summary', '')).strip()}")
+    return "\n\n".join(summaries), usage
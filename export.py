@@ -0,0 +1,94 @@
+# export.py
+import io
+import os
+import csv
+import datetime
+import tempfile
+from extensions import db
+
+# Rows fetched per round trip while exporting. With psycopg, yield_per
+# also means a server-side cursor, so only this many rows are held at once.
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "500"))
+# Size of the pieces a CSV export is sent in.
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# CSV cells starting with these are formulas to Excel/Sheets; a student
+# name like "=HYPERLINK(...)" must stay text. (The XLSX writer stores
+# strings as text already.)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def xlsx_available() -> bool:
+    try:
+        import xlsxwriter  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def cell_value(value):
+    """Export value of one cell: "" for NULL, timestamps as ISO text, the rest as-is."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    return value
+
+
+def csv_cell(value):
+    """cell_value, with formula-like text quoted so spreadsheets show it as text."""
+    value = cell_value(value)
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        try:
+            float(value)        # "-5" is a number, not a formula
+        except ValueError:
+            return "'" + value
+    return value
+
+
+def stream_rows(stmt):
+    """Rows of a Core select, fetched EXPORT_YIELD_PER at a time (plain tuples, no ORM objects)."""
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+    for partition in result.partitions():
+        yield from partition
+
+
+def csv_chunks(header, rows):
+    """
+    UTF-8 CSV (with a BOM, so Excel reads accents right) in pieces of about
+    EXPORT_CHUNK_BYTES, written as rows arrive.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([csv_cell(v) for v in row])
+        if buf.tell() >= EXPORT_CHUNK_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def xlsx_file(header, rows, sheet_name: str = "Gradebook"):
+    """
+    Write rows to an .xlsx in a temporary file and return it rewound. The
+    workbook is in xlsxwriter's constant_memory mode: each row goes to disk
+    once written, so memory stays flat however many rows there are.
+    """
+    import xlsxwriter
+
+    out = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(out, {"constant_memory": True, "strings_to_formulas": False,
+                                         "strings_to_urls": False})
+    sheet = workbook.add_worksheet(sheet_name[:31])
+    sheet.write_row(0, 0, header, workbook.add_format({"bold": True}))
+    sheet.freeze_panes(1, 0)
+    for r, row in enumerate(rows, start=1):
+        sheet.write_row(r, 0, [cell_value(v) for v in row])
+    workbook.close()
+    out.seek(0)
+    return out
@@ -0,0 +1,556 @@
+# extraction.py
+import io
+import os
+import time
+import codecs
+import hashlib
+import datetime
+import threading
+import multiprocessing
+from collections import namedtuple
+from multiprocessing.connection import wait as wait_connections
+from importlib.metadata import version, PackageNotFoundError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from storage import object_digest
+from metrics import timed
+
+
+def _pkg_version(name: str) -> str:
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+# Safety limits for parsing untrusted uploads.
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "300"))         # PDF pages read per file
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "60"))            # seconds per file (pooled)
+EXTRACT_MEMORY_MB = int(os.getenv("EXTRACT_MEMORY_MB", "1024"))        # address-space cap per extractor process
+EXTRACT_POOL_WORKERS = int(os.getenv("EXTRACT_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Bump the leading number when our own parsing logic changes. Parser
+# library upgrades change the string on their own, which invalidates
+# every stored text extracted by the old version.
+EXTRACTOR_VERSION = (
+    f"2;pypdf={_pkg_version('pypdf')};python-docx={_pkg_version('python-docx')}"
+    f";max_pages={EXTRACT_MAX_PAGES}"
+)
+
+TEXT_EXTENSIONS = {"txt", "pdf", "docx", "doc"}
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+TXT_CHUNK_BYTES = 64 * 1024
+
+
+# ---------- MODEL ----------
+
+class ExtractedText(db.Model):
+    __tablename__ = "extracted_texts"
+    __table_args__ = (
+        db.UniqueConstraint("content_hash", "file_ext", "extractor_version",
+                            name="uq_extracted_texts_hash_ext_version"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)   # sha256 of file bytes
+    file_ext = db.Column(db.String(10), nullable=False)
+    extractor_version = db.Column(db.String(120), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    char_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+# ---------- PARSERS ----------
+# Each _iter_* generator yields text pieces in reading order, separators
+# included, so "".join(pieces) is the document text. Consumers can stop
+# early and the rest of the document is never parsed. pypdf, python-docx
+# and lxml are imported on first use; most processes never parse a file.
+
+def _iter_txt(stream):
+    """UTF-8, switching to latin-1 from the first undecodable chunk on."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    latin1 = False
+    for chunk in iter(lambda: stream.read(TXT_CHUNK_BYTES), b""):
+        if latin1:
+            yield chunk.decode("latin-1", errors="ignore")
+            continue
+        buffered = decoder.getstate()[0]
+        try:
+            yield decoder.decode(chunk)
+        except UnicodeDecodeError:
+            latin1 = True
+            yield (buffered + chunk).decode("latin-1", errors="ignore")
+    if not latin1:
+        try:
+            yield decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            yield decoder.getstate()[0].decode("latin-1", errors="ignore")
+
+
+def _iter_pdf(stream, max_pages: int, page_break: str = "\n"):
+    from pypdf import PdfReader
+    reader = PdfReader(stream)
+    pages = reader.pages[:max_pages] if max_pages else reader.pages
+    for i, page in enumerate(pages):
+        yield (page_break if i else "") + (page.extract_text() or "")
+
+
+def _table_lines(table):
+    for row in table.rows:
+        cells, seen = [], set()
+        for cell in row.cells:
+            # merged cells show up once per grid column they span
+            if id(cell._tc) in seen:
+                continue
+            seen.add(id(cell._tc))
+            cells.append(cell.text.strip())
+        if any(cells):
+            yield " | ".join(cells)
+
+
+def _block_lines(container):
+    """Paragraphs and tables of a body/header/footer, in document order."""
+    from docx.table import Table
+    for block in container.iter_inner_content():
+        if isinstance(block, Table):
+            yield from _table_lines(block)
+        else:
+            yield block.text
+
+
+def _note_lines(doc, reltype: str):
+    """Footnote/endnote text. python-docx has no API for these parts."""
+    from lxml import etree
+    for rel in doc.part.rels.values():
+        if rel.reltype != reltype or rel.is_external:
+            continue
+        root = etree.fromstring(rel.target_part.blob)
+        for note in root.iter(f"{W_NS}footnote", f"{W_NS}endnote"):
+            # skip the separator/continuation pseudo-notes Word always writes
+            if note.get(f"{W_NS}type") not in (None, "normal"):
+                continue
+            text = "".join(t.text or "" for t in note.iter(f"{W_NS}t")).strip()
+            if text:
+                yield text
+
+
+def _iter_docx(stream):
+    from docx import Document  # python-docx
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    doc = Document(stream)
+
+    def header_footer_lines(attr_names):
+        seen = set()
+        for section in doc.sections:
+            for name in attr_names:
+                part = getattr(section, name)
+                if part.is_linked_to_previous:
+                    continue
+                text = "\n".join(line for line in _block_lines(part) if line.strip())
+                if text and text not in seen:
+                    seen.add(text)
+                    yield text
+
+    first = True
+
+    def emit(line):
+        nonlocal first
+        piece = line if first else "\n" + line
+        first = False
+        return piece
+
+    for line in header_footer_lines(("first_page_header", "header", "even_page_header")):
+        yield emit(line)
+    for line in _block_lines(doc):
+        yield emit(line)
+    for line in _note_lines(doc, RT.FOOTNOTES):
+        yield emit(line)
+    for line in _note_lines(doc, RT.ENDNOTES):
+        yield emit(line)
+    for line in header_footer_lines(("first_page_footer", "footer", "even_page_footer")):
+        yield emit(line)
+
+
+def iter_document_text(stream, ext: str, max_pages: int = EXTRACT_MAX_PAGES, page_break: str = "\n"):
+    """Yield the text of a binary stream piece by piece (see _iter_*)."""
+    if ext == "txt":
+        return _iter_txt(stream)
+    if ext == "pdf":
+        return _iter_pdf(stream, max_pages, page_break)
+    if ext in ("docx", "doc"):
+        return _iter_docx(stream)
+    return iter(())
+
+
+def read_text(stream, ext: str, max_chars: int | None = None,
+              max_pages: int = EXTRACT_MAX_PAGES, page_break: str = "\n") -> tuple[str, bool]:
+    """
+    Pull text from iter_document_text until max_chars is reached.
+    Returns (text, complete); complete is False when the budget cut it off.
+    """
+    pieces, n = [], 0
+    gen = iter_document_text(stream, ext, max_pages, page_break)
+    try:
+        for piece in gen:
+            if max_chars is not None and n + len(piece) > max_chars:
+                pieces.append(piece[: max_chars - n])
+                return "".join(pieces), False
+            pieces.append(piece)
+            n += len(piece)
+    finally:
+        if hasattr(gen, "close"):
+            gen.close()
+    return "".join(pieces), True
+
+
+def parse_document(data: bytes, ext: str, max_pages: int = EXTRACT_MAX_PAGES) -> str:
+    """Turn raw file bytes into plain text. No caching, no budget."""
+    return read_text(io.BytesIO(data), ext, max_pages=max_pages)[0]
+
+
+def parse_path(path: str, max_chars: int | None = None,
+               max_pages: int = EXTRACT_MAX_PAGES) -> tuple[str, bool]:
+    with open(path, "rb") as f:
+        return read_text(f, file_ext(path), max_chars, max_pages)
+
+
+# ---------- PROCESS POOL ----------
+# pypdf is pure Python and CPU-bound, so a batch of files is parsed in
+# separate processes. Worker processes outlive the batch: idle ones are
+# kept per process (of the app) and reused by the next parse_files call,
+# so only the first call pays for spawning them. A worker is killed and
+# replaced only when a file overruns its timeout or blows the memory cap,
+# without losing the rest of the batch.
+
+Parsed = namedtuple("Parsed", ["text", "error", "complete"])
+
+
+def _limit_memory(memory_mb: int) -> None:
+    if not memory_mb:
+        return
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _extract_worker(conn, memory_mb: int, max_pages: int) -> None:
+    _limit_memory(memory_mb)
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        path, max_chars = task
+        try:
+            text, complete = parse_path(path, max_chars, max_pages)
+            conn.send(Parsed(text, None, complete))
+        except MemoryError:
+            conn.send(Parsed(None, f"out of memory (limit {memory_mb}MB)", False))
+        except Exception as e:
+            conn.send(Parsed(None, f"{e.__class__.__name__}: {e}", False))
+
+
+class _ExtractProcess:
+    def __init__(self, ctx, memory_mb: int, max_pages: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(
+            target=_extract_worker, args=(child_conn, memory_mb, max_pages), daemon=True
+        )
+        self.proc.start()
+        child_conn.close()
+        self.index = None
+        self.deadline = None
+
+    def send(self, index: int, path: str, max_chars: int | None, timeout: float) -> None:
+        self.index = index
+        self.deadline = time.monotonic() + timeout
+        self.conn.send((path, max_chars))
+
+    def kill(self) -> None:
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.proc.join(timeout=1)
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.conn.close()
+
+
+# Idle extractor processes between parse_files calls, keyed by the
+# (memory_mb, max_pages) they were started with. Forgotten in a forked
+# child, whose pipes to them belong to the parent.
+_idle_lock = threading.Lock()
+_idle_pid = None
+_idle_workers: dict[tuple[int, int], list[_ExtractProcess]] = {}
+
+
+def _take_workers(ctx, n: int, memory_mb: int, max_pages: int) -> list[_ExtractProcess]:
+    """n workers: idle ones that are still alive first, then new ones."""
+    global _idle_pid
+    taken, dead = [], []
+    with _idle_lock:
+        if _idle_pid != os.getpid():
+            _idle_pid = os.getpid()
+            _idle_workers.clear()
+        pool = _idle_workers.setdefault((memory_mb, max_pages), [])
+        while pool and len(taken) < n:
+            worker = pool.pop()
+            (taken if worker.proc.is_alive() else dead).append(worker)
+    for worker in dead:
+        worker.kill()
+    return taken + [_ExtractProcess(ctx, memory_mb, max_pages) for _ in range(n - len(taken))]
+
+
+def _return_workers(workers: list[_ExtractProcess], keep: int, memory_mb: int, max_pages: int) -> None:
+    """Put workers back in the idle pool, closing any beyond `keep` idle ones."""
+    extra = []
+    with _idle_lock:
+        pool = _idle_workers.setdefault((memory_mb, max_pages), []) if _idle_pid == os.getpid() else []
+        for worker in workers:
+            (pool if len(pool) < keep else extra).append(worker)
+    for worker in extra:
+        worker.close()
+
+
+def parse_files(paths, max_chars: int | None = None, workers: int = EXTRACT_POOL_WORKERS,
+                timeout: float = EXTRACT_TIMEOUT, max_pages: int = EXTRACT_MAX_PAGES,
+                memory_mb: int = EXTRACT_MEMORY_MB) -> list[Parsed]:
+    """
+    Parse many files across a pool of processes (no caching).
+
+    Returns a Parsed(text, error, complete) per path, in input order. A file
+    that runs past `timeout` seconds or kills its process (e.g. by hitting
+    the memory cap) gets an error, and its process is replaced. Processes
+    are reused across calls (at most `workers` are kept idle).
+    workers=0 parses inline in this process without limits.
+    """
+    paths = list(paths)
+    results = [Parsed(None, None, False)] * len(paths)
+    if workers <= 0:
+        for i, path in enumerate(paths):
+            try:
+                text, complete = parse_path(path, max_chars, max_pages)
+                results[i] = Parsed(text, None, complete)
+            except Exception as e:
+                results[i] = Parsed(None, f"{e.__class__.__name__}: {e}", False)
+        return results
+
+    ctx = multiprocessing.get_context("spawn")   # safe from threaded web workers
+    pending = list(enumerate(paths))
+    pending.reverse()
+    idle = _take_workers(ctx, min(workers, len(paths)), memory_mb, max_pages)
+    busy = {}
+    try:
+        while pending or busy:
+            while pending and idle:
+                i, path = pending.pop()
+                worker = idle.pop()
+                try:
+                    worker.send(i, path, max_chars, timeout)
+                except OSError:   # died while idle: retry the file on a new one
+                    worker.kill()
+                    pending.append((i, path))
+                    idle.append(_ExtractProcess(ctx, memory_mb, max_pages))
+                    continue
+                busy[worker.conn] = worker
+
+            soonest = min(w.deadline for w in busy.values())
+            ready = wait_connections(list(busy), timeout=max(0.0, soonest - time.monotonic()))
+
+            for conn in ready:
+                worker = busy.pop(conn)
+                try:
+                    results[worker.index] = conn.recv()
+                    idle.append(worker)
+                except (EOFError, OSError):
+                    results[worker.index] = Parsed(None, "extractor process died (memory limit or crash)", False)
+                    worker.kill()
+                    if pending:
+                        idle.append(_ExtractProcess(ctx, memory_mb, max_pages))
+
+            now = time.monotonic()
+            for conn, worker in list(busy.items()):
+                if worker.deadline <= now:
+                    busy.pop(conn)
+                    results[worker.index] = Parsed(None, f"extraction timed out after {timeout:g}s", False)
+                    worker.kill()
+                    if pending:
+                        idle.append(_ExtractProcess(ctx, memory_mb, max_pages))
+    finally:
+        _return_workers(idle, workers, memory_mb, max_pages)
+        for worker in busy.values():
+            worker.kill()
+    return results
+
+
+# ---------- STORE ----------
+# A complete text is stored under EXTRACTOR_VERSION. Text cut short by a
+# character budget is stored under EXTRACTOR_VERSION + ";max_chars=N", so
+# it's only reused for that same budget; a complete text serves any budget.
+
+def _version_key(complete: bool, max_chars: int | None) -> str:
+    if complete or max_chars is None:
+        return EXTRACTOR_VERSION
+    return f"{EXTRACTOR_VERSION};max_chars={max_chars}"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def lookup_text(digest: str, ext: str, max_chars: int | None = None) -> str | None:
+    versions = {_version_key(True, None), _version_key(False, max_chars)}
+    rows = (
+        db.session.query(ExtractedText.extractor_version, ExtractedText.text)
+        .filter(
+            ExtractedText.content_hash == digest,
+            ExtractedText.file_ext == ext,
+            ExtractedText.extractor_version.in_(versions),
+        )
+        .all()
+    )
+    found = dict(rows)
+    if EXTRACTOR_VERSION in found:
+        text = found[EXTRACTOR_VERSION]
+        return text[:max_chars] if max_chars is not None else text
+    return found.get(_version_key(False, max_chars))
+
+
+def store_text(digest: str, ext: str, text: str, complete: bool = True,
+               max_chars: int | None = None) -> None:
+    """
+    Save extracted text on its own connection so it never commits (or gets
+    rolled back with) whatever the caller has pending in db.session.
+    Entries from older extractor versions for the same file are dropped.
+    """
+    table = ExtractedText.__table__
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(
+                table.delete().where(
+                    (table.c.content_hash == digest)
+                    & (table.c.file_ext == ext)
+                    & ~table.c.extractor_version.startswith(EXTRACTOR_VERSION)
+                )
+            )
+            conn.execute(insert(table).values(
+                content_hash=digest,
+                file_ext=ext,
+                extractor_version=_version_key(complete, max_chars),
+                text=text,
+                char_count=len(text),
+                created_at=datetime.datetime.utcnow(),
+            ))
+    except IntegrityError:
+        # another worker extracted the same bytes first
+        pass
+
+
+def file_ext(filename: str) -> str:
+    return os.path.splitext(filename or "")[1].lstrip(".").lower()
+
+
+def file_digest(file_path: str) -> str:
+    digest = object_digest(file_path)
+    if digest is not None:
+        # content-addressed upload: the name is the hash, no need to re-read
+        return digest
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@timed("extract_text")
+def extract_text(file_path: str, max_chars: int | None = None) -> str:
+    """
+    Text of a stored upload, read through the extracted-text store.
+    With max_chars, parsing stops as soon as that many characters are
+    collected (later PDF pages are never touched).
+    """
+    ext = file_ext(file_path)
+    if ext not in TEXT_EXTENSIONS:
+        return ""
+    digest = file_digest(file_path)
+    cached = lookup_text(digest, ext, max_chars)
+    if cached is not None:
+        return cached
+    text, complete = parse_path(file_path, max_chars)
+    store_text(digest, ext, text, complete, max_chars)
+    return text
+
+
+@timed("extract_many")
+def extract_many(file_paths, max_chars: int | None = None) -> list[tuple[str | None, str | None]]:
+    """
+    Batch version of extract_text: stored texts are returned directly and
+    the misses are parsed in the process pool, then stored.
+    Returns [(text, error)] in input order.
+    """
+    file_paths = list(file_paths)
+    results = [("", None)] * len(file_paths)
+    misses = []   # (index, path, digest, ext)
+    for i, path in enumerate(file_paths):
+        ext = file_ext(path)
+        if ext not in TEXT_EXTENSIONS:
+            continue
+        try:
+            digest = file_digest(path)
+        except OSError as e:
+            results[i] = (None, str(e))
+            continue
+        cached = lookup_text(digest, ext, max_chars)
+        if cached is not None:
+            results[i] = (cached, None)
+        else:
+            misses.append((i, path, digest, ext))
+
+    # Parse each distinct (bytes, type) once even if several paths share it
+    unique = {}
+    for i, path, digest, ext in misses:
+        unique.setdefault((digest, ext), path)
+    parsed = dict(zip(unique, parse_files(list(unique.values()), max_chars=max_chars)))
+    for key, result in parsed.items():
+        if result.error is None:
+            store_text(key[0], key[1], result.text, result.complete, max_chars)
+    for i, _, digest, ext in misses:
+        result = parsed[(digest, ext)]
+        results[i] = (result.text, result.error)
+    return results
+
+
+def extract_rubric_from_upload(file_storage):
+    """
+    Return plain text from an uploaded rubric file (PDF, DOCX, or TXT).
+    Expects a Werkzeug FileStorage object (request.files[...] item).
+    """
+    if not file_storage:
+        return ""
+
+    ext = file_ext(file_storage.filename)
+    data = file_storage.read()
+
+    # Anything that isn't PDF/DOCX/DOC is treated as plain text
+    if ext not in ("pdf", "docx", "doc"):
+        ext = "txt"
+    if ext == "pdf":
+        # rubric pages stay a blank line apart; stored texts join pages
+        # with a single newline, so they aren't shared with submissions
+        return read_text(io.BytesIO(data), ext, page_break="\n\n")[0].strip()
+    digest = content_hash(data)
+    text = lookup_text(digest, ext)
+    if text is None:
+        text = parse_document(data, ext)
+        store_text(digest, ext, text)
+    return text.strip()
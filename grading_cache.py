@@ -0,0 +1,226 @@
+# grading_cache.py
+import os
+import json
+import hashlib
+import datetime
+import unicodedata
+from flask import Blueprint, jsonify
+from sqlalchemy import update, bindparam, event
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from batch_grading import empty_usage
+
+bp = Blueprint("grading_cache", __name__)
+
+GRADING_CACHE_TTL_DAYS = float(os.getenv("GRADING_CACHE_TTL_DAYS", "30"))
+GRADING_CACHE_MAX_ENTRIES = int(os.getenv("GRADING_CACHE_MAX_ENTRIES", "5000"))
+GRADING_CACHE_ENABLED = os.getenv("GRADING_CACHE_ENABLED", "1") not in ("0", "false", "False")
+
+
+# ---------- MODELS ----------
+
+class GradingCacheEntry(db.Model):
+    __tablename__ = "grading_cache"
+
+    key = db.Column(db.String(64), primary_key=True)   # sha256 hex
+    model = db.Column(db.String(80), nullable=False)
+    prompt_version = db.Column(db.String(40), nullable=False)
+    feedback = db.Column(db.Text, nullable=False)
+    grade = db.Column(db.String(20), nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+    last_used_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+class GradingCacheStats(db.Model):
+    """Single-row hit/miss counters shared by every process."""
+    __tablename__ = "grading_cache_stats"
+
+    id = db.Column(db.Integer, primary_key=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    misses = db.Column(db.Integer, nullable=False, default=0)
+    bypasses = db.Column(db.Integer, nullable=False, default=0)
+    evictions = db.Column(db.Integer, nullable=False, default=0)
+
+
+# ---------- HELPERS ----------
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and collapse whitespace so trivial re-saves still match."""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.split())
+
+
+def cache_key(submission_text: str, rubric_text: str, model: str, prompt_version: str) -> str:
+    payload = json.dumps(
+        [normalize_text(submission_text), (rubric_text or "").strip(), model, prompt_version],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Counters and hit bookkeeping wait in session.info until the caller's
+# transaction ends, then go out on a connection of their own: the cache
+# never commits or rolls back the caller's transaction, and no write lock
+# of ours is held while it goes on grading.
+def _pending() -> dict:
+    return db.session.info.setdefault("grading_cache", {"counts": {}, "hits": {}})
+
+
+def _bump(**counts):
+    totals = _pending()["counts"]
+    for name, n in counts.items():
+        totals[name] = totals.get(name, 0) + n
+
+
+def _write_counts(conn, counts: dict) -> None:
+    table = GradingCacheStats.__table__
+    updated = conn.execute(
+        update(table).where(table.c.id == 1).values(
+            {name: getattr(table.c, name) + n for name, n in counts.items()}
+        )
+    ).rowcount
+    if not updated:
+        row = {"id": 1, "hits": 0, "misses": 0, "bypasses": 0, "evictions": 0}
+        row.update(counts)
+        conn.execute(table.insert().values(**row))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _flush_pending(session, transaction):
+    if transaction.parent is not None or "grading_cache" not in session.info:
+        return
+    pending = session.info.pop("grading_cache")
+    if not pending["counts"] and not pending["hits"]:
+        return
+    table = GradingCacheEntry.__table__
+    try:
+        with db.engine.begin() as conn:
+            if pending["counts"]:
+                _write_counts(conn, pending["counts"])
+            if pending["hits"]:
+                conn.execute(
+                    update(table).where(table.c.key == bindparam("k")).values(
+                        hits=table.c.hits + bindparam("n"), last_used_at=bindparam("at"),
+                    ),
+                    [{"k": k, "n": n, "at": at} for k, (n, at) in pending["hits"].items()],
+                )
+    except Exception:
+        # statistics and LRU order only; never fail the caller's commit over them
+        pass
+
+
+def _expired(entry: GradingCacheEntry, now: datetime.datetime) -> bool:
+    return entry.created_at < now - datetime.timedelta(days=GRADING_CACHE_TTL_DAYS)
+
+
+def lookup(key: str) -> tuple[str, str] | None:
+    """Return cached (feedback, grade) for key, or None on miss/expiry. Writes nothing now."""
+    now = datetime.datetime.utcnow()
+    entry = db.session.get(GradingCacheEntry, key)
+    if entry is None or _expired(entry, now):
+        _bump(misses=1)
+        return None
+    hits = _pending()["hits"]
+    hits[key] = (hits.get(key, (0, now))[0] + 1, now)
+    _bump(hits=1)
+    return entry.feedback, entry.grade
+
+
+def store(key: str, model: str, prompt_version: str, feedback: str, grade: str) -> None:
+    """
+    Add or refresh an entry in the caller's transaction, inside a savepoint:
+    a concurrent writer of the same key only undoes this entry, never the
+    caller's own work. The caller commits.
+    """
+    now = datetime.datetime.utcnow()
+    table = GradingCacheEntry.__table__
+    values = {"model": model, "prompt_version": prompt_version, "feedback": feedback, "grade": grade,
+              "created_at": now, "last_used_at": now}
+    try:
+        # write first, read never: SQLite can't upgrade a read lock while
+        # another worker writes, but it does wait for a write lock
+        with db.session.begin_nested():
+            if not db.session.execute(update(table).where(table.c.key == key).values(**values)).rowcount:
+                db.session.execute(table.insert().values(key=key, hits=0, **values))
+    except IntegrityError:
+        # a concurrent writer stored the same key; theirs is as good as ours
+        return
+    evict()
+
+
+def record_bypass() -> None:
+    _bump(bypasses=1)
+
+
+def evict() -> int:
+    """
+    Drop entries past the TTL, then least-recently-used entries beyond
+    GRADING_CACHE_MAX_ENTRIES, in the caller's transaction. Returns the
+    number removed.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=GRADING_CACHE_TTL_DAYS)
+    removed = GradingCacheEntry.query.filter(GradingCacheEntry.created_at < cutoff).delete(
+        synchronize_session=False
+    )
+
+    overflow = GradingCacheEntry.query.count() - GRADING_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        lru_keys = [
+            k for (k,) in db.session.query(GradingCacheEntry.key)
+            .order_by(GradingCacheEntry.last_used_at.asc())
+            .limit(overflow)
+        ]
+        removed += GradingCacheEntry.query.filter(GradingCacheEntry.key.in_(lru_keys)).delete(
+            synchronize_session=False
+        )
+    if removed:
+        _bump(evictions=removed)
+    return removed
+
+
+def cached_grade(grade_fn, submission_text: str, rubric_text: str, model: str,
+                 prompt_version: str, force: bool = False) -> tuple[str, str, dict]:
+    """
+    Read-through wrapper around grade_fn(submission_text, rubric_text), which
+    returns (feedback, grade, usage). A hit returns zero usage.
+
+    force=True skips the lookup (a deliberate regrade) but still refreshes the
+    stored result. Results with a "Pending" grade are never cached.
+    """
+    if not GRADING_CACHE_ENABLED:
+        return grade_fn(submission_text, rubric_text)
+
+    key = cache_key(submission_text, rubric_text, model, prompt_version)
+    if force:
+        record_bypass()
+    else:
+        hit = lookup(key)
+        if hit is not None:
+            return hit[0], hit[1], empty_usage()
+
+    feedback, grade, usage = grade_fn(submission_text, rubric_text)
+    if grade and grade != "Pending":
+        store(key, model, prompt_version, feedback, grade)
+    return feedback, grade, usage
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/grading_cache/stats", methods=["GET"])
+def grading_cache_stats():
+    stats = db.session.get(GradingCacheStats, 1)
+    hits = stats.hits if stats else 0
+    misses = stats.misses if stats else 0
+    return jsonify({
+        "enabled": GRADING_CACHE_ENABLED,
+        "entries": GradingCacheEntry.query.count(),
+        "max_entries": GRADING_CACHE_MAX_ENTRIES,
+        "ttl_days": GRADING_CACHE_TTL_DAYS,
+        "hits": hits,
+        "misses": misses,
+        "bypasses": stats.bypasses if stats else 0,
+        "evictions": stats.evictions if stats else 0,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+    }), 200
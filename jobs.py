@@ -0,0 +1,428 @@
+# jobs.py
+import os
+import json
+import time
+import socket
+import datetime
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import and_, or_, func, update
+from extensions import db
+
+bp = Blueprint("jobs", __name__)
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "15"))    # seconds
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "900"))     # seconds
+# A "running" job whose worker hasn't finished it in this long is assumed
+# to belong to a dead worker and becomes claimable again.
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+# Progress streams poll the queue this often, send a keep-alive comment
+# when idle this long (below typical 30-60s proxy idle timeouts), and end
+# after JOB_STREAM_MAX_SECONDS so a forgotten tab doesn't hold a thread.
+JOB_STREAM_POLL_SECONDS = float(os.getenv("JOB_STREAM_POLL_SECONDS", "1"))
+JOB_STREAM_HEARTBEAT_SECONDS = float(os.getenv("JOB_STREAM_HEARTBEAT_SECONDS", "15"))
+JOB_STREAM_MAX_SECONDS = float(os.getenv("JOB_STREAM_MAX_SECONDS", "900"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# What a running job is doing right now (GradingJob.phase)
+PHASE_EXTRACTING = "extracting"
+PHASE_GRADING = "grading"
+
+
+# ---------- MODEL ----------
+
+class GradingJob(db.Model):
+    __tablename__ = "grading_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    submission_id = db.Column(db.Integer, db.ForeignKey("submissions.id"), nullable=False, index=True)
+    assignment_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default=STATUS_QUEUED, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=JOB_MAX_ATTEMPTS)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    locked_by = db.Column(db.String(120), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    phase = db.Column(db.String(20), nullable=True)
+    extracted_at = db.Column(db.DateTime, nullable=True)  # grading phase began
+
+    @property
+    def state(self) -> str:
+        """queued | extracting | grading | done | error, as shown to clients."""
+        if self.status == STATUS_DONE:
+            return "done"
+        if self.status == STATUS_FAILED:
+            return "error"
+        if self.status == STATUS_RUNNING:
+            return self.phase or PHASE_EXTRACTING
+        return "queued"
+
+    def timings(self) -> dict:
+        def secs(a, b):
+            return round((b - a).total_seconds(), 3) if a and b else None
+        end = self.finished_at if self.status in (STATUS_DONE, STATUS_FAILED) else None
+        return {
+            "queued_seconds": secs(self.created_at, self.started_at),
+            "extract_seconds": secs(self.started_at, self.extracted_at),
+            "grade_seconds": secs(self.extracted_at, end),
+            "total_seconds": secs(self.created_at, end),
+        }
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "submission_id": self.submission_id,
+            "assignment_id": self.assignment_id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "run_after": self.run_after.isoformat() if self.run_after else None,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "state": self.state,
+            "timings": self.timings(),
+        }
+
+
+# ---------- QUEUE ----------
+
+def enqueue_job(submission_id: int, assignment_id: int) -> GradingJob:
+    """
+    Add a grading job for a submission. Caller commits.
+    """
+    job = GradingJob(
+        submission_id=submission_id,
+        assignment_id=assignment_id,
+        status=STATUS_QUEUED,
+        run_after=datetime.datetime.utcnow(),
+    )
+    db.session.add(job)
+    return job
+
+
+def claim_next_job(worker_id: str) -> GradingJob | None:
+    """
+    Atomically claim the next runnable job for this worker.
+
+    Candidates are queued jobs whose backoff has expired, plus running jobs
+    whose lease ran out. The claim itself is a conditional UPDATE on the old
+    status/lock, so two workers racing for the same row can't both win
+    (works on Postgres and SQLite alike).
+    """
+    now = datetime.datetime.utcnow()
+    stale = now - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+
+    runnable = or_(
+        and_(GradingJob.status == STATUS_QUEUED, GradingJob.run_after <= now),
+        and_(GradingJob.status == STATUS_RUNNING, GradingJob.locked_at < stale),
+    )
+
+    for _ in range(5):
+        candidate = (
+            db.session.query(GradingJob.id, GradingJob.status, GradingJob.locked_at)
+            .filter(runnable)
+            .order_by(GradingJob.run_after.asc(), GradingJob.id.asc())
+            .first()
+        )
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        jid, old_status, old_locked_at = candidate
+        cond = [GradingJob.id == jid, GradingJob.status == old_status]
+        if old_locked_at is None:
+            cond.append(GradingJob.locked_at.is_(None))
+        else:
+            cond.append(GradingJob.locked_at == old_locked_at)
+
+        updated = (
+            GradingJob.query.filter(*cond)
+            .update(
+                {
+                    "status": STATUS_RUNNING,
+                    "locked_by": worker_id,
+                    "locked_at": now,
+                    "started_at": now,
+                    "phase": PHASE_EXTRACTING,
+                    "extracted_at": None,
+                    "attempts": GradingJob.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.session.commit()
+        if updated == 1:
+            return db.session.get(GradingJob, jid)
+        # someone else got it first; look again
+
+    return None
+
+
+def claim_jobs(worker_id: str, limit: int) -> list[GradingJob]:
+    """Claim up to `limit` jobs, stopping early when the queue runs dry."""
+    claimed = []
+    while len(claimed) < limit:
+        job = claim_next_job(worker_id)
+        if job is None:
+            break
+        claimed.append(job)
+    return claimed
+
+
+def set_phase(job_ids, phase: str) -> None:
+    """
+    Record what running jobs are doing, on its own connection so progress
+    streams see it at once without committing the worker's session.
+    """
+    job_ids = list(job_ids)
+    if not job_ids:
+        return
+    values = {"phase": phase}
+    if phase == PHASE_GRADING:
+        values["extracted_at"] = datetime.datetime.utcnow()
+    table = GradingJob.__table__
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(table)
+            .where(table.c.id.in_(job_ids) & (table.c.status == STATUS_RUNNING))
+            .values(**values)
+        )
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff: base, 2*base, 4*base, ... capped at JOB_BACKOFF_MAX."""
+    return min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * (2 ** max(0, attempts - 1)))
+
+
+def mark_done(job: GradingJob) -> None:
+    job.status = STATUS_DONE
+    job.phase = None
+    job.finished_at = datetime.datetime.utcnow()
+    job.locked_by = None
+    job.locked_at = None
+    job.last_error = None
+
+
+def mark_failed(job: GradingJob, error: str) -> bool:
+    """
+    Record a failed attempt. Re-queues with backoff while attempts remain.
+    Returns True if the job will be retried, False if it's given up.
+    """
+    now = datetime.datetime.utcnow()
+    job.last_error = error
+    job.phase = None
+    job.locked_by = None
+    job.locked_at = None
+    if job.attempts < job.max_attempts:
+        job.status = STATUS_QUEUED
+        job.run_after = now + datetime.timedelta(seconds=backoff_seconds(job.attempts))
+        return True
+    job.status = STATUS_FAILED
+    job.finished_at = now
+    return False
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(handler, on_give_up=None, batch_size: int = 1,
+               poll_interval: float = 2.0, once: bool = False, logger=None, on_tick=None) -> int:
+    """
+    Pull jobs forever (or until the queue is empty when once=True).
+
+    Up to batch_size jobs are claimed at a time and passed to handler(jobs),
+    which does the real work and returns a list lined up with jobs holding
+    None for success or an error message. Failed jobs are re-queued with
+    backoff; once attempts run out the job is marked failed and
+    on_give_up(job, error) gets a chance to record it on the submission.
+    on_tick(), if given, runs before every claim for periodic work (OpenAI
+    batches); an exception from it is logged and never stops the worker.
+    Returns the number of jobs processed.
+    """
+    worker_id = default_worker_id()
+    processed = 0
+    while True:
+        if on_tick is not None:
+            try:
+                on_tick()
+            except Exception as e:
+                db.session.rollback()
+                if logger:
+                    logger.warning("worker tick failed: %s", e)
+        jobs = claim_jobs(worker_id, max(1, batch_size))
+        if not jobs:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        job_ids = [j.id for j in jobs]
+        try:
+            errors = handler(jobs)
+        except Exception as e:
+            db.session.rollback()
+            errors = [str(e)] * len(job_ids)
+
+        for jid, error in zip(job_ids, errors):
+            job = db.session.get(GradingJob, jid)
+            if job is None:
+                # submission (and its job) was deleted mid-flight
+                continue
+            if error is None:
+                mark_done(job)
+                continue
+            retrying = mark_failed(job, error)
+            if not retrying and on_give_up:
+                on_give_up(job, error)
+            if logger:
+                logger.warning(
+                    "grading job %s failed (attempt %s/%s, %s): %s",
+                    job.id, job.attempts, job.max_attempts,
+                    "retrying" if retrying else "giving up", error,
+                )
+        db.session.commit()
+        processed += len(job_ids)
+
+
+# ---------- PROGRESS STREAM ----------
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def job_events(job_ids, poll: float | None = None, heartbeat: float | None = None,
+               max_seconds: float | None = None):
+    """
+    Generator of Server-Sent Events for the given jobs: the current state of
+    each job first, then one event per state change (queued, extracting,
+    grading, done, error) with timings, keep-alive comments while nothing
+    changes, and a final "end" event once every job is done or failed.
+    A reconnecting client simply gets the snapshot again.
+    """
+    poll = JOB_STREAM_POLL_SECONDS if poll is None else poll
+    heartbeat = JOB_STREAM_HEARTBEAT_SECONDS if heartbeat is None else heartbeat
+    max_seconds = JOB_STREAM_MAX_SECONDS if max_seconds is None else max_seconds
+    job_ids = list(job_ids)
+    seen = {}   # job id -> (state, attempts)
+    started = last_sent = time.monotonic()
+
+    while True:
+        jobs = GradingJob.query.filter(GradingJob.id.in_(job_ids)).all()
+        for job in jobs:
+            key = (job.state, job.attempts)
+            if seen.get(job.id) != key:
+                seen[job.id] = key
+                last_sent = time.monotonic()
+                yield sse_event(job.state, job.to_dict())
+        finished = all(job.state in ("done", "error") for job in jobs)
+        # end the read transaction so the next poll sees new commits
+        db.session.rollback()
+
+        if finished or time.monotonic() - started > max_seconds:
+            counts = {}
+            for state, _ in seen.values():
+                counts[state] = counts.get(state, 0) + 1
+            yield sse_event("end", {"counts": counts, "complete": finished})
+            return
+        if time.monotonic() - last_sent >= heartbeat:
+            last_sent = time.monotonic()
+            yield ": keep-alive\n\n"
+        time.sleep(poll)
+
+
+def event_stream_response(events) -> Response:
+    """text/event-stream response that proxies (nginx, Render) won't buffer."""
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def wants_event_stream() -> bool:
+    return "text/event-stream" in request.headers.get("Accept", "") or request.args.get("stream") == "1"
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/jobs/<int:jid>", methods=["GET"])
+def get_job(jid):
+    job = db.session.get(GradingJob, jid)
+    if not job:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@bp.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    """
+    Look up several jobs at once: /api/jobs?ids=1,2,3
+    """
+    raw = request.args.get("ids", "")
+    try:
+        ids = [int(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+    if not ids:
+        return jsonify({"error": "ids is required"}), 400
+
+    jobs = GradingJob.query.filter(GradingJob.id.in_(ids)).all()
+    return jsonify([j.to_dict() for j in jobs]), 200
+
+
+@bp.route("/api/jobs/stream", methods=["GET"])
+def stream_jobs():
+    """
+    Server-Sent Events with the progress of several jobs:
+    /api/jobs/stream?ids=1,2,3 (works with a plain EventSource).
+    """
+    raw = request.args.get("ids", "")
+    try:
+        ids = [int(x) for x in raw.split(",") if x.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+    if not ids:
+        return jsonify({"error": "ids is required"}), 400
+    return event_stream_response(job_events(ids))
+
+
+@bp.route("/api/assignments/<int:aid>/jobs/stream", methods=["GET"])
+def stream_assignment_jobs(aid):
+    """Server-Sent Events for every unfinished job of an assignment."""
+    ids = [
+        jid for (jid,) in db.session.query(GradingJob.id).filter(
+            GradingJob.assignment_id == aid,
+            GradingJob.status.in_((STATUS_QUEUED, STATUS_RUNNING)),
+        )
+    ]
+    return event_stream_response(job_events(ids))
+
+
+@bp.route("/api/assignments/<int:aid>/jobs", methods=["GET"])
+def assignment_job_status(aid):
+    """
+    Per-status counts for an assignment, e.g. {"queued": 12, "done": 28}.
+    """
+    rows = (
+        db.session.query(GradingJob.status, func.count(GradingJob.id))
+        .filter(GradingJob.assignment_id == aid)
+        .group_by(GradingJob.status)
+        .all()
+    )
+    counts = {status: n for status, n in rows}
+    return jsonify({
+        "assignment_id": aid,
+        "counts": counts,
+        "pending": counts.get(STATUS_QUEUED, 0) + counts.get(STATUS_RUNNING, 0),
+    }), 200
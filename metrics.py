@@ -0,0 +1,230 @@
+# metrics.py
+import os
+import time
+import functools
+import threading
+from contextlib import contextmanager
+from flask import Blueprint, Response, current_app, g, request, has_app_context
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+bp = Blueprint("metrics", __name__)
+
+# Request latency, SQL per request and time in extraction/grading, served
+# in the Prometheus text format at /api/metrics.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False")
+# gunicorn runs several worker processes and a scrape reaches just one of
+# them. With this set (to a directory emptied before the workers start),
+# every worker writes its samples there and /api/metrics sums them all;
+# without it the numbers are the answering worker's only.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or None
+# Requests slower than this many seconds are logged with their SQL and span
+# breakdown; 0 turns the log off.
+METRICS_SLOW_REQUEST_SECONDS = float(os.getenv("METRICS_SLOW_REQUEST_SECONDS", "0"))
+METRICS_SLOW_LOG_SPANS = 50
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+# our own registry: the default one also collects process/platform metrics,
+# which mean nothing summed over workers
+REGISTRY = CollectorRegistry()
+
+REQUEST_SECONDS = Histogram(
+    "virtualta_http_request_duration_seconds", "Time to handle a request, until its body is sent.",
+    ("method", "route", "status"), buckets=LATENCY_BUCKETS, registry=REGISTRY)
+REQUEST_QUERIES = Histogram(
+    "virtualta_http_request_db_queries", "SQL statements run by one request.",
+    ("method", "route"), buckets=COUNT_BUCKETS, registry=REGISTRY)
+REQUEST_QUERY_SECONDS = Histogram(
+    "virtualta_http_request_db_seconds", "Time one request spent in SQL statements.",
+    ("method", "route"), buckets=LATENCY_BUCKETS, registry=REGISTRY)
+QUERY_SECONDS = Histogram(
+    "virtualta_db_query_duration_seconds", "Time of one SQL statement (route is empty outside requests).",
+    ("route",), buckets=QUERY_BUCKETS, registry=REGISTRY)
+SPAN_SECONDS = Histogram(
+    "virtualta_span_duration_seconds", "Time spent in an instrumented step (text extraction, grading, OpenAI calls).",
+    ("span",), buckets=LATENCY_BUCKETS, registry=REGISTRY)
+SPAN_ERRORS = Counter("virtualta_span_errors_total", "Instrumented steps that raised.", ("span",),
+                      registry=REGISTRY)
+OPENAI_TOKENS = Counter("virtualta_openai_tokens_total", "Tokens reported by OpenAI chat completions.",
+                        ("kind",), registry=REGISTRY)
+
+ALL_METRICS = (REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_QUERY_SECONDS, QUERY_SECONDS,
+               SPAN_SECONDS, SPAN_ERRORS, OPENAI_TOKENS)
+
+
+def _reset_after_fork():
+    # a forked worker reports its own requests, not its parent's (in
+    # multiprocess mode prometheus_client also starts a file per pid)
+    for metric in ALL_METRICS:
+        metric.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ---------- TRACING ----------
+
+class Trace:
+    """
+    What one request did: its SQL statements and instrumented spans,
+    including those of worker threads that adopt_trace() it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.route = ""
+        self.method = ""
+        self.status = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.spans = []     # (name, seconds, info)
+
+
+def current_trace() -> Trace | None:
+    """Trace of the request being handled on this thread, if any."""
+    return g.get("metrics_trace") if has_app_context() else None
+
+
+def adopt_trace(trace: Trace | None) -> None:
+    """
+    Record this thread's spans and SQL in a request's trace (taken with
+    current_trace() on the request's thread). Call inside the thread's
+    own app context.
+    """
+    if trace is not None:
+        g.metrics_trace = trace
+
+
+@contextmanager
+def span(name: str, **info):
+    """
+    Time a block as `name`. Yields a dict the block can add details to
+    (e.g. token counts); they show in the slow-request log.
+    """
+    if not METRICS_ENABLED:
+        yield info
+        return
+    started = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        SPAN_ERRORS.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.labels(name).observe(elapsed)
+        trace = current_trace()
+        if trace is not None:
+            with trace.lock:
+                trace.spans.append((name, elapsed, info))
+
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def record_tokens(usage: dict) -> None:
+    for kind in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+        if usage.get(kind):
+            OPENAI_TOKENS.labels(kind.removesuffix("_tokens")).inc(usage[kind])
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if not METRICS_ENABLED:
+        return
+    trace = current_trace()
+    QUERY_SECONDS.labels(trace.route if trace is not None else "").observe(elapsed)
+    if trace is not None:
+        with trace.lock:
+            trace.queries += 1
+            trace.query_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _query_failed(context):
+    started = context.connection.info.get("metrics_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+# ---------- REQUEST HOOKS ----------
+
+@bp.before_app_request
+def _start_trace():
+    if METRICS_ENABLED:
+        trace = g.metrics_trace = Trace()
+        trace.method = request.method
+        trace.route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+
+@bp.after_app_request
+def _note_status(response):
+    trace = current_trace()
+    if trace is not None:
+        trace.status = response.status_code
+    return response
+
+
+@bp.teardown_app_request
+def _finish_trace(exc):
+    """Runs once the response body is sent, so streamed responses count in full."""
+    trace = g.pop("metrics_trace", None)
+    if trace is None:
+        return
+    elapsed = time.perf_counter() - trace.started
+    status = trace.status or (500 if exc is not None else 0)
+    REQUEST_SECONDS.labels(trace.method, trace.route, status).observe(elapsed)
+    REQUEST_QUERIES.labels(trace.method, trace.route).observe(trace.queries)
+    REQUEST_QUERY_SECONDS.labels(trace.method, trace.route).observe(trace.query_seconds)
+    if METRICS_SLOW_REQUEST_SECONDS and elapsed >= METRICS_SLOW_REQUEST_SECONDS:
+        current_app.logger.warning("slow request %s %s %s %.3fs: %s", request.method, request.path,
+                                   status, elapsed, breakdown(trace))
+
+
+def breakdown(trace: Trace) -> str:
+    """One-line summary of a trace: SQL totals, then every span in order."""
+    parts = [f"sql {trace.queries} queries {trace.query_seconds:.3f}s"]
+    for name, seconds, info in trace.spans[:METRICS_SLOW_LOG_SPANS]:
+        details = " ".join(f"{k}={v}" for k, v in info.items())
+        parts.append(f"{name} {seconds:.3f}s" + (f" ({details})" if details else ""))
+    if len(trace.spans) > METRICS_SLOW_LOG_SPANS:
+        parts.append(f"+{len(trace.spans) - METRICS_SLOW_LOG_SPANS} more spans")
+    return "; ".join(parts)
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text exposition: every worker's metrics in multiprocess mode, else this one's."""
+    registry = REGISTRY
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -28,7 +28,10 @@ database_url = os.getenv("DATABASE_URL")
 if database_url:
     config.set_main_option("sqlalchemy.url", database_url)
 
-if config.config_file_name is not None:
+# schema.migrate_database() hands over the app's own connection
+shared_connection = config.attributes.get("connection")
+
+if config.config_file_name is not None and shared_connection is None:
     fileConfig(config.config_file_name)
 
 def run_migrations_offline() -> None:
@@ -45,6 +48,17 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 def run_migrations_online() -> None:
+    if shared_connection is not None:
+        context.configure(
+            connection=shared_connection,
+            target_metadata=target_metadata,
+            compare_type=True,
+            compare_server_default=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     configuration = config.get_section(config.config_ini_section)
     connectable = engine_from_config(
         configuration, prefix="sqlalchemy.", poolclass=pool.NullPool
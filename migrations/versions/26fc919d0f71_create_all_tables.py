@@ -0,0 +1,218 @@
+"""create tables previously made by create_all
+
+Revision ID: 26fc919d0f71
+Revises: ce3fa48e6217
+Create Date: 2026-10-17 04:44:39.071341
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '26fc919d0f71'
+down_revision: Union[str, Sequence[str], None] = 'ce3fa48e6217'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Until now these only ever came from db.create_all() at app import.
+# Databases that already have them (every deployed one) skip them. This
+# runs first after init so the later revisions can alter any of them.
+TABLES = [
+    "extracted_texts",
+    "grading_cache",
+    "grading_cache_stats",
+    "openai_batches",
+    "pins",
+    "rate_limit_state",
+    "rate_limit_waiters",
+    "stored_objects",
+    "submission_pins",
+    "openai_batch_items",
+    "grading_jobs",
+]
+
+
+# Baseline model columns that databases created before them lack
+# (create_all never adds columns to an existing table).
+BASELINE_COLUMNS = [
+    ("assignments", sa.Column("owner_email", sa.String(length=255), nullable=True)),
+    ("assignments", sa.Column("due_date", sa.DateTime(), nullable=True)),
+]
+
+
+def _existing_tables() -> set[str]:
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = _existing_tables()
+    inspector = sa.inspect(op.get_bind())
+    for table, column in BASELINE_COLUMNS:
+        if table in existing and column.name not in {c["name"] for c in inspector.get_columns(table)}:
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(column)
+    if "assignments" in existing and "ix_assignments_owner_email" not in {
+            i["name"] for i in sa.inspect(op.get_bind()).get_indexes("assignments")}:
+        op.create_index(op.f("ix_assignments_owner_email"), "assignments", ["owner_email"], unique=False)
+    if 'extracted_texts' not in existing:
+        op.create_table('extracted_texts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('file_ext', sa.String(length=10), nullable=False),
+        sa.Column('extractor_version', sa.String(length=120), nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('char_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('content_hash', 'file_ext', 'extractor_version', name='uq_extracted_texts_hash_ext_version')
+        )
+        op.create_index(op.f('ix_extracted_texts_content_hash'), 'extracted_texts', ['content_hash'], unique=False)
+    if 'grading_cache' not in existing:
+        op.create_table('grading_cache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(length=80), nullable=False),
+        sa.Column('prompt_version', sa.String(length=40), nullable=False),
+        sa.Column('feedback', sa.Text(), nullable=False),
+        sa.Column('grade', sa.String(length=20), nullable=False),
+        sa.Column('hits', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+        )
+        op.create_index(op.f('ix_grading_cache_created_at'), 'grading_cache', ['created_at'], unique=False)
+        op.create_index(op.f('ix_grading_cache_last_used_at'), 'grading_cache', ['last_used_at'], unique=False)
+    if 'grading_cache_stats' not in existing:
+        op.create_table('grading_cache_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('hits', sa.Integer(), nullable=False),
+        sa.Column('misses', sa.Integer(), nullable=False),
+        sa.Column('bypasses', sa.Integer(), nullable=False),
+        sa.Column('evictions', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'openai_batches' not in existing:
+        op.create_table('openai_batches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('remote_status', sa.String(length=20), nullable=True),
+        sa.Column('remote_id', sa.String(length=120), nullable=True),
+        sa.Column('input_file_id', sa.String(length=120), nullable=True),
+        sa.Column('output_file_id', sa.String(length=120), nullable=True),
+        sa.Column('error_file_id', sa.String(length=120), nullable=True),
+        sa.Column('request_count', sa.Integer(), nullable=False),
+        sa.Column('completed_count', sa.Integer(), nullable=False),
+        sa.Column('failed_count', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('submitted_at', sa.DateTime(), nullable=True),
+        sa.Column('polled_at', sa.DateTime(), nullable=True),
+        sa.Column('ingested_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_openai_batches_assignment_id'), 'openai_batches', ['assignment_id'], unique=False)
+        op.create_index(op.f('ix_openai_batches_status'), 'openai_batches', ['status'], unique=False)
+    if 'pins' not in existing:
+        op.create_table('pins',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('class_id', sa.Integer(), nullable=True),
+        sa.Column('pin_code', sa.String(length=32), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('pin_code')
+        )
+    if 'rate_limit_state' not in existing:
+        op.create_table('rate_limit_state',
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('request_tokens', sa.Float(), nullable=False),
+        sa.Column('token_tokens', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.Float(), nullable=False),
+        sa.Column('blocked_until', sa.Float(), nullable=False),
+        sa.Column('total_waits', sa.Integer(), nullable=False),
+        sa.Column('total_wait_seconds', sa.Float(), nullable=False),
+        sa.Column('max_wait_seconds', sa.Float(), nullable=False),
+        sa.Column('rate_limited_responses', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+        )
+    if 'rate_limit_waiters' not in existing:
+        op.create_table('rate_limit_waiters',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=120), nullable=False),
+        sa.Column('tokens', sa.Integer(), nullable=False),
+        sa.Column('since', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_rate_limit_waiters_name'), 'rate_limit_waiters', ['name'], unique=False)
+    if 'stored_objects' not in existing:
+        op.create_table('stored_objects',
+        sa.Column('path', sa.String(length=300), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('refcount', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('path')
+        )
+        op.create_index(op.f('ix_stored_objects_content_hash'), 'stored_objects', ['content_hash'], unique=False)
+    if 'submission_pins' not in existing:
+        op.create_table('submission_pins',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('pin', sa.String(length=6), nullable=False),
+        sa.Column('class_id', sa.Integer(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('pin')
+        )
+    if 'openai_batch_items' not in existing:
+        op.create_table('openai_batch_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('batch_id', sa.Integer(), nullable=False),
+        sa.Column('custom_id', sa.String(length=64), nullable=False),
+        sa.Column('submission_id', sa.Integer(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('rubric_hash', sa.String(length=64), nullable=True),
+        sa.Column('cache_key', sa.String(length=64), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['batch_id'], ['openai_batches.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('batch_id', 'custom_id', name='uq_openai_batch_items_custom_id')
+        )
+        op.create_index(op.f('ix_openai_batch_items_batch_id'), 'openai_batch_items', ['batch_id'], unique=False)
+        op.create_index(op.f('ix_openai_batch_items_submission_id'), 'openai_batch_items', ['submission_id'], unique=False)
+    if 'grading_jobs' not in existing:
+        op.create_table('grading_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('submission_id', sa.Integer(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=120), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('phase', sa.String(length=20), nullable=True),
+        sa.Column('extracted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['submission_id'], ['submissions.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_grading_jobs_assignment_id'), 'grading_jobs', ['assignment_id'], unique=False)
+        op.create_index(op.f('ix_grading_jobs_status'), 'grading_jobs', ['status'], unique=False)
+        op.create_index(op.f('ix_grading_jobs_submission_id'), 'grading_jobs', ['submission_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    existing = _existing_tables()
+    for table in reversed(TABLES):
+        if table in existing:
+            op.drop_table(table)
@@ -0,0 +1,38 @@
+"""pin lookup cache version
+
+Revision ID: a83d5e0c6f14
+Revises: f2a7c9d13b58
+Create Date: 2026-10-17 17:03:41.775219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a83d5e0c6f14'
+down_revision: Union[str, Sequence[str], None] = 'f2a7c9d13b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(table: str) -> bool:
+    return table in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table('pin_cache_state'):
+        op.create_table('pin_cache_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_table('pin_cache_state'):
+        op.drop_table('pin_cache_state')
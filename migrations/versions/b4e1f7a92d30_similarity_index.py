@@ -0,0 +1,61 @@
+"""submission similarity signatures and LSH bands
+
+Revision ID: b4e1f7a92d30
+Revises: a83d5e0c6f14
+Create Date: 2026-10-17 18:26:13.094512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e1f7a92d30'
+down_revision: Union[str, Sequence[str], None] = 'a83d5e0c6f14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _existing_tables() -> set[str]:
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = _existing_tables()
+    if 'submission_signatures' not in existing:
+        op.create_table('submission_signatures',
+        sa.Column('submission_id', sa.Integer(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.String(length=80), nullable=False),
+        sa.Column('text_hash', sa.String(length=64), nullable=False),
+        sa.Column('shingle_count', sa.Integer(), nullable=False),
+        sa.Column('minhash', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['submission_id'], ['submissions.id'], ),
+        sa.PrimaryKeyConstraint('submission_id')
+        )
+        op.create_index(op.f('ix_submission_signatures_assignment_id'), 'submission_signatures', ['assignment_id'], unique=False)
+    if 'similarity_bands' not in existing:
+        op.create_table('similarity_bands',
+        sa.Column('submission_id', sa.Integer(), nullable=False),
+        sa.Column('band', sa.SmallInteger(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['submission_id'], ['submissions.id'], ),
+        sa.PrimaryKeyConstraint('submission_id', 'band')
+        )
+        op.create_index('ix_similarity_bands_lookup', 'similarity_bands', ['assignment_id', 'band', 'bucket'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    existing = _existing_tables()
+    if 'similarity_bands' in existing:
+        op.drop_index('ix_similarity_bands_lookup', table_name='similarity_bands')
+        op.drop_table('similarity_bands')
+    if 'submission_signatures' in existing:
+        op.drop_index(op.f('ix_submission_signatures_assignment_id'), table_name='submission_signatures')
+        op.drop_table('submission_signatures')
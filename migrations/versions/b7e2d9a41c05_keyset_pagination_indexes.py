@@ -0,0 +1,58 @@
+"""rubric.created_at and keyset pagination indexes
+
+Revision ID: b7e2d9a41c05
+Revises: a1c4e7f20b13
+Create Date: 2026-10-17 11:03:47.502611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d9a41c05'
+down_revision: Union[str, Sequence[str], None] = 'a1c4e7f20b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_assignments_owner_created_id", "assignments", ["owner_email", "created_at", "id"]),
+    ("ix_submissions_assignment_created_id", "submissions", ["assignment_id", "created_at", "id"]),
+    ("ix_rubric_created_id", "rubric", ["created_at", "id"]),
+]
+
+
+def _columns(table: str) -> set:
+    return {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def _indexes(table: str) -> set:
+    return {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # db.create_all() at app import may already have created any of these
+    if "created_at" not in _columns("rubric"):
+        with op.batch_alter_table("rubric") as batch_op:
+            batch_op.add_column(sa.Column("created_at", sa.DateTime(), nullable=True))
+
+    # cursors compare (created_at, id); NULL created_at rows would never match
+    for table in ("assignments", "submissions", "rubric"):
+        op.execute(sa.text(f"UPDATE {table} SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+
+    for name, table, columns in INDEXES:
+        if name not in _indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, table, _ in reversed(INDEXES):
+        if name in _indexes(table):
+            op.drop_index(name, table_name=table)
+    if "created_at" in _columns("rubric"):
+        with op.batch_alter_table("rubric") as batch_op:
+            batch_op.drop_column("created_at")
@@ -0,0 +1,88 @@
+"""numeric grade scores on submissions
+
+Revision ID: c6d2a8f41e93
+Revises: b4e1f7a92d30
+Create Date: 2026-10-17 19:48:22.530174
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6d2a8f41e93'
+down_revision: Union[str, Sequence[str], None] = 'b4e1f7a92d30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEW_COLUMNS = [
+    ("submissions", sa.Column("ai_score", sa.Float(), nullable=True)),
+    ("submissions", sa.Column("final_score", sa.Float(), nullable=True)),
+]
+
+# analytics.grade_score as of this revision (migrations don't import app code)
+LETTER_GRADES = {
+    "A+": 98.0, "A": 95.0, "A-": 91.0, "B+": 88.0, "B": 85.0, "B-": 81.0,
+    "C+": 78.0, "C": 75.0, "C-": 71.0, "D+": 68.0, "D": 65.0, "D-": 61.0, "F": 50.0,
+}
+_NUMBER = re.compile(r"^(-?\d+(?:\.\d+)?)\s*(%|/\s*(\d+(?:\.\d+)?))?$")
+
+
+def grade_score(grade):
+    text = str(grade if grade is not None else "").strip()
+    if not text:
+        return None
+    if text.upper() in LETTER_GRADES:
+        return LETTER_GRADES[text.upper()]
+    m = _NUMBER.match(text)
+    if m is None:
+        return None
+    value = float(m.group(1))
+    if m.group(3) is not None:
+        total = float(m.group(3))
+        return round(value / total * 100, 2) if total else None
+    return value
+
+
+def _has_column(table: str, column: str) -> bool:
+    inspector = sa.inspect(op.get_bind())
+    return column in {c["name"] for c in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in NEW_COLUMNS:
+        if not _has_column(table, column.name):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(column)
+
+    # score the grades already stored
+    bind = op.get_bind()
+    submissions = sa.table(
+        "submissions", sa.column("id"), sa.column("ai_grade"), sa.column("final_grade"),
+        sa.column("ai_score"), sa.column("final_score"),
+    )
+    rows = bind.execute(sa.select(submissions.c.id, submissions.c.ai_grade, submissions.c.final_grade)).all()
+    updates = [
+        {"sid": sid, "ai_score": grade_score(ai), "final_score": grade_score(final)}
+        for sid, ai, final in rows
+        if grade_score(ai) is not None or grade_score(final) is not None
+    ]
+    if updates:
+        bind.execute(
+            submissions.update().where(submissions.c.id == sa.bindparam("sid")).values(
+                ai_score=sa.bindparam("ai_score"), final_score=sa.bindparam("final_score"),
+            ),
+            updates,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column in reversed(NEW_COLUMNS):
+        if _has_column(table, column.name):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column(column.name)
@@ -0,0 +1,49 @@
+"""submission cached prompt tokens
+
+Revision ID: e58c2a1f9d46
+Revises: d94b0e3c7f21
+Create Date: 2026-10-17 14:41:58.902317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e58c2a1f9d46'
+down_revision: Union[str, Sequence[str], None] = 'd94b0e3c7f21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+NEW_COLUMNS = [
+    ("submissions", sa.Column("cached_tokens", sa.Integer(), nullable=True)),
+]
+
+
+def _has_table(table: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def _has_column(table: str, column: str) -> bool:
+    # db.create_all() at app import may already have added them
+    inspector = sa.inspect(op.get_bind())
+    return inspector.has_table(table) and column in {c["name"] for c in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table, column in NEW_COLUMNS:
+        # a table that doesn't exist yet gets created with the column
+        if _has_table(table) and not _has_column(table, column.name):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(column)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, column in reversed(NEW_COLUMNS):
+        if _has_column(table, column.name):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.drop_column(column.name)
@@ -0,0 +1,38 @@
+"""pin allocation counter
+
+Revision ID: f2a7c9d13b58
+Revises: e58c2a1f9d46
+Create Date: 2026-10-17 16:12:05.418227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a7c9d13b58'
+down_revision: Union[str, Sequence[str], None] = 'e58c2a1f9d46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_table(table: str) -> bool:
+    return table in sa.inspect(op.get_bind()).get_table_names()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_table('pin_counters'):
+        op.create_table('pin_counters',
+        sa.Column('name', sa.String(length=40), nullable=False),
+        sa.Column('next_value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _has_table('pin_counters'):
+        op.drop_table('pin_counters')
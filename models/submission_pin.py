@@ -1,4 +1,4 @@
-from app import db
+from extensions import db
 
 class SubmissionPin(db.Model):
     __tablename__ = "submission_pins"
@@ -11,3 +11,12 @@ class SubmissionPin(db.Model):
     student_id = db.Column(db.Integer, nullable=False)
 
     created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "assignment_id": self.assignment_id,
+            "class_id": self.class_id,
+            "pin_code": self.pin,
+            "student_id": self.student_id,
+        }
@@ -0,0 +1,101 @@
+# multi_grading.py
+import os
+from batch_grading import empty_usage
+from chunked_grading import rubric_system
+
+# Grade up to this many short submissions with one request (1 = off).
+GRADING_SUBMISSIONS_PER_REQUEST = int(os.getenv("GRADING_SUBMISSIONS_PER_REQUEST", "1"))
+# Only submissions at most this long are packed together; longer ones get
+# their own request as usual.
+GRADING_MULTI_MAX_CHARS = int(os.getenv("GRADING_MULTI_MAX_CHARS", "4000"))
+
+
+def multi_enabled() -> bool:
+    return GRADING_SUBMISSIONS_PER_REQUEST > 1
+
+
+def pack(entries, per_request: int = GRADING_SUBMISSIONS_PER_REQUEST) -> list[tuple[str, list]]:
+    """
+    Group (key, rubric_text, text) entries into requests of at most
+    per_request submissions that share a rubric, keeping input order.
+    Returns [(rubric_text, [(key, text), ...])].
+    """
+    by_rubric = {}
+    for key, rubric_text, text in entries:
+        by_rubric.setdefault(rubric_text, []).append((key, text))
+    groups = []
+    for rubric_text, members in by_rubric.items():
+        for i in range(0, len(members), per_request):
+            groups.append((rubric_text, members[i:i + per_request]))
+    return groups
+
+
+def _multi_prompt(entries: list[tuple[str, str]]) -> str:
+    blocks = "\n\n".join(f'Submission "{key}":\n\"\"\"{text}\"\"\"' for key, text in entries)
+    return f"""
+Below are {len(entries)} independent student submissions. Grade each one on
+its own against the rubric; never compare them with each other.
+
+{blocks}
+
+Return a JSON object with:
+- "results": array with exactly one object per submission, each with
+  - "id": the submission's id string as given above
+  - "feedback": string with concrete, actionable comments
+  - "grade": integer 0-100
+"""
+
+
+def split_usage(usage: dict, weights: list[float]) -> list[dict]:
+    """Attribute one request's usage to its submissions in proportion to weights."""
+    total = sum(weights) or 1.0
+    parts = [empty_usage() for _ in weights]
+    for k, amount in usage.items():
+        given = 0
+        for i, w in enumerate(weights):
+            share = amount - given if i == len(weights) - 1 else int(amount * w / total)
+            parts[i][k] = share
+            given += share
+    return parts
+
+
+def grade_multi(chat_fn, rubric_text: str, entries: list[tuple[str, str]]):
+    """
+    Grade several (key, text) submissions with one request.
+    chat_fn(system, user) -> (dict, usage). Returns (answers, unanswered):
+    answers is {key: (feedback, grade, usage)} for every submission the
+    model answered; keys it skipped or mangled are instead in unanswered,
+    {key: usage share}, so the caller can grade them one by one and still
+    charge them what this request cost.
+
+    The shared system prefix is split evenly, and each submission's own
+    text and feedback are charged to it.
+    """
+    system = rubric_system(rubric_text)
+    data, usage = chat_fn(system, _multi_prompt(entries))
+
+    answers = {}
+    for item in data.get("results") or []:
+        if isinstance(item, dict) and str(item.get("id")) in dict(entries):
+            answers[str(item["id"])] = item
+
+    keys = [key for key, _ in entries]
+    prefix = len(system) / len(entries)
+    prompt_parts = split_usage(
+        {"prompt_tokens": usage.get("prompt_tokens", 0), "cached_tokens": usage.get("cached_tokens", 0)},
+        [prefix + len(text) for _, text in entries],
+    )
+    completion_parts = split_usage(
+        {"completion_tokens": usage.get("completion_tokens", 0)},
+        [len(str(answers.get(key, {}).get("feedback", ""))) + 1 for key in keys],
+    )
+
+    out, unanswered = {}, {}
+    for key, p, c in zip(keys, prompt_parts, completion_parts):
+        share = {**p, "completion_tokens": c["completion_tokens"]}
+        if key in answers:
+            answer = answers[key]
+            out[key] = (str(answer.get("feedback", "")).strip(), answer.get("grade"), share)
+        else:
+            unanswered[key] = share
+    return out, unanswered
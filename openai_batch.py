@@ -0,0 +1,318 @@
+# openai_batch.py
+import os
+import json
+import time
+import datetime
+from flask import Blueprint, jsonify
+from extensions import db
+
+bp = Blueprint("openai_batch", __name__)
+
+# OpenAI Batch API: requests go up as one JSONL file and results come back
+# within the completion window at half the synchronous price.
+OPENAI_BATCH_ENDPOINT = "/v1/chat/completions"
+OPENAI_BATCH_COMPLETION_WINDOW = os.getenv("OPENAI_BATCH_COMPLETION_WINDOW", "24h")
+# API limit is 50,000 requests per batch; larger runs are split.
+OPENAI_BATCH_MAX_REQUESTS = int(os.getenv("OPENAI_BATCH_MAX_REQUESTS", "50000"))
+# How often one batch's status is fetched while it runs.
+OPENAI_BATCH_POLL_SECONDS = float(os.getenv("OPENAI_BATCH_POLL_SECONDS", "60"))
+
+# OpenAIBatch.status: local lifecycle. remote_status mirrors the API's
+# (validating, in_progress, finalizing, completed, failed, expired,
+# cancelling, cancelled).
+BATCH_PREPARING = "preparing"    # rows written, not yet accepted by the API
+BATCH_SUBMITTED = "submitted"    # waiting on the API
+BATCH_INGESTED = "ingested"      # results applied; nothing left to do
+
+# Remote states after which no more results will appear.
+REMOTE_FINISHED = {"completed", "failed", "expired", "cancelled"}
+
+ITEM_PENDING = "pending"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+
+
+# ---------- MODELS ----------
+
+class OpenAIBatch(db.Model):
+    __tablename__ = "openai_batches"
+
+    id = db.Column(db.Integer, primary_key=True)
+    assignment_id = db.Column(db.Integer, nullable=True, index=True)
+    status = db.Column(db.String(20), nullable=False, default=BATCH_PREPARING, index=True)
+    remote_status = db.Column(db.String(20), nullable=True)
+    remote_id = db.Column(db.String(120), nullable=True)
+    input_file_id = db.Column(db.String(120), nullable=True)
+    output_file_id = db.Column(db.String(120), nullable=True)
+    error_file_id = db.Column(db.String(120), nullable=True)
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    polled_at = db.Column(db.DateTime, nullable=True)
+    ingested_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "assignment_id": self.assignment_id,
+            "status": self.status,
+            "remote_status": self.remote_status,
+            "remote_id": self.remote_id,
+            "request_count": self.request_count,
+            "completed_count": self.completed_count,
+            "failed_count": self.failed_count,
+            "last_error": self.last_error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "submitted_at": self.submitted_at.isoformat() if self.submitted_at else None,
+            "polled_at": self.polled_at.isoformat() if self.polled_at else None,
+            "ingested_at": self.ingested_at.isoformat() if self.ingested_at else None,
+        }
+
+
+class OpenAIBatchItem(db.Model):
+    """One request line of a batch; custom_id is how its result finds its way back."""
+    __tablename__ = "openai_batch_items"
+    __table_args__ = (db.UniqueConstraint("batch_id", "custom_id", name="uq_openai_batch_items_custom_id"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey("openai_batches.id"), nullable=False, index=True)
+    custom_id = db.Column(db.String(64), nullable=False)
+    submission_id = db.Column(db.Integer, nullable=False, index=True)
+    body = db.Column(db.Text, nullable=False)                 # chat.completions request JSON
+    rubric_hash = db.Column(db.String(64), nullable=True)     # rubric the request was built from
+    cache_key = db.Column(db.String(64), nullable=True)       # grading cache entry to fill
+    status = db.Column(db.String(20), nullable=False, default=ITEM_PENDING)
+    error = db.Column(db.Text, nullable=True)
+
+
+# ---------- SUBMIT ----------
+
+def create_batches(requests, assignment_id: int | None = None) -> list[OpenAIBatch]:
+    """
+    Record grading requests as batches of at most OPENAI_BATCH_MAX_REQUESTS.
+    requests are dicts with submission_id, body (chat.completions params),
+    rubric_hash and cache_key. Commits; the API is only called by submit(),
+    so a crash here loses nothing that advance_batches() can't redo.
+    """
+    requests = list(requests)
+    batches = []
+    for start in range(0, len(requests), OPENAI_BATCH_MAX_REQUESTS):
+        chunk = requests[start:start + OPENAI_BATCH_MAX_REQUESTS]
+        batch = OpenAIBatch(assignment_id=assignment_id, status=BATCH_PREPARING, request_count=len(chunk))
+        db.session.add(batch)
+        db.session.flush()
+        for r in chunk:
+            db.session.add(OpenAIBatchItem(
+                batch_id=batch.id,
+                custom_id=f"submission-{r['submission_id']}",
+                submission_id=r["submission_id"],
+                body=json.dumps(r["body"], ensure_ascii=False),
+                rubric_hash=r.get("rubric_hash"),
+                cache_key=r.get("cache_key"),
+            ))
+        batches.append(batch)
+    db.session.commit()
+    return batches
+
+
+def batch_jsonl(batch: OpenAIBatch) -> bytes:
+    """The batch input file: one {"custom_id", "method", "url", "body"} line per item."""
+    items = OpenAIBatchItem.query.filter_by(batch_id=batch.id).order_by(OpenAIBatchItem.id)
+    lines = (
+        json.dumps({"custom_id": item.custom_id, "method": "POST", "url": OPENAI_BATCH_ENDPOINT,
+                    "body": json.loads(item.body)}, ensure_ascii=False)
+        for item in items
+    )
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _find_remote(client, batch: OpenAIBatch):
+    """A batch created for this row by an earlier run that died before saving its id."""
+    for remote in client.batches.list(limit=100).data:
+        if remote.input_file_id == batch.input_file_id:
+            return remote
+    return None
+
+
+def submit(client, batch: OpenAIBatch) -> None:
+    """
+    Upload the input file and create the remote batch, committing after
+    each step so a restart picks up where this left off.
+    """
+    if not batch.input_file_id:
+        uploaded = client.files.create(file=(f"grading-{batch.id}.jsonl", batch_jsonl(batch)), purpose="batch")
+        batch.input_file_id = uploaded.id
+        db.session.commit()
+
+    remote = _find_remote(client, batch)
+    if remote is None:
+        remote = client.batches.create(
+            input_file_id=batch.input_file_id,
+            endpoint=OPENAI_BATCH_ENDPOINT,
+            completion_window=OPENAI_BATCH_COMPLETION_WINDOW,
+            metadata={"virtualta_batch_id": str(batch.id)},
+        )
+    batch.remote_id = remote.id
+    batch.status = BATCH_SUBMITTED
+    batch.submitted_at = datetime.datetime.utcnow()
+    _update_from_remote(batch, remote)
+    db.session.commit()
+
+
+# ---------- POLL + INGEST ----------
+
+def _update_from_remote(batch: OpenAIBatch, remote) -> None:
+    batch.remote_status = remote.status
+    batch.output_file_id = remote.output_file_id or batch.output_file_id
+    batch.error_file_id = remote.error_file_id or batch.error_file_id
+    counts = getattr(remote, "request_counts", None)
+    if counts is not None:
+        batch.completed_count = counts.completed or 0
+        batch.failed_count = counts.failed or 0
+    errors = getattr(getattr(remote, "errors", None), "data", None) or []
+    if errors:
+        batch.last_error = "; ".join(e.message or e.code or "" for e in errors)
+    batch.polled_at = datetime.datetime.utcnow()
+
+
+def poll(client, batch: OpenAIBatch) -> None:
+    _update_from_remote(batch, client.batches.retrieve(batch.remote_id))
+    db.session.commit()
+
+
+def _read_results(client, file_id: str | None) -> dict:
+    """custom_id -> result line of an output or error file."""
+    if not file_id:
+        return {}
+    results = {}
+    for line in client.files.content(file_id).text.splitlines():
+        if line.strip():
+            row = json.loads(line)
+            results[row.get("custom_id")] = row
+    return results
+
+
+def _outcome(row: dict | None) -> tuple[str | None, dict | None, str | None]:
+    """(message content, usage, error) of one result line."""
+    if row is None:
+        return None, None, "no result before the batch ended"
+    response = row.get("response") or {}
+    if row.get("error") or response.get("status_code") != 200:
+        error = row.get("error") or (response.get("body") or {}).get("error") or {}
+        return None, None, error.get("message") or f"status {response.get('status_code')}"
+    body = response.get("body") or {}
+    try:
+        content = body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return None, None, "malformed chat completion"
+    usage = body.get("usage") or {}
+    return content, {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+    }, None
+
+
+def ingest(client, batch: OpenAIBatch, apply_fn) -> dict:
+    """
+    Hand every pending item's result to apply_fn(item, content, usage,
+    error) by custom_id. apply_fn must not commit or roll back: every item,
+    its submission and the batch's ingested status are committed together,
+    so a crash mid-way leaves the whole batch to be ingested again.
+    Returns {"done": n, "failed": n}.
+    """
+    results = _read_results(client, batch.output_file_id)
+    results.update({k: v for k, v in _read_results(client, batch.error_file_id).items() if k not in results})
+
+    counts = {"done": 0, "failed": 0}
+    pending = OpenAIBatchItem.query.filter_by(batch_id=batch.id, status=ITEM_PENDING).all()
+    for item in pending:
+        content, usage, error = _outcome(results.get(item.custom_id))
+        item.status = ITEM_FAILED if error else ITEM_DONE
+        item.error = error
+        counts["failed" if error else "done"] += 1
+        apply_fn(item, content, usage, error)
+
+    batch.status = BATCH_INGESTED
+    batch.ingested_at = datetime.datetime.utcnow()
+    db.session.commit()
+    return counts
+
+
+def advance_batches(client, apply_fn, poll_seconds: float | None = None, logger=None) -> int:
+    """
+    Move every unfinished batch one step: submit it if it never reached the
+    API, poll it when its last poll is older than poll_seconds, and ingest it
+    once the API has finished with it. Safe to call from any number of
+    restarts; all progress lives in the database. Returns batches ingested.
+    """
+    poll_seconds = OPENAI_BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+    due = datetime.datetime.utcnow() - datetime.timedelta(seconds=poll_seconds)
+    ingested = 0
+    for batch in OpenAIBatch.query.filter(OpenAIBatch.status != BATCH_INGESTED).order_by(OpenAIBatch.id).all():
+        try:
+            if batch.status == BATCH_PREPARING:
+                submit(client, batch)
+            elif batch.remote_status not in REMOTE_FINISHED and (batch.polled_at is None or batch.polled_at <= due):
+                poll(client, batch)
+            if batch.remote_status in REMOTE_FINISHED:
+                counts = ingest(client, batch, apply_fn)
+                ingested += 1
+                if logger:
+                    logger.info("batch %s (%s) ingested: %s", batch.id, batch.remote_status, counts)
+        except Exception as e:
+            db.session.rollback()
+            batch.last_error = str(e) or e.__class__.__name__
+            db.session.commit()
+            if logger:
+                logger.warning("batch %s: %s", batch.id, batch.last_error)
+    return ingested
+
+
+def open_batch_submission_ids(submission_ids) -> set[int]:
+    """Which of these submissions still wait on an unfinished batch."""
+    rows = (
+        db.session.query(OpenAIBatchItem.submission_id)
+        .join(OpenAIBatch, OpenAIBatch.id == OpenAIBatchItem.batch_id)
+        .filter(OpenAIBatch.status != BATCH_INGESTED)
+        .filter(OpenAIBatchItem.submission_id.in_(list(submission_ids)))
+    )
+    return {sid for (sid,) in rows}
+
+
+def wait_for_batches(client, apply_fn, poll_seconds: float | None = None, logger=None) -> int:
+    """advance_batches() until none are left unfinished. Returns batches ingested."""
+    poll_seconds = OPENAI_BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+    ingested = 0
+    while True:
+        ingested += advance_batches(client, apply_fn, poll_seconds, logger)
+        if not OpenAIBatch.query.filter(OpenAIBatch.status != BATCH_INGESTED).count():
+            return ingested
+        db.session.rollback()
+        time.sleep(max(0.05, poll_seconds))
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/batches", methods=["GET"])
+def list_batches():
+    batches = OpenAIBatch.query.order_by(OpenAIBatch.id.desc()).limit(100).all()
+    return jsonify([b.to_dict() for b in batches]), 200
+
+
+@bp.route("/api/batches/<int:bid>", methods=["GET"])
+def get_batch(bid):
+    batch = db.session.get(OpenAIBatch, bid)
+    if batch is None:
+        return jsonify({"error": "batch not found"}), 404
+    items = OpenAIBatchItem.query.filter_by(batch_id=bid).order_by(OpenAIBatchItem.id).all()
+    return jsonify({
+        **batch.to_dict(),
+        "items": [
+            {"submission_id": i.submission_id, "custom_id": i.custom_id, "status": i.status, "error": i.error}
+            for i in items
+        ],
+    }), 200
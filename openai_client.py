@@ -0,0 +1,182 @@
+# openai_client.py
+import os
+import time
+import weakref
+import threading
+from flask import Blueprint, jsonify, current_app
+
+bp = Blueprint("openai_client", __name__)
+
+# Connection pool of the per-process OpenAI client. Grading threads
+# (GRADING_MAX_IN_FLIGHT) share it, so keep max connections at or above that.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))   # seconds idle
+# Timeouts in seconds. The read timeout stays well under gunicorn's 120s
+# worker timeout so one stuck request can't take a worker down with it.
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "60"))
+OPENAI_WRITE_TIMEOUT = float(os.getenv("OPENAI_WRITE_TIMEOUT", "30"))
+OPENAI_POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", "10"))       # waiting for a free connection
+# SDK-level retries of connection errors and 5xx. The SDK would retry 429s
+# too, without telling the shared limiter; _no_sdk_retry_on_429 turns that
+# off so chat_json waits them out through rate_limit.py instead.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+# HTTP/2 multiplexes every request over one connection; needs the h2 package.
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "0") in ("1", "true", "True")
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _no_sdk_retry_on_429(response) -> None:
+    """httpx response hook: the SDK skips its own retry when x-should-retry is false."""
+    if response.status_code == 429:
+        response.headers["x-should-retry"] = "false"
+
+
+class ClientStats:
+    """Counters fed by httpcore's trace hook; one set per process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.connect_failures = 0
+        self.timeouts = 0
+        self.since = time.time()
+
+    def trace(self, event: str, info: dict) -> None:
+        with self._lock:
+            if event.endswith("send_request_headers.started"):
+                self.requests += 1
+            elif event == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            elif event == "connection.connect_tcp.failed":
+                self.connect_failures += 1
+            if event.endswith(".failed") and "Timeout" in type(info.get("exception")).__name__:
+                self.timeouts += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.connections_opened)
+            return {
+                "requests": self.requests,
+                "connections_opened": self.connections_opened,
+                "connections_reused": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+                "connect_failures": self.connect_failures,
+                "timeouts": self.timeouts,
+                "since": self.since,
+            }
+
+
+class OpenAIClientManager:
+    """
+    Hands out one pooled OpenAI client per process. The client (and the
+    SDK import) is built on first use; a process forked after that, like a
+    gunicorn worker under --preload, builds its own instead of sharing the
+    parent's sockets.
+    """
+
+    def __init__(self, api_key: str | None = None, base_url: str | None = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.stats = ClientStats()
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() and ref()._forget())
+
+    def _forget(self):
+        # the parent's connections are not ours to use or close
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self.stats = ClientStats()
+
+    def settings(self) -> dict:
+        return {
+            "max_connections": OPENAI_MAX_CONNECTIONS,
+            "max_keepalive_connections": OPENAI_MAX_KEEPALIVE,
+            "keepalive_expiry": OPENAI_KEEPALIVE_EXPIRY,
+            "connect_timeout": OPENAI_CONNECT_TIMEOUT,
+            "read_timeout": OPENAI_READ_TIMEOUT,
+            "write_timeout": OPENAI_WRITE_TIMEOUT,
+            "pool_timeout": OPENAI_POOL_TIMEOUT,
+            "max_retries": OPENAI_MAX_RETRIES,
+            "http2": OPENAI_HTTP2 and http2_available(),
+        }
+
+    def _build(self):
+        import openai
+
+        settings = self.settings()
+        stats = self.stats
+
+        def on_request(request):
+            request.extensions["trace"] = stats.trace
+
+        # httpx.Limits, or the same class from whichever httpx the SDK ships with
+        limits = type(openai.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=settings["max_connections"],
+            max_keepalive_connections=settings["max_keepalive_connections"],
+            keepalive_expiry=settings["keepalive_expiry"],
+        )
+        timeout = openai.Timeout(
+            connect=settings["connect_timeout"],
+            read=settings["read_timeout"],
+            write=settings["write_timeout"],
+            pool=settings["pool_timeout"],
+        )
+        http_client = openai.DefaultHttpxClient(
+            limits=limits,
+            timeout=timeout,
+            http2=settings["http2"],
+            event_hooks={"request": [on_request], "response": [_no_sdk_retry_on_429]},
+        )
+        return openai.OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=timeout,
+            max_retries=settings["max_retries"],
+            http_client=http_client,
+        )
+
+    def get(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                self._client = self._build()
+                self._pid = os.getpid()
+            return self._client
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+
+    def to_dict(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "client_built": self._client is not None and self._pid == os.getpid(),
+            "settings": self.settings(),
+            "stats": self.stats.to_dict(),
+        }
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/openai/client", methods=["GET"])
+def openai_client_stats():
+    """Pool settings and connection reuse of this worker process's OpenAI client."""
+    manager = current_app.extensions.get("openai_clients")
+    if manager is None:
+        return jsonify({"error": "no OpenAI client configured"}), 404
+    return jsonify(manager.to_dict()), 200
@@ -0,0 +1,103 @@
+# pagination.py
+import os
+import json
+import base64
+import binascii
+import datetime
+from flask import request
+from sqlalchemy import tuple_
+from sqlalchemy.orm import defer
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+
+class PaginationError(ValueError):
+    """Bad limit/cursor/fields query parameter (the route answers 400)."""
+
+
+# ---------- CURSORS ----------
+# Opaque to clients: urlsafe base64 of [created_at iso, id] of the last row.
+
+def encode_cursor(created_at: datetime.datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise PaginationError("invalid cursor") from e
+
+
+# ---------- REQUEST ARGS ----------
+
+def page_args() -> tuple[int | None, str | None]:
+    """
+    (limit, cursor) from the query string. limit is None when neither was
+    given, so routes can keep returning a bare list to old clients.
+    """
+    raw_limit = request.args.get("limit")
+    cursor = request.args.get("cursor") or None
+    if raw_limit is None and cursor is None:
+        return None, None
+    try:
+        limit = int(raw_limit) if raw_limit is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE), cursor
+
+
+def parse_fields(allowed) -> set[str] | None:
+    """
+    ?fields=a,b,c as a set (always including "id"), or None for every field.
+    Unknown names are rejected so typos don't silently return nothing.
+    """
+    raw = request.args.get("fields")
+    if raw is None:
+        return None
+    fields = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = fields - set(allowed)
+    if unknown:
+        raise PaginationError(f"unknown fields: {', '.join(sorted(unknown))}; allowed: {', '.join(allowed)}")
+    return fields | {"id"}
+
+
+# ---------- QUERY HELPERS ----------
+
+def defer_unrequested(query, fields: set[str] | None, heavy: dict):
+    """Skip loading heavy text columns ({field name: column}) not in fields."""
+    if fields is None:
+        return query
+    return query.options(*[defer(col) for name, col in heavy.items() if name not in fields])
+
+
+def keyset_page(query, model, limit: int, cursor: str | None):
+    """
+    One page of query ordered newest first by (created_at, id), starting
+    after cursor. Returns (rows, next_cursor or None on the last page).
+    Runs as an index range scan, so deep pages cost the same as the first.
+    """
+    order = tuple_(model.created_at, model.id)
+    if cursor:
+        query = query.filter(order < decode_cursor(cursor))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def select_fields(item: dict, fields: set[str] | None) -> dict:
+    if fields is None:
+        return item
+    return {k: v for k, v in item.items() if k in fields}
+
+
+def page_response(items: list, next_cursor: str | None, limit: int) -> dict:
+    return {"items": items, "next_cursor": next_cursor, "limit": limit}
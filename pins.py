@@ -1,11 +1,48 @@
 # src/pins.py
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import update, event
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from extensions import db
-import random
-import string
+from models.submission_pin import SubmissionPin
+import os
+import time
+import hashlib
+import threading
+import functools
+from collections import OrderedDict
 
 bp = Blueprint("pins", __name__)
 
+PIN_DIGITS = 6
+PIN_SPACE = 10 ** PIN_DIGITS
+# Keys the permutation that turns counter values into PINs. Set it once
+# per deployment and keep it: a new key sends the counter over codes that
+# may already be taken (they are skipped, but each costs a retry).
+PIN_PERMUTATION_KEY = hashlib.sha256(os.getenv("PIN_PERMUTATION_KEY", "virtual-ta-pins").encode("utf-8")).digest()
+PIN_FEISTEL_ROUNDS = 8
+# Attempts per request at the counter compare-and-swap and at the insert,
+# which only conflicts when a hand-picked code lands mid-allocation.
+PIN_ALLOCATION_RETRIES = int(os.getenv("PIN_ALLOCATION_RETRIES", "20"))
+# Most candidate codes checked per IN query when skipping taken ones.
+PIN_CANDIDATE_CHUNK = 1000
+PIN_BULK_MAX = int(os.getenv("PIN_BULK_MAX", "500"))
+
+# Lookup cache for GET /api/pins/<code>, per worker process. Found codes
+# are kept PIN_CACHE_TTL seconds, unknown ones PIN_CACHE_NEGATIVE_TTL.
+# Creating or deleting a pin clears it here at commit and, through the
+# shared version row, in other processes within PIN_CACHE_VERSION_CHECK.
+PIN_CACHE_ENABLED = os.getenv("PIN_CACHE_ENABLED", "1") not in ("0", "false", "False")
+PIN_CACHE_TTL = float(os.getenv("PIN_CACHE_TTL", "300"))
+PIN_CACHE_NEGATIVE_TTL = float(os.getenv("PIN_CACHE_NEGATIVE_TTL", "30"))
+PIN_CACHE_MAX_ENTRIES = int(os.getenv("PIN_CACHE_MAX_ENTRIES", "10000"))
+PIN_CACHE_VERSION_CHECK = float(os.getenv("PIN_CACHE_VERSION_CHECK", "1"))
+
+
+class PinAllocationError(RuntimeError):
+    """No free PIN could be handed out (space exhausted or too many conflicts)."""
+
+
 # ---------- MODEL ----------
 
 class Pin(db.Model):
@@ -25,14 +62,306 @@ class Pin(db.Model):
         }
 
 
-# ---------- HELPERS ----------
+class PinCounter(db.Model):
+    """Next unused position in the PIN permutation (one row per sequence)."""
+    __tablename__ = "pin_counters"
+
+    name = db.Column(db.String(40), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class PinCacheState(db.Model):
+    """Single row whose version goes up whenever a pin or submission pin is created or deleted."""
+    __tablename__ = "pin_cache_state"
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
 
-def generate_pin_code(length: int = 6) -> str:
+# ---------- ALLOCATION ----------
+# PINs are permute_pin(0), permute_pin(1), ... : a keyed bijection on
+# [0, 10^6), so every counter value gives a different code that looks
+# random, and allocating one is a counter bump plus an INSERT no matter
+# how full the space is. Only codes handed out some other way ever need
+# skipping, and each of those is skipped once.
+
+@functools.lru_cache(maxsize=1)
+def _round_tables() -> tuple:
+    """Round function values for every (round, half) pair, built once per process."""
+    half = 10 ** (PIN_DIGITS // 2)
+    return tuple(
+        tuple(
+            int.from_bytes(hashlib.blake2b(f"{r}:{v}".encode(), key=PIN_PERMUTATION_KEY, digest_size=8).digest(), "big") % half
+            for v in range(half)
+        )
+        for r in range(PIN_FEISTEL_ROUNDS)
+    )
+
+
+def permute_pin(n: int) -> str:
+    """Counter value -> zero-padded PIN, via a balanced Feistel network on two 3-digit halves."""
+    if not 0 <= n < PIN_SPACE:
+        raise ValueError(f"counter value {n} outside the PIN space")
+    half = 10 ** (PIN_DIGITS // 2)
+    left, right = divmod(n, half)
+    for table in _round_tables():
+        left, right = right, (left + table[right]) % half
+    return f"{left * half + right:0{PIN_DIGITS}d}"
+
+
+def reserve_pin_codes(count: int, name: str = "pins") -> list[str]:
     """
-    Generate a random numeric PIN code, e.g. '483920'.
+    Claim the next `count` unused codes of the permutation in the caller's
+    transaction. Codes already in `pins` or `submission_pins` (hand-picked,
+    or made before the allocator) are skipped with one IN query per chunk
+    of candidates, so a code never means two things at lookup; the
+    counter moves past what was handed out or skipped, by compare-and-swap,
+    so concurrent requests get disjoint codes on Postgres and SQLite alike.
     """
-    digits = string.digits  # "0123456789"
-    return "".join(random.choice(digits) for _ in range(length))
+    table = PinCounter.__table__
+    for _ in range(PIN_ALLOCATION_RETRIES):
+        current = db.session.get(PinCounter, name, populate_existing=True)
+        if current is None:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(name=name, next_value=0))
+            except IntegrityError:
+                pass   # another request created it first
+            continue
+
+        start = value = current.next_value
+        codes, chunk = [], count
+        while len(codes) < count:
+            if value >= PIN_SPACE:
+                raise PinAllocationError("PIN space exhausted")
+            candidates = [permute_pin(v) for v in range(value, min(value + chunk, PIN_SPACE))]
+            taken = {c for (c,) in db.session.query(Pin.pin_code).filter(Pin.pin_code.in_(candidates)).union_all(
+                db.session.query(SubmissionPin.pin).filter(SubmissionPin.pin.in_(candidates)))}
+            for code in candidates:
+                value += 1
+                if code not in taken:
+                    codes.append(code)
+                    if len(codes) == count:
+                        break
+            chunk = min(chunk * 2, PIN_CANDIDATE_CHUNK)
+
+        bumped = db.session.execute(
+            update(table)
+            .where((table.c.name == name) & (table.c.next_value == start))
+            .values(next_value=value)
+        ).rowcount
+        if bumped:
+            return codes
+    raise PinAllocationError("PIN counter is too contended, try again")
+
+
+def _insert_pins(pins) -> bool:
+    """Insert pins under a savepoint; False (and nothing inserted) on a code conflict."""
+    try:
+        with db.session.begin_nested():
+            db.session.add_all(pins)
+        return True
+    except IntegrityError:
+        return False
+
+
+def allocate_pins(assignment_id: int, class_id: int | None, count: int = 1) -> list["Pin"]:
+    """
+    Create `count` pins with fresh codes in the caller's transaction (caller
+    commits): one counter read, one IN check and one flush for the lot. A
+    conflict at insert time means a hand-picked code landed in between;
+    the batch is then retried with the next codes.
+    """
+    for _ in range(PIN_ALLOCATION_RETRIES):
+        pins = [Pin(assignment_id=assignment_id, class_id=class_id, pin_code=code)
+                for code in reserve_pin_codes(count)]
+        if _insert_pins(pins):
+            return pins
+    raise PinAllocationError("too many PIN conflicts")
+
+
+# ---------- LOOKUP CACHE ----------
+
+class PinCache:
+    """
+    Read-through cache of code -> pin dict (None for an unknown code), so a
+    class entering the same PIN at once costs one query per worker, and
+    repeated unknown codes (typos, guessing scripts) stop reaching the
+    database. Entries are plain dicts, never ORM objects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # code -> (expires_at, payload or None)
+        self._loading = {}              # code -> Event set when its load finishes
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = self.negative_hits = self.misses = self.coalesced = self.invalidations = 0
+
+    def _sync_version(self, now: float) -> None:
+        # another process created or deleted a pin: drop everything
+        if now - self._checked_at < PIN_CACHE_VERSION_CHECK:
+            return
+        self._checked_at = now
+        version = db.session.query(PinCacheState.version).filter(PinCacheState.id == 1).scalar() or 0
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+
+    def _fresh(self, code: str, now: float):
+        entry = self._entries.get(code)
+        if entry is None or entry[0] <= now:
+            return None
+        self._entries.move_to_end(code)
+        return entry
+
+    def get(self, code: str, load):
+        """
+        Cached pin dict for code, calling load(code) on a miss; None if
+        unknown. Threads missing the same code at once share one load.
+        """
+        now = time.monotonic()
+        self._sync_version(now)
+        with self._lock:
+            entry = self._fresh(code, now)
+            if entry is not None:
+                if entry[1] is None:
+                    self.negative_hits += 1
+                else:
+                    self.hits += 1
+                return entry[1]
+            loading = self._loading.get(code)
+            if loading is None:
+                loading = self._loading[code] = threading.Event()
+                self.misses += 1
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            loading.wait(timeout=PIN_CACHE_VERSION_CHECK + 5)
+            with self._lock:
+                entry = self._fresh(code, time.monotonic())
+                if entry is not None:
+                    self.coalesced += 1
+                    return entry[1]
+                self.misses += 1
+            return load(code)   # the shared load failed or was invalidated
+
+        try:
+            payload = load(code)
+            ttl = PIN_CACHE_TTL if payload is not None else PIN_CACHE_NEGATIVE_TTL
+            with self._lock:
+                self._entries[code] = (now + ttl, payload)
+                self._entries.move_to_end(code)
+                while len(self._entries) > PIN_CACHE_MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+            return payload
+        finally:
+            with self._lock:
+                self._loading.pop(code, None)
+            loading.set()
+
+    def invalidate(self, codes=None) -> None:
+        """Forget the given codes, or everything."""
+        with self._lock:
+            if codes is None:
+                self._entries.clear()
+            else:
+                for code in codes:
+                    self._entries.pop(code, None)
+            self.invalidations += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.coalesced + self.misses
+            return {
+                "enabled": PIN_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": PIN_CACHE_MAX_ENTRIES,
+                "ttl_seconds": PIN_CACHE_TTL,
+                "negative_ttl_seconds": PIN_CACHE_NEGATIVE_TTL,
+                "version": self._version,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.negative_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+pin_cache = PinCache()
+
+
+def load_pin(code: str) -> dict | None:
+    """
+    Per-student submission PIN or class PIN with this code, from the
+    database. A submission PIN wins if a legacy code is in both tables:
+    it is the more specific of the two.
+    """
+    pin = SubmissionPin.query.filter_by(pin=code).first()
+    if pin is None:
+        pin = Pin.query.filter_by(pin_code=code).first()
+    return pin.to_dict() if pin is not None else None
+
+
+def lookup_pin(code: str) -> dict | None:
+    return pin_cache.get(code, load_pin) if PIN_CACHE_ENABLED else load_pin(code)
+
+
+def bump_pin_cache_version(connection) -> None:
+    """Tell every process to drop its cached lookups (in the caller's transaction)."""
+    table = PinCacheState.__table__
+    bumped = connection.execute(
+        update(table).where(table.c.id == 1).values(version=table.c.version + 1)
+    ).rowcount
+    if not bumped:
+        connection.execute(table.insert().values(id=1, version=1))
+
+
+@event.listens_for(Session, "after_flush")
+def _track_pin_changes(session, flush_context):
+    # new/deleted still list what this flush wrote
+    codes = {
+        obj.pin_code if isinstance(obj, Pin) else obj.pin
+        for obj in (*session.new, *session.deleted)
+        if isinstance(obj, (Pin, SubmissionPin))
+    }
+    if codes:
+        bump_pin_cache_version(session.connection())
+        session.info.setdefault("pin_codes_changed", set()).update(codes)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_pin_cache(session):
+    # savepoints fire this too; other requests only see the outer commit
+    if session.in_nested_transaction():
+        return
+    codes = session.info.pop("pin_codes_changed", None)
+    if codes:
+        pin_cache.invalidate(codes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pin_changes(session):
+    # a failed savepoint (e.g. a code conflict) leaves earlier changes pending
+    if session.in_nested_transaction():
+        return
+    session.info.pop("pin_codes_changed", None)
+
+
+def _int_arg(data: dict, *names, required: bool = False):
+    """First of names in data as an int. Returns (value, error message)."""
+    raw = next((data.get(n) for n in names if data.get(n) not in (None, "", [])), None)
+    if raw is None:
+        alias = f" (or {names[1]})" if len(names) > 1 else ""
+        return None, (f"{names[0]}{alias} is required" if required else None)
+    try:
+        return int(raw), None
+    except (TypeError, ValueError):
+        return None, f"{names[0]} must be an integer" + ("" if required else " if provided")
 
 
 # ---------- ROUTES ----------
@@ -51,7 +380,7 @@ def create_pin():
     This endpoint:
     - Validates assignment_id (required, int)
     - Validates class_id (optional, int if present)
-    - Auto-generates a 6-digit numeric pin_code if none provided
+    - Allocates a 6-digit numeric pin_code if none provided
     - Returns: { id, assignment_id, class_id, pin_code }
     """
     data = request.get_json(silent=True) or {}
@@ -60,61 +389,85 @@ def create_pin():
     # print("DEBUG /api/pins payload:", data, flush=True)
 
     # --- assignment_id: required, must be an integer ---
-    raw_assignment_id = data.get("assignment_id") or data.get("assignmentId")
-    if raw_assignment_id is None:
-        return jsonify({"error": "assignment_id (or assignmentId) is required"}), 400
-
-    try:
-        assignment_id = int(raw_assignment_id)
-    except (TypeError, ValueError):
-        return jsonify({"error": "assignment_id must be an integer"}), 400
+    assignment_id, error = _int_arg(data, "assignment_id", "assignmentId", required=True)
+    if error:
+        return jsonify({"error": error}), 400
 
     # --- class_id: optional, integer if provided ---
-    raw_class_id = data.get("class_id") or data.get("classId")
-    class_id = None
-    if raw_class_id not in (None, "", []):
-        try:
-            class_id = int(raw_class_id)
-        except (TypeError, ValueError):
-            return jsonify({"error": "class_id must be an integer if provided"}), 400
+    class_id, error = _int_arg(data, "class_id", "classId")
+    if error:
+        return jsonify({"error": error}), 400
 
-    # --- pin_code: optional string; auto-generate if missing ---
+    # --- pin_code: optional string; allocate a fresh one if missing ---
     raw_pin_code = data.get("pin_code") or data.get("pinCode")
-    if raw_pin_code:
-        pin_code = str(raw_pin_code).strip()
-    else:
-        # Auto-generate a unique 6-digit numeric PIN
-        pin_code = generate_pin_code()
-        while Pin.query.filter_by(pin_code=pin_code).first() is not None:
-            pin_code = generate_pin_code()
-
-    # --- create and save Pin ---
-    pin = Pin(
-        assignment_id=assignment_id,
-        class_id=class_id,
-        pin_code=pin_code,
-    )
-
     try:
-        db.session.add(pin)
+        if raw_pin_code:
+            pin = Pin(assignment_id=assignment_id, class_id=class_id, pin_code=str(raw_pin_code).strip())
+            db.session.add(pin)
+            db.session.flush()
+        else:
+            pin = allocate_pins(assignment_id, class_id)[0]
         db.session.commit()
-    except Exception as e:
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "pin_code already in use"}), 409
+    except PinAllocationError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 503
+    except Exception:
         db.session.rollback()
         # Log the full error on the server
-        print("ERROR creating PIN:", e, flush=True)
+        current_app.logger.exception("creating PIN failed")
         return jsonify({"error": "Internal error creating PIN"}), 500
 
     return jsonify(pin.to_dict()), 201
 
 
+@bp.route("/api/pins/bulk", methods=["POST"])
+def create_pins_bulk():
+    """
+    Allocate PINs for a whole class at once.
+
+    JSON: { "assignment_id": 2, "class_id": 4850, "count": 30 }
+    Returns 201 with { "pins": [ { id, assignment_id, class_id, pin_code }, ... ] }
+    """
+    data = request.get_json(silent=True) or {}
+    assignment_id, error = _int_arg(data, "assignment_id", "assignmentId", required=True)
+    if error:
+        return jsonify({"error": error}), 400
+    class_id, error = _int_arg(data, "class_id", "classId")
+    if error:
+        return jsonify({"error": error}), 400
+    count, error = _int_arg(data, "count", required=True)
+    if error:
+        return jsonify({"error": error}), 400
+    if not 1 <= count <= PIN_BULK_MAX:
+        return jsonify({"error": f"count must be between 1 and {PIN_BULK_MAX}"}), 400
+
+    try:
+        pins = allocate_pins(assignment_id, class_id, count)
+        db.session.commit()
+    except PinAllocationError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 503
+    return jsonify({"pins": [p.to_dict() for p in pins]}), 201
+
+
+@bp.route("/api/pins/cache", methods=["GET"])
+def pin_cache_stats():
+    """Hit rates of this worker process's PIN lookup cache."""
+    return jsonify(pin_cache.to_dict()), 200
+
+
 @bp.route("/api/pins/<string:pin_code>", methods=["GET"])
 def get_pin_by_code(pin_code):
     """
-    Look up a pin by its code.
+    Look up a pin (class or per-student submission PIN) by its code.
     Used by the student PIN entry flow to find the assignment via PIN.
+    Served from the lookup cache; unknown codes are cached too.
     """
-    pin = Pin.query.filter_by(pin_code=pin_code).first()
+    pin = lookup_pin(pin_code)
     if not pin:
         return jsonify({"error": "PIN not found"}), 404
 
-    return jsonify(pin.to_dict()), 200
+    return jsonify(pin), 200
@@ -0,0 +1,313 @@
+# rate_limit.py
+import os
+import time
+import random
+from flask import Blueprint, jsonify
+from sqlalchemy import select, insert, update, delete, func, case
+from sqlalchemy.exc import IntegrityError, OperationalError
+from extensions import db
+
+bp = Blueprint("rate_limit", __name__)
+
+# Budgets for the OpenAI account/model. Defaults are conservative tier-1 numbers.
+OPENAI_RPM_LIMIT = float(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = float(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+# Longest a single caller will wait for budget before giving up.
+OPENAI_MAX_RATE_WAIT = float(os.getenv("OPENAI_MAX_RATE_WAIT", "300"))
+# Tokens reserved for the model's reply when estimating a request's cost.
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("COMPLETION_TOKEN_ESTIMATE", "700"))
+# Rough chars-per-token ratio for English prose.
+CHARS_PER_TOKEN = 4
+# Times a limiter update is retried, with growing jittered pauses, while
+# another process holds the database lock (SQLite: "database is locked").
+RATE_LIMIT_LOCK_RETRIES = int(os.getenv("RATE_LIMIT_LOCK_RETRIES", "6"))
+
+
+class RateLimitTimeout(Exception):
+    """Raised when budget didn't free up within OPENAI_MAX_RATE_WAIT."""
+
+
+class RateLimitBusy(Exception):
+    """Raised when the shared limiter state stayed locked through every retry."""
+
+
+# ---------- MODELS ----------
+# Shared state lives in the database so every gunicorn worker and the
+# grading worker draw from the same buckets.
+
+class RateLimitState(db.Model):
+    __tablename__ = "rate_limit_state"
+
+    name = db.Column(db.String(120), primary_key=True)
+    request_tokens = db.Column(db.Float, nullable=False)
+    token_tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)          # epoch seconds
+    blocked_until = db.Column(db.Float, nullable=False, default=0.0)
+    total_waits = db.Column(db.Integer, nullable=False, default=0)
+    total_wait_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    max_wait_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    rate_limited_responses = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RateLimitWaiter(db.Model):
+    """One row per caller currently waiting for budget (the queue)."""
+    __tablename__ = "rate_limit_waiters"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, index=True)
+    tokens = db.Column(db.Integer, nullable=False)
+    since = db.Column(db.Float, nullable=False)
+
+
+# ---------- HELPERS ----------
+
+def estimate_tokens(*texts: str, completion_tokens: int = COMPLETION_TOKEN_ESTIMATE) -> int:
+    """Cheap upper-ish estimate of prompt + completion tokens for a request."""
+    chars = sum(len(t or "") for t in texts)
+    return chars // CHARS_PER_TOKEN + completion_tokens
+
+
+def _is_lock_error(exc: OperationalError) -> bool:
+    """SQLite's "database is locked", or a Postgres lock timeout or deadlock."""
+    message = str(getattr(exc, "orig", exc)).lower()
+    return "locked" in message or "deadlock" in message or "lock timeout" in message
+
+
+def retry_after_seconds(exc, default: float = 5.0) -> float:
+    """
+    Read Retry-After (or OpenAI's retry-after-ms) from an
+    openai.APIStatusError's response headers.
+    """
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return default
+
+
+class RateLimiter:
+    """
+    Token-bucket scheduler for one OpenAI budget, shared through the DB.
+
+    Two buckets refill continuously: requests (rpm/60 per second) and tokens
+    (tpm/60 per second). acquire() takes one request plus the estimated
+    tokens, sleeping until both are available; a 429 pushes blocked_until
+    forward so every process backs off together.
+    """
+
+    def __init__(self, name: str, rpm: float = OPENAI_RPM_LIMIT, tpm: float = OPENAI_TPM_LIMIT,
+                 max_wait: float = OPENAI_MAX_RATE_WAIT):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_wait = max_wait
+
+    # --- shared-state primitives (each runs in its own short transaction) ---
+
+    def _locked_row(self, conn, now: float):
+        table = RateLimitState.__table__
+        row = conn.execute(
+            select(table).where(table.c.name == self.name).with_for_update()
+        ).mappings().first()
+        if row is not None:
+            return dict(row)
+        fresh = {
+            "name": self.name,
+            "request_tokens": self.rpm,
+            "token_tokens": self.tpm,
+            "updated_at": now,
+            "blocked_until": 0.0,
+            "total_waits": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "rate_limited_responses": 0,
+        }
+        conn.execute(insert(table).values(**fresh))
+        return fresh
+
+    def _refill(self, row, now: float):
+        elapsed = max(0.0, now - row["updated_at"])
+        row["request_tokens"] = min(self.rpm, row["request_tokens"] + elapsed * self.rpm / 60.0)
+        row["token_tokens"] = min(self.tpm, row["token_tokens"] + elapsed * self.tpm / 60.0)
+        row["updated_at"] = now
+
+    def _save(self, conn, row):
+        table = RateLimitState.__table__
+        conn.execute(
+            update(table).where(table.c.name == self.name).values(
+                {k: v for k, v in row.items() if k != "name"}
+            )
+        )
+
+    def _run(self, fn):
+        """
+        fn(conn) in a transaction of its own, returning its result. Retried
+        when another process holds the lock or created the row first;
+        raises RateLimitBusy once RATE_LIMIT_LOCK_RETRIES are used up.
+        """
+        for attempt in range(RATE_LIMIT_LOCK_RETRIES + 1):
+            try:
+                with db.engine.begin() as conn:
+                    if conn.dialect.name == "sqlite":
+                        # pysqlite would run the SELECT outside any transaction
+                        # (FOR UPDATE is a no-op there), letting two processes
+                        # spend the same budget: take the write lock up front
+                        conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    return fn(conn)
+            except IntegrityError:
+                # two processes created the row at once; the loser retries
+                pass
+            except OperationalError as e:
+                if not _is_lock_error(e):
+                    raise
+            if attempt < RATE_LIMIT_LOCK_RETRIES:
+                time.sleep(random.uniform(0, 0.02 * 2 ** attempt))
+        raise RateLimitBusy(f"rate limit state {self.name!r} stayed locked "
+                            f"through {RATE_LIMIT_LOCK_RETRIES} retries")
+
+    def _try_take(self, tokens: int) -> float:
+        """Take budget if available. Returns 0 on success, else seconds to wait."""
+        # A request bigger than the whole bucket could never run; let it
+        # through once the bucket is full instead of waiting forever.
+        tokens = min(tokens, self.tpm)
+
+        def take(conn):
+            now = time.time()
+            row = self._locked_row(conn, now)
+            self._refill(row, now)
+            if now < row["blocked_until"]:
+                wait = row["blocked_until"] - now
+            elif row["request_tokens"] >= 1 and row["token_tokens"] >= tokens:
+                row["request_tokens"] -= 1
+                row["token_tokens"] -= tokens
+                wait = 0.0
+            else:
+                wait = max(
+                    (1 - row["request_tokens"]) * 60.0 / self.rpm,
+                    (tokens - row["token_tokens"]) * 60.0 / self.tpm,
+                )
+            self._save(conn, row)
+            return wait
+        return self._run(take)
+
+    def _record_wait(self, waited: float):
+        def record(conn):
+            row = self._locked_row(conn, time.time())
+            row["total_waits"] += 1
+            row["total_wait_seconds"] += waited
+            row["max_wait_seconds"] = max(row["max_wait_seconds"], waited)
+            self._save(conn, row)
+        self._run(record)
+
+    # --- public API ---
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Block until one request and `tokens` tokens are available.
+        Returns seconds spent waiting; raises RateLimitTimeout past max_wait.
+        """
+        wait = self._try_take(tokens)
+        if wait <= 0:
+            return 0.0
+
+        waiters = RateLimitWaiter.__table__
+        started = time.time()
+        waiter_id = self._run(lambda conn: conn.execute(
+            insert(waiters).values(name=self.name, tokens=tokens, since=started)
+        ).inserted_primary_key[0])
+        try:
+            while wait > 0:
+                if time.time() - started + wait > self.max_wait:
+                    raise RateLimitTimeout(
+                        f"OpenAI rate budget not available within {self.max_wait:.0f}s"
+                    )
+                # sleep in short slices with jitter so waiters don't stampede
+                time.sleep(min(wait, 5.0) + random.uniform(0, 0.25))
+                wait = self._try_take(tokens)
+        finally:
+            self._run(lambda conn: conn.execute(delete(waiters).where(waiters.c.id == waiter_id)))
+
+        waited = time.time() - started
+        self._record_wait(waited)
+        return waited
+
+    def settle(self, estimated: int, actual: int | None):
+        """
+        Correct the token bucket once the real usage is known. A refund
+        never fills it past its capacity (tpm).
+        """
+        if actual is None or actual == estimated:
+            return
+        table = RateLimitState.__table__
+        corrected = table.c.token_tokens + (estimated - actual)
+        self._run(lambda conn: conn.execute(
+            update(table).where(table.c.name == self.name).values(
+                token_tokens=case((corrected > self.tpm, self.tpm), else_=corrected)
+            )
+        ))
+
+    def penalize(self, seconds: float):
+        """A 429 came back: pause everyone sharing this budget for `seconds`."""
+        def block(conn):
+            row = self._locked_row(conn, time.time())
+            row["blocked_until"] = max(row["blocked_until"], time.time() + seconds)
+            row["rate_limited_responses"] += 1
+            self._save(conn, row)
+        self._run(block)
+
+    def status(self) -> dict:
+        now = time.time()
+        row = db.session.get(RateLimitState, self.name)
+        # ignore waiters whose process died without cleaning up
+        stale = now - self.max_wait - 60
+        depth, queued_tokens, oldest = db.session.query(
+            func.count(RateLimitWaiter.id),
+            func.coalesce(func.sum(RateLimitWaiter.tokens), 0),
+            func.min(RateLimitWaiter.since),
+        ).filter(RateLimitWaiter.name == self.name, RateLimitWaiter.since > stale).one()
+
+        out = {
+            "name": self.name,
+            "rpm_limit": self.rpm,
+            "tpm_limit": self.tpm,
+            "queue_depth": depth,
+            "queued_tokens": int(queued_tokens),
+            "oldest_wait_seconds": round(now - oldest, 3) if oldest else 0.0,
+        }
+        if row is None:
+            return out
+        elapsed = max(0.0, now - row.updated_at)
+        out.update({
+            "requests_available": round(min(self.rpm, row.request_tokens + elapsed * self.rpm / 60.0), 2),
+            "tokens_available": int(min(self.tpm, row.token_tokens + elapsed * self.tpm / 60.0)),
+            "blocked_for_seconds": round(max(0.0, row.blocked_until - now), 3),
+            "total_waits": row.total_waits,
+            "avg_wait_seconds": round(row.total_wait_seconds / row.total_waits, 3) if row.total_waits else 0.0,
+            "max_wait_seconds": round(row.max_wait_seconds, 3),
+            "rate_limited_responses": row.rate_limited_responses,
+        })
+        return out
+
+
+_limiters: dict[str, RateLimiter] = {}
+
+
+def get_limiter(model: str) -> RateLimiter:
+    name = f"openai:{model}"
+    if name not in _limiters:
+        _limiters[name] = RateLimiter(name)
+    return _limiters[name]
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/openai/rate_limit", methods=["GET"])
+def rate_limit_status():
+    """Current budgets, queue depth and wait stats for every known limiter."""
+    names = [r.name for r in RateLimitState.query.order_by(RateLimitState.name).all()]
+    return jsonify([RateLimiter(n).status() for n in names]), 200
@@ -0,0 +1,52 @@
+# schema.py
+import os
+from sqlalchemy import inspect
+from extensions import db
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ALEMBIC_INI = os.path.join(BASE_DIR, "alembic.ini")
+
+
+def _alembic_config(connection):
+    from alembic.config import Config
+    cfg = Config(ALEMBIC_INI)
+    cfg.set_main_option("script_location", os.path.join(BASE_DIR, "migrations"))
+    cfg.attributes["connection"] = connection
+    return cfg
+
+
+def migrate_database() -> str:
+    """
+    Bring the app's database to the latest schema (needs an app context).
+
+    A database without any tables gets db.create_all() and is stamped at
+    the head revision; the early revisions only alter tables that
+    create_all used to make, so they can't build a schema from nothing.
+    Anything else runs `alembic upgrade head` on the same connection.
+    Returns "created" or "upgraded".
+    """
+    from alembic import command   # alembic is only needed here, not per request
+
+    with db.engine.begin() as connection:
+        cfg = _alembic_config(connection)
+        if not set(inspect(connection).get_table_names()) - {"alembic_version"}:
+            db.metadata.create_all(connection)
+            command.stamp(cfg, "head")
+            return "created"
+        command.upgrade(cfg, "head")
+        return "upgraded"
+
+
+def new_revision(message: str, autogenerate: bool = True, version_path: str | None = None) -> str:
+    """
+    Write a new revision file (needs an app context). With autogenerate
+    the database, which should be at head, is compared with the models'
+    metadata and the differences become the upgrade/downgrade steps; review
+    them before committing. Returns the path of the new file.
+    """
+    from alembic import command
+
+    with db.engine.begin() as connection:
+        script = command.revision(_alembic_config(connection), message=message,
+                                  autogenerate=autogenerate, version_path=version_path)
+    return script.path
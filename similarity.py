@@ -0,0 +1,281 @@
+# similarity.py
+import os
+import re
+import sys
+import random
+import hashlib
+import datetime
+import unicodedata
+from array import array
+from sqlalchemy import delete, select, and_
+from sqlalchemy.orm import aliased
+from extensions import db
+
+# Near-duplicate detection: each submission's text becomes a MinHash
+# signature over word shingles, and the signature's bands go into an LSH
+# index table, so "which submissions look like this one" reads a few
+# index rows instead of comparing against every other submission.
+SIMILARITY_SHINGLE_WORDS = int(os.getenv("SIMILARITY_SHINGLE_WORDS", "5"))
+SIMILARITY_NUM_PERM = 128
+# 32 bands of 4 rows: pairs with Jaccard similarity around 0.42 and up
+# land in a shared bucket (about 0.5 -> 87%, 0.7 -> 99.9%).
+SIMILARITY_BANDS = 32
+SIMILARITY_ROWS = SIMILARITY_NUM_PERM // SIMILARITY_BANDS
+# Default cut-off on estimated Jaccard similarity for reported matches.
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
+# Characters of submission text a signature covers, whatever the grading
+# mode truncates to: text copied past the first pages must still match.
+SIMILARITY_CHAR_BUDGET = int(os.getenv("SIMILARITY_CHAR_BUDGET", "400000"))
+# Stored with each signature; anything else is recomputed by similarity-index.
+SIGNATURE_VERSION = (f"minhash-v1;k={SIMILARITY_SHINGLE_WORDS};perm={SIMILARITY_NUM_PERM};"
+                     f"bands={SIMILARITY_BANDS};chars={SIMILARITY_CHAR_BUDGET}")
+
+_WORD = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+_MAX32 = (1 << 32) - 1
+# (a, b) of the hash functions h(x) = (a*x + b) mod p, fixed so every
+# process computes the same signatures
+_rng = random.Random(20241017)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(SIMILARITY_NUM_PERM)]
+del _rng
+# Shingles hashed per numpy step in minhash(): bounds its temporaries to
+# a few MB however long the text is.
+MINHASH_BLOCK = 4096
+
+
+# ---------- MODELS ----------
+
+class SubmissionSignature(db.Model):
+    __tablename__ = "submission_signatures"
+
+    submission_id = db.Column(db.Integer, db.ForeignKey("submissions.id"), primary_key=True)
+    assignment_id = db.Column(db.Integer, nullable=False, index=True)
+    version = db.Column(db.String(80), nullable=False)
+    text_hash = db.Column(db.String(64), nullable=False)       # sha256 of the text it was built from
+    shingle_count = db.Column(db.Integer, nullable=False)
+    minhash = db.Column(db.LargeBinary, nullable=False)        # SIMILARITY_NUM_PERM uint32, little-endian
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class SimilarityBand(db.Model):
+    """LSH index: one row per (submission, band), keyed by the band's hash."""
+    __tablename__ = "similarity_bands"
+
+    submission_id = db.Column(db.Integer, db.ForeignKey("submissions.id"), primary_key=True)
+    band = db.Column(db.SmallInteger, primary_key=True)
+    assignment_id = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_similarity_bands_lookup", "assignment_id", "band", "bucket"),
+    )
+
+
+# ---------- SIGNATURES ----------
+
+def _hash64(value: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), "little")
+
+
+def shingles(text: str) -> set[int]:
+    """64-bit hashes of the overlapping SIMILARITY_SHINGLE_WORDS-word runs of text."""
+    words = _WORD.findall(unicodedata.normalize("NFKC", text or "").lower())
+    k = SIMILARITY_SHINGLE_WORDS
+    if len(words) < k:
+        return {_hash64(" ".join(words).encode())} if words else set()
+    return {_hash64(" ".join(words[i:i + k]).encode()) for i in range(len(words) - k + 1)}
+
+
+def _mod_prime(np, v):
+    """v mod 2**61 - 1 for uint64 v below 2**64 (a Mersenne prime: fold the high bits)."""
+    v = (v & np.uint64(_PRIME)) + (v >> np.uint64(61))
+    return np.where(v >= np.uint64(_PRIME), v - np.uint64(_PRIME), v)
+
+
+def minhash(hashes: set[int]) -> array:
+    """
+    Smallest value of each permutation over the shingle hashes.
+
+    Vectorized with numpy, exactly like min((a*x + b) % p) in Python ints:
+    a*x is split in 32-bit halves so no product exceeds 64 bits, and each
+    power of two above 2**61 folds back since 2**61 = 1 (mod p).
+    """
+    if not hashes:
+        return array("I", [_MAX32] * SIMILARITY_NUM_PERM)
+    import numpy as np
+    u64, low32 = np.uint64, np.uint64(_MAX32)
+    perms = np.array(_PERMUTATIONS, dtype=np.uint64)
+    a, b = perms[:, :1], perms[:, 1:]
+    a_hi, a_lo = a >> u64(32), a & low32            # a_hi < 2**29
+    xs = _mod_prime(np, np.fromiter(hashes, dtype=np.uint64, count=len(hashes)))
+
+    lowest = np.full(SIMILARITY_NUM_PERM, _PRIME, dtype=np.uint64)
+    for start in range(0, len(xs), MINHASH_BLOCK):
+        x = xs[start:start + MINHASH_BLOCK]
+        x_hi, x_lo = x >> u64(32), x & low32
+        low = _mod_prime(np, a_lo * x_lo)                # < 2**64
+        mid = a_hi * x_lo + a_lo * x_hi                  # < 2**62, weight 2**32
+        high = a_hi * x_hi                               # < 2**58, weight 2**64 = 8 (mod p)
+        total = (low + (mid >> u64(29)) + ((mid & u64((1 << 29) - 1)) << u64(32))
+                 + (high << u64(3)) + b)                 # < 2**63
+        np.minimum(lowest, _mod_prime(np, total).min(axis=1), out=lowest)
+    return array("I", (lowest & low32).astype(np.uint32).tobytes())
+
+
+def pack(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack(data: bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def band_buckets(values: array) -> list[int]:
+    """Signed 64-bit hash of each band's rows (fits a BIGINT column)."""
+    r = SIMILARITY_ROWS
+    return [
+        int.from_bytes(hashlib.blake2b(pack(values[i * r:(i + 1) * r]), digest_size=8).digest(),
+                       "little", signed=True)
+        for i in range(SIMILARITY_BANDS)
+    ]
+
+
+def estimate(a: array, b: array) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / SIMILARITY_NUM_PERM
+
+
+# ---------- INDEX ----------
+
+def index_submission(submission_id: int, assignment_id: int, text: str) -> bool:
+    """
+    Store the signature of a submission's text and its LSH bands, in the
+    caller's transaction. Skipped (False) when the same text is already
+    indexed with the current parameters. Texts too short to shingle get a
+    signature row but no bands, so they never match anything.
+    """
+    text_hash = hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+    sig = db.session.get(SubmissionSignature, submission_id)
+    if sig is not None and sig.version == SIGNATURE_VERSION and sig.text_hash == text_hash:
+        return False
+
+    hashes = shingles(text)
+    values = minhash(hashes)
+    if sig is None:
+        sig = SubmissionSignature(submission_id=submission_id)
+        db.session.add(sig)
+    sig.assignment_id = assignment_id
+    sig.version = SIGNATURE_VERSION
+    sig.text_hash = text_hash
+    sig.shingle_count = len(hashes)
+    sig.minhash = pack(values)
+    sig.created_at = datetime.datetime.utcnow()
+
+    bands = SimilarityBand.__table__
+    db.session.execute(delete(bands).where(bands.c.submission_id == submission_id))
+    if hashes:
+        db.session.execute(bands.insert(), [
+            {"submission_id": submission_id, "band": i, "assignment_id": assignment_id, "bucket": bucket}
+            for i, bucket in enumerate(band_buckets(values))
+        ])
+    return True
+
+
+def forget(submission_ids) -> None:
+    """Drop signatures and bands of submissions about to be deleted (caller commits)."""
+    ids = list(submission_ids)
+    if not ids:
+        return
+    db.session.execute(delete(SimilarityBand.__table__).where(SimilarityBand.submission_id.in_(ids)))
+    db.session.execute(delete(SubmissionSignature.__table__).where(SubmissionSignature.submission_id.in_(ids)))
+
+
+def indexed_ids(assignment_id: int) -> set[int]:
+    """Submissions of the assignment with a current signature."""
+    return set(db.session.scalars(
+        select(SubmissionSignature.submission_id).where(
+            (SubmissionSignature.assignment_id == assignment_id)
+            & (SubmissionSignature.version == SIGNATURE_VERSION)
+        )
+    ))
+
+
+def _signatures(ids) -> dict[int, array]:
+    rows = db.session.execute(
+        select(SubmissionSignature.submission_id, SubmissionSignature.minhash).where(
+            SubmissionSignature.submission_id.in_(list(ids))
+            & (SubmissionSignature.version == SIGNATURE_VERSION)
+        )
+    )
+    return {sid: unpack(data) for sid, data in rows}
+
+
+def similar_to(submission_id: int, threshold: float = SIMILARITY_THRESHOLD,
+               limit: int = 10) -> list[tuple[int, float]] | None:
+    """
+    [(other submission id, estimated similarity)] for submissions of the
+    same assignment sharing an LSH bucket with this one and at or above
+    threshold, most similar first. None when it isn't indexed yet.
+    """
+    own = _signatures([submission_id]).get(submission_id)
+    if own is None:
+        return None
+    mine, other = aliased(SimilarityBand), aliased(SimilarityBand)
+    candidates = db.session.scalars(
+        select(other.submission_id).distinct().join(mine, and_(
+            other.assignment_id == mine.assignment_id,
+            other.band == mine.band,
+            other.bucket == mine.bucket,
+        )).where((mine.submission_id == submission_id) & (other.submission_id != submission_id))
+    ).all()
+    scored = [(sid, estimate(own, sig)) for sid, sig in _signatures(candidates).items()]
+    scored = [(sid, score) for sid, score in scored if score >= threshold]
+    scored.sort(key=lambda m: (-m[1], m[0]))
+    return scored[:limit]
+
+
+def similar_pairs(assignment_id: int, threshold: float = SIMILARITY_THRESHOLD) -> list[tuple[int, int, float]]:
+    """
+    [(submission id, submission id, estimated similarity)] for every pair
+    of the assignment's submissions at or above threshold, most similar
+    first. Only pairs sharing an LSH bucket are scored.
+    """
+    left, right = aliased(SimilarityBand), aliased(SimilarityBand)
+    pairs = db.session.execute(
+        select(left.submission_id, right.submission_id).distinct().join(right, and_(
+            right.assignment_id == left.assignment_id,
+            right.band == left.band,
+            right.bucket == left.bucket,
+            right.submission_id > left.submission_id,
+        )).where(left.assignment_id == assignment_id)
+    ).all()
+    sigs = _signatures({sid for pair in pairs for sid in pair})
+    scored = []
+    for a, b in pairs:
+        if a in sigs and b in sigs:
+            score = estimate(sigs[a], sigs[b])
+            if score >= threshold:
+                scored.append((a, b, score))
+    scored.sort(key=lambda p: (-p[2], p[0], p[1]))
+    return scored
+
+
+def stale_ids(submission_ids) -> list[int]:
+    """Which of these submissions have no signature with the current parameters."""
+    ids = list(submission_ids)
+    if not ids:
+        return []
+    current = set(db.session.scalars(
+        select(SubmissionSignature.submission_id).where(
+            SubmissionSignature.submission_id.in_(ids) & (SubmissionSignature.version == SIGNATURE_VERSION)
+        )
+    ))
+    return [i for i in ids if i not in current]
+
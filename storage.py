@@ -0,0 +1,280 @@
+# storage.py
+import os
+import re
+import time
+import uuid
+import hashlib
+import datetime
+import tempfile
+from collections import namedtuple
+from flask import Blueprint, jsonify, current_app, has_app_context
+from sqlalchemy import select, update, delete, func, event
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+
+bp = Blueprint("storage", __name__)
+
+# Default for apps that don't set app.config["UPLOAD_FOLDER"]
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
+STORAGE_CHUNK_BYTES = int(os.getenv("STORAGE_CHUNK_BYTES", str(1024 * 1024)))
+
+_OBJECT_NAME = re.compile(r"^([0-9a-f]{64})\.([a-z0-9]+)$")
+
+
+# ---------- MODEL ----------
+
+class StoredObject(db.Model):
+    """One file on disk per distinct (bytes, extension); refcount = submissions using it."""
+    __tablename__ = "stored_objects"
+
+    path = db.Column(db.String(300), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # sha256 of file bytes
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+# ---------- HELPERS ----------
+
+def objects_dir() -> str:
+    """
+    Content-addressed uploads live under <UPLOAD_FOLDER>/objects/ab/<sha256>.<ext>,
+    UPLOAD_FOLDER being the current app's config value.
+    """
+    folder = current_app.config.get("UPLOAD_FOLDER", UPLOAD_FOLDER) if has_app_context() else UPLOAD_FOLDER
+    return os.path.join(folder, "objects")
+
+
+def object_path(digest: str, ext: str) -> str:
+    return os.path.join(objects_dir(), digest[:2], f"{digest}.{ext}")
+
+
+def object_digest(path: str) -> str | None:
+    """sha256 of a stored object, read from its name (objects are immutable)."""
+    parent = os.path.basename(os.path.dirname(path))
+    m = _OBJECT_NAME.match(os.path.basename(path))
+    if m is None or parent != m.group(1)[:2]:
+        return None
+    return m.group(1)
+
+
+def _tmp_dir() -> str:
+    tmp_dir = os.path.join(objects_dir(), "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+
+def _stream_to_temp(stream) -> tuple[str, str, int]:
+    """Copy stream to a temp file under objects_dir() in fixed-size chunks, hashing as it goes."""
+    tmp_dir = _tmp_dir()
+    h = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(STORAGE_CHUNK_BYTES), b""):
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path, h.hexdigest(), size
+
+
+def add_ref(path: str, digest: str, size: int) -> None:
+    """refcount += 1 for path, creating its row on first use, in the caller's transaction."""
+    table = StoredObject.__table__
+    bump = update(table).where(table.c.path == path).values(refcount=table.c.refcount + 1)
+    if db.session.execute(bump).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(
+                path=path, content_hash=digest, size=size, refcount=1,
+                created_at=datetime.datetime.utcnow(),
+            ))
+    except IntegrityError:
+        # a concurrent upload of the same bytes inserted the row first
+        db.session.execute(bump)
+
+
+StagedUpload = namedtuple("StagedUpload", "filename tmp_path digest size ext seconds")
+
+
+def stage_upload(file_storage) -> StagedUpload:
+    """
+    Copy an uploaded file (Werkzeug FileStorage) to a temp file and hash it,
+    reading STORAGE_CHUNK_BYTES at a time, never the whole upload. Does not
+    touch the database; finish with store_staged() or discard_staged().
+    """
+    return stage_stream(file_storage.filename, file_storage.stream)
+
+
+def stage_stream(filename: str, stream) -> StagedUpload:
+    """stage_upload for any readable stream, e.g. one member of a ZIP archive."""
+    started = time.monotonic()
+    ext = os.path.splitext(filename or "")[1].lstrip(".").lower() or "bin"
+    tmp_path, digest, size = _stream_to_temp(stream)
+    return StagedUpload(filename, tmp_path, digest, size, ext, time.monotonic() - started)
+
+
+def store_staged(staged: StagedUpload) -> tuple[str, bool]:
+    """
+    Put a staged upload at its content-addressed path and take a reference
+    to it in the current transaction. Returns (path, deduped); deduped means
+    the same bytes were already stored and nothing new was kept on disk.
+
+    The temp copy is kept until the transaction ends: a concurrent release()
+    of the same bytes may delete the file after we saw it, so once we commit
+    it is put back from the copy if it went missing.
+    """
+    path = object_path(staged.digest, staged.ext)
+    add_ref(path, staged.digest, staged.size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        os.link(staged.tmp_path, path)
+        deduped = False
+    except FileExistsError:
+        deduped = True
+    db.session.info.setdefault("storage_staged", []).append((staged.tmp_path, path))
+    return path, deduped
+
+
+def discard_staged(staged: StagedUpload) -> None:
+    try:
+        os.unlink(staged.tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def save_upload(file_storage) -> tuple[str, bool]:
+    """stage_upload + store_staged in one go. Returns (path, deduped)."""
+    return store_staged(stage_upload(file_storage))
+
+
+def release(path: str) -> None:
+    """
+    Drop one reference to a stored object in the current transaction. The
+    row goes with its last reference and the file is deleted once that
+    transaction commits. Paths outside the object store (legacy uploads)
+    are left alone.
+    """
+    if object_digest(path) is None:
+        return
+    table = StoredObject.__table__
+    db.session.execute(
+        update(table).where(table.c.path == path).values(refcount=table.c.refcount - 1)
+    )
+    removed = db.session.execute(
+        delete(table).where((table.c.path == path) & (table.c.refcount <= 0))
+    ).rowcount
+    if removed:
+        db.session.info.setdefault("storage_unlink", []).append(path)
+
+
+def _remove_object(path: str) -> None:
+    """
+    Delete a released object's file, unless an upload of the same bytes
+    re-added its row after our commit: the file is moved aside first and
+    put back if the row is there (that upload restores it otherwise).
+    """
+    aside = os.path.join(_tmp_dir(), f"released-{uuid.uuid4().hex}")
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return
+    table = StoredObject.__table__
+    with db.engine.connect() as conn:
+        in_use = conn.execute(select(table.c.path).where(table.c.path == path)).first()
+    if in_use is not None:
+        os.replace(aside, path)
+    else:
+        os.unlink(aside)
+
+
+@event.listens_for(Session, "after_commit")
+def _unlink_released(session):
+    # savepoints fire this too; files only change with the outer transaction
+    if session.in_nested_transaction():
+        return
+    for tmp_path, path in session.info.pop("storage_staged", []):
+        if os.path.exists(path):
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    for path in session.info.pop("storage_unlink", []):
+        _remove_object(path)
+
+
+@event.listens_for(Session, "after_rollback")
+def _keep_released(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop("storage_unlink", None)
+    for tmp_path, _ in session.info.pop("storage_staged", []):
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def recount(referenced_paths) -> dict:
+    """
+    Rebuild refcounts from the given file paths (normally every
+    Submission.file_path) and delete objects nothing references, including
+    files left on disk by uploads whose transaction rolled back.
+    """
+    counts = {}
+    for p in referenced_paths:
+        if object_digest(p) is not None:
+            counts[p] = counts.get(p, 0) + 1
+
+    fixed = removed = 0
+    known = set()
+    for obj in StoredObject.query.all():
+        known.add(obj.path)
+        want = counts.get(obj.path, 0)
+        if want == 0:
+            db.session.delete(obj)
+            db.session.info.setdefault("storage_unlink", []).append(obj.path)
+            removed += 1
+        elif obj.refcount != want:
+            obj.refcount = want
+            fixed += 1
+    db.session.commit()
+
+    # stray files: skip recent ones, their upload may not have committed yet
+    cutoff = time.time() - 3600
+    root = objects_dir()
+    if os.path.isdir(root):
+        for prefix in os.listdir(root):
+            folder = os.path.join(root, prefix)
+            if prefix == "tmp" or not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if (path not in known and path not in counts and object_digest(path) is not None
+                        and os.path.getmtime(path) < cutoff):
+                    os.unlink(path)
+                    removed += 1
+    return {"fixed": fixed, "removed": removed}
+
+
+# ---------- ROUTES ----------
+
+@bp.route("/api/storage/stats", methods=["GET"])
+def storage_stats():
+    objects, stored_bytes, refs, referenced_bytes = db.session.query(
+        func.count(StoredObject.path),
+        func.coalesce(func.sum(StoredObject.size), 0),
+        func.coalesce(func.sum(StoredObject.refcount), 0),
+        func.coalesce(func.sum(StoredObject.size * StoredObject.refcount), 0),
+    ).one()
+    return jsonify({
+        "objects": objects,
+        "references": int(refs),
+        "stored_bytes": int(stored_bytes),
+        "deduped_bytes": int(referenced_bytes) - int(stored_bytes),
+    }), 200
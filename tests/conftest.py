@@ -0,0 +1,101 @@
+"""
+Shared fixtures. app.py and auth.py read their configuration at import,
+so the environment is pointed at a throwaway database and upload folder
+and at the stub OpenAI API and Identity issuer here, before any test
+imports them.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from tests.stubs import start_stub_openai, start_stub_issuer  # noqa: E402
+
+TMP_DIR = tempfile.mkdtemp(prefix="virtualta_tests_")
+OPENAI_URL, OPENAI_CALLS = start_stub_openai(chat_delay=0, polls=1)
+ISSUER_URL, ISSUER_CALLS = start_stub_issuer(delay=0)
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TMP_DIR}/app.db",
+    "UPLOAD_FOLDER": os.path.join(TMP_DIR, "uploads"),
+    "OPENAI_BASE_URL": OPENAI_URL,
+    "OPENAI_API_KEY": "stub",
+    "NETLIFY_ISSUER": ISSUER_URL,
+})
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as A
+    from schema import migrate_database
+
+    with A.app.app_context():
+        migrate_database()
+    return A.app
+
+
+@pytest.fixture
+def db(app):
+    """An app context on the shared test database, emptied afterwards."""
+    from extensions import db
+
+    with app.app_context():
+        yield db
+        db.session.remove()
+        with db.engine.begin() as connection:
+            for table in reversed(db.metadata.sorted_tables):
+                connection.execute(table.delete())
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def assignment(app, db):
+    """An assignment with five ungraded essay submissions."""
+    import app as A
+
+    a = A.Assignment(name="Essay", rubric="Thesis 40, evidence 40, style 20.", owner_email="prof@example.edu")
+    db.session.add(a)
+    db.session.flush()
+    for i in range(5):
+        path = os.path.join(TMP_DIR, f"essay{i}.txt")
+        with open(path, "w") as f:
+            f.write(f"Essay {i}. " + "The argument develops over several paragraphs. " * (10 + i))
+        db.session.add(A.Submission(assignment_id=a.id, student_name=f"S{i}", file_path=path, ai_grade="Pending"))
+    db.session.commit()
+    return a
+
+
+@pytest.fixture
+def make_app(app):
+    """Build another app on a database file of its own: make_app(path) -> Flask app."""
+    from app import create_app
+
+    def build(db_path):
+        return create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}"})
+    return build
+
+
+def _reset(calls: dict) -> dict:
+    for kind in calls:
+        calls[kind] = 0
+    return calls
+
+
+@pytest.fixture
+def openai_calls():
+    """HTTP requests the stub OpenAI API got during the test, per kind."""
+    return _reset(OPENAI_CALLS)
+
+
+@pytest.fixture
+def issuer_calls():
+    """HTTP requests the stub Identity issuer got during the test, per kind."""
+    return _reset(ISSUER_CALLS)
@@ -0,0 +1,153 @@
+"""
+Local stand-ins for the services the app calls, each an HTTP server on
+127.0.0.1 in a daemon thread: the OpenAI API (chat completions, Files,
+Batches) and a Netlify Identity issuer. Used by the tests and benchmarks.
+"""
+import re
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SECRET = "stub-secret"
+CLAIMS = {"sub": "u1", "email": "prof@example.edu", "app_metadata": {"roles": ["professor"]}}
+
+
+def completion(body: dict) -> dict:
+    text = " ".join(m["content"] for m in body.get("messages", []))
+    prompt_tokens = len(text) // 4
+    return {
+        "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": body.get("model"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {
+            "role": "assistant", "content": json.dumps({"feedback": "Clear thesis.", "grade": 80 + len(text) % 20}),
+        }}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 20, "total_tokens": prompt_tokens + 20},
+    }
+
+
+def start_stub_openai(chat_delay: float, polls: int) -> tuple[str, dict]:
+    """
+    Stub OpenAI API: chat completions (after chat_delay seconds) plus the
+    Files and Batches endpoints. A batch reports in_progress for `polls`
+    status checks, then completes with an output file built from its input
+    lines. Returns (base_url, calls) with HTTP request counts per kind.
+    """
+    files, batches = {}, {}
+    calls = {"chat": 0, "files": 0, "batches": 0}
+    lock = threading.Lock()
+
+    def batch_object(b):
+        return {
+            "id": b["id"], "object": "batch", "endpoint": "/v1/chat/completions", "completion_window": "24h",
+            "created_at": 0, "input_file_id": b["input_file_id"], "status": b["status"],
+            "output_file_id": b.get("output_file_id"), "error_file_id": None, "metadata": b["metadata"],
+            "request_counts": {"total": b["total"], "completed": b.get("completed", 0), "failed": 0},
+        }
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, payload, raw: bytes | None = None):
+            out = raw if raw is not None else json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json" if raw is None else "application/octet-stream")
+            self.send_header("content-length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("content-length", 0)))
+            if self.path.endswith("/chat/completions"):
+                with lock:
+                    calls["chat"] += 1
+                time.sleep(chat_delay)
+                return self.send_json(completion(json.loads(body)))
+            if self.path.endswith("/files"):
+                # multipart/form-data: keep the part that holds the JSONL
+                boundary = re.search(r"boundary=(.+)", self.headers["content-type"]).group(1).encode()
+                part = next(p for p in body.split(b"--" + boundary) if b'name="file"' in p)
+                content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+                with lock:
+                    calls["files"] += 1
+                    fid = f"file-{len(files) + 1}"
+                    files[fid] = content
+                return self.send_json({"id": fid, "object": "file", "bytes": len(content), "created_at": 0,
+                                       "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+            if self.path.endswith("/batches"):
+                req = json.loads(body)
+                with lock:
+                    calls["batches"] += 1
+                    bid = f"batch-{len(batches) + 1}"
+                    total = len(files[req["input_file_id"]].splitlines())
+                    batches[bid] = {"id": bid, "input_file_id": req["input_file_id"], "status": "validating",
+                                    "metadata": req.get("metadata"), "total": total, "polls": 0}
+                return self.send_json(batch_object(batches[bid]))
+            self.send_error(404)
+
+        def do_GET(self):
+            with lock:
+                calls["batches" if "/batches" in self.path else "files"] += 1
+            if self.path.endswith("/batches") or "/batches?" in self.path:
+                return self.send_json({"object": "list", "data": [batch_object(b) for b in batches.values()],
+                                       "has_more": False})
+            m = re.search(r"/batches/([^/?]+)$", self.path)
+            if m:
+                b = batches[m.group(1)]
+                b["polls"] += 1
+                if b["status"] != "completed" and b["polls"] > polls:
+                    lines = []
+                    for line in files[b["input_file_id"]].decode().splitlines():
+                        req = json.loads(line)
+                        lines.append(json.dumps({"id": "req", "custom_id": req["custom_id"], "error": None,
+                                                 "response": {"status_code": 200, "body": completion(req["body"])}}))
+                    fid = f"file-{len(files) + 1}"
+                    files[fid] = "\n".join(lines).encode()
+                    b.update(status="completed", output_file_id=fid, completed=len(lines))
+                elif b["status"] == "validating":
+                    b["status"] = "in_progress"
+                return self.send_json(batch_object(b))
+            m = re.search(r"/files/([^/]+)/content$", self.path)
+            if m:
+                return self.send_json(None, raw=files[m.group(1)])
+            self.send_error(404)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1", calls
+
+
+def start_stub_issuer(delay: float) -> tuple[str, dict]:
+    """
+    Stub Netlify Identity issuer: /user answers for CLAIMS (after delay
+    seconds, like a remote hop) and the JWKS is empty. Returns (url, calls).
+    """
+    calls = {"user": 0, "jwks": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                calls["user" if self.path.endswith("/user") else "jwks"] += 1
+            if self.path.endswith("/user"):
+                time.sleep(delay)
+                body = {"id": "u1", "email": CLAIMS["email"], "app_metadata": CLAIMS["app_metadata"]}
+            else:
+                body = {"keys": []}
+            out = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", calls
@@ -0,0 +1,48 @@
+import pytest
+from analytics import grade_score, grade_report
+
+
+@pytest.mark.parametrize("grade, score", [
+    ("87", 87.0),
+    (" 87.5 ", 87.5),
+    ("87%", 87.0),
+    ("17/20", 85.0),
+    ("17 / 20", 85.0),
+    ("2/3", 66.67),
+    ("B+", 88.0),
+    ("a-", 91.0),
+    ("F", 50.0),
+    (92, 92.0),
+    ("Pending", None),
+    ("", None),
+    (None, None),
+    ("5/0", None),
+    ("great work", None),
+])
+def test_grade_score(grade, score):
+    assert grade_score(grade) == score
+
+
+def test_scores_follow_grade_changes(db, assignment):
+    import app as A
+
+    s = A.Submission.query.filter_by(assignment_id=assignment.id).first()
+    s.ai_grade = "17/20"
+    s.final_grade = "B+"
+    db.session.commit()
+    assert (s.ai_score, s.final_score) == (85.0, 88.0)
+
+    s.final_grade = "Pending"
+    db.session.commit()
+    assert s.final_score is None
+
+
+def test_report_uses_final_scores_over_ai_scores():
+    rows = [(1, "Ann", 80.0, None), (2, "Bob", 70.0, 95.0), (3, "Cy", None, None)]
+
+    report = grade_report(rows, outlier_points=10)
+
+    assert (report["submissions"], report["ungraded"]) == (3, 1)
+    assert report["effective"]["mean"] == 87.5
+    assert report["agreement"]["pairs"] == 1
+    assert [o["submission_id"] for o in report["outliers"]] == [2]
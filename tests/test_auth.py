@@ -0,0 +1,83 @@
+import time
+import pytest
+from flask import Flask
+from jose import jwt
+import auth
+from tests.stubs import SECRET, CLAIMS
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A bare app with one require_professor view; token cache emptied."""
+    monkeypatch.setattr(auth, "NETLIFY_JWT_SECRET", None)
+    monkeypatch.setattr(auth, "AUTH_CACHE_TTL", 300.0)
+    auth._token_cache.clear()
+    app = Flask(__name__)
+
+    @app.get("/protected")
+    @auth.require_professor
+    def protected():
+        return {"email": auth.g.email}
+
+    return app.test_client()
+
+
+def bearer(secret: str = SECRET, **claims) -> dict:
+    token = jwt.encode({**CLAIMS, "exp": int(time.time()) + 3600, **claims}, secret, algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_missing_token_is_rejected(client, issuer_calls):
+    assert client.get("/protected").status_code == 401
+    assert issuer_calls["user"] == 0
+
+
+def test_issuer_validates_tokens_once_per_cache_ttl(client, issuer_calls):
+    headers = bearer()
+    for _ in range(3):
+        resp = client.get("/protected", headers=headers)
+        assert resp.status_code == 200
+        assert resp.get_json() == {"email": "prof@example.edu"}
+
+    assert issuer_calls["user"] == 1
+
+
+def test_local_verification_skips_the_issuer(client, issuer_calls, monkeypatch):
+    monkeypatch.setattr(auth, "NETLIFY_JWT_SECRET", SECRET)
+
+    assert client.get("/protected", headers=bearer()).status_code == 200
+    assert issuer_calls["user"] == 0
+
+
+@pytest.mark.parametrize("headers", [
+    pytest.param(lambda: bearer(secret="not-the-secret"), id="bad signature"),
+    pytest.param(lambda: bearer(exp=int(time.time()) - 60), id="expired"),
+])
+def test_local_verification_rejects_bad_tokens(client, issuer_calls, monkeypatch, headers):
+    monkeypatch.setattr(auth, "NETLIFY_JWT_SECRET", SECRET)
+
+    resp = client.get("/protected", headers=headers())
+
+    assert resp.status_code == 401
+    assert resp.get_json()["error"] == "invalid token"
+    assert issuer_calls["user"] == 0
+
+
+def test_professor_role_is_required(client, monkeypatch):
+    monkeypatch.setattr(auth, "NETLIFY_JWT_SECRET", SECRET)
+
+    resp = client.get("/protected", headers=bearer(app_metadata={"roles": ["student"]}))
+
+    assert resp.status_code == 403
+
+
+def test_cached_token_expires_with_its_exp(client, issuer_calls, monkeypatch):
+    monkeypatch.setattr(auth, "NETLIFY_JWT_SECRET", SECRET)
+    exp = int(time.time()) + 1
+    headers = bearer(exp=exp)
+    assert client.get("/protected", headers=headers).status_code == 200
+
+    # jose compares exp with whole seconds
+    time.sleep(exp + 1.1 - time.time())
+
+    assert client.get("/protected", headers=headers).status_code == 401
@@ -0,0 +1,63 @@
+import threading
+import time
+import pytest
+import batch_grading
+from batch_grading import grade_batch, run_concurrently
+from chunked_grading import grade_chunked
+
+
+class InFlight:
+    """chat_fn stub that records the most calls it ever saw at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now = self.peak = self.calls = 0
+
+    def __call__(self, system, user):
+        with self.lock:
+            self.now += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.now)
+        time.sleep(0.02)
+        with self.lock:
+            self.now -= 1
+        return {"notes": "ok", "feedback": "fine", "grade": 80}, {"prompt_tokens": 10}
+
+
+@pytest.fixture
+def chat():
+    return InFlight()
+
+
+def test_nested_chunked_grading_stays_within_the_limit(chat, monkeypatch):
+    monkeypatch.setattr(batch_grading, "GRADING_MAX_IN_FLIGHT", 3)
+    text = "\n".join(f"paragraph {i} " * 20 for i in range(12))
+
+    def grade_fn(submission, rubric):
+        return grade_chunked(chat, submission, rubric, "gpt-4o-mini", chunk_tokens=60)
+
+    results = grade_batch([(text, "rubric")] * 6, grade_fn)
+
+    assert all(r.ok for r in results), [r.error for r in results]
+    assert chat.calls > 6 * 2
+    assert chat.peak <= 3
+
+
+def test_single_submission_still_grades_chunks_in_parallel(chat, monkeypatch):
+    monkeypatch.setattr(batch_grading, "GRADING_MAX_IN_FLIGHT", 3)
+    text = "\n".join(f"paragraph {i} " * 20 for i in range(12))
+
+    feedback, grade, usage = grade_chunked(chat, text, "rubric", "gpt-4o-mini", chunk_tokens=60)
+
+    assert (feedback, grade) == ("fine", "80")
+    assert usage["prompt_tokens"] == 10 * chat.calls
+    assert 1 < chat.peak <= 3
+
+
+def test_errors_stay_with_their_item():
+    def fn(x):
+        if x == 2:
+            raise ValueError("bad item")
+        return x * 10
+
+    assert run_concurrently(fn, [(1,), (2,), (3,)]) == [(10, None), (None, "bad item"), (30, None)]
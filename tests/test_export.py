@@ -0,0 +1,110 @@
+import io
+import csv
+import zipfile
+import xml.etree.ElementTree as ET
+import pytest
+import export
+from export import csv_chunks
+
+NS = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+@pytest.fixture
+def gradebook(db, assignment):
+    """The assignment's essays graded, one with a formula-like name; plus another owner's assignment."""
+    import app as A
+
+    subs = A.Submission.query.filter_by(assignment_id=assignment.id).order_by(A.Submission.id).all()
+    subs[0].student_name = "=HYPERLINK(\"http://x\")"
+    subs[1].ai_grade, subs[1].final_grade = "17/20", "B+"
+    subs[1].ai_feedback = "Good, but cite sources."
+    other = A.Assignment(name="Other", owner_email="someone@example.edu")
+    db.session.add(other)
+    db.session.flush()
+    db.session.add(A.Submission(assignment_id=other.id, student_name="Zed", file_path="x.txt"))
+    db.session.commit()
+    return assignment
+
+
+def read_csv(resp) -> list[list[str]]:
+    body = resp.get_data()
+    assert body.startswith("﻿".encode())
+    return list(csv.reader(io.StringIO(body.decode("utf-8-sig"))))
+
+
+def read_xlsx(resp) -> dict[str, tuple[str, str | None]]:
+    """{"A1": (value, cell type), ...} of the first sheet; formulas would show as type "f"."""
+    with zipfile.ZipFile(io.BytesIO(resp.get_data())) as zf:
+        sheet = ET.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    cells = {}
+    for c in sheet.iterfind(".//x:c", NS):
+        if c.find("x:f", NS) is not None:
+            cells[c.get("r")] = (c.findtext("x:f", "", NS), "f")
+        else:
+            text = "".join(t.text or "" for t in c.iterfind(".//x:t", NS))
+            cells[c.get("r")] = (text or c.findtext("x:v", "", NS), c.get("t"))
+    return cells
+
+
+def test_csv_export_of_an_assignment(client, gradebook):
+    resp = client.get(f"/api/assignments/{gradebook.id}/export")
+
+    assert resp.status_code == 200 and resp.mimetype == "text/csv"
+    assert 'filename="Essay-gradebook.csv"' in resp.headers["Content-Disposition"]
+    header, *rows = read_csv(resp)
+    assert header == ["assignment_id", "assignment", "submission_id", "student_name", "ai_grade",
+                      "ai_score", "final_grade", "final_score", "submitted_at"]
+    assert len(rows) == 5
+    # sorted by student name; the formula-like one is kept as text
+    assert rows[0][3] == "'=HYPERLINK(\"http://x\")"
+    graded = next(r for r in rows if r[3] == "S1")
+    assert graded[4:8] == ["17/20", "85.0", "B+", "88.0"]
+
+
+def test_feedback_column_is_opt_in(client, gradebook):
+    header, *rows = read_csv(client.get(f"/api/assignments/{gradebook.id}/export?feedback=1"))
+
+    assert header[-1] == "ai_feedback"
+    assert next(r for r in rows if r[3] == "S1")[-1] == "Good, but cite sources."
+
+
+def test_owner_export_covers_only_their_assignments(client, gradebook):
+    assert client.get("/api/export").status_code == 401
+
+    rows = read_csv(client.get("/api/export", headers={"X-User-Email": "Prof@example.edu"}))[1:]
+
+    assert {r[1] for r in rows} == {"Essay"} and len(rows) == 5
+
+
+def test_xlsx_export(client, gradebook):
+    pytest.importorskip("xlsxwriter")
+    import app as A
+
+    resp = client.get(f"/api/assignments/{gradebook.id}/export?format=xlsx")
+
+    assert resp.status_code == 200 and resp.mimetype == export.XLSX_MIMETYPE
+    cells = read_xlsx(resp)
+    assert [cells[f"{col}1"][0] for col in "ABCDEFGHI"] == [h for h, _ in A.EXPORT_COLUMNS]
+    assert {r for r in cells if r.startswith("D")} == {f"D{n}" for n in range(1, 7)}
+    # strings are stored as text, so the formula-like name needs no quoting
+    assert cells["D2"] == ('=HYPERLINK("http://x")', "inlineStr")
+    row = next(r[1:] for r, (v, _) in cells.items() if r.startswith("D") and v == "S1")
+    assert [cells[f"{col}{row}"][0] for col in "EFGH"] == ["17/20", "85", "B+", "88"]
+    assert cells[f"F{row}"][1] is None          # scores are numbers
+    assert cells[f"I{row}"][1] == "inlineStr"   # timestamps are ISO text
+
+
+def test_unknown_format_and_assignment(client, gradebook):
+    assert client.get(f"/api/assignments/{gradebook.id}/export?format=pdf").status_code == 400
+    assert client.get("/api/assignments/999999/export").status_code == 404
+
+
+def test_csv_is_sent_in_chunks(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_BYTES", 100)
+    rows = [(i, f"student {i}") for i in range(50)]
+
+    chunks = list(csv_chunks(["id", "name"], iter(rows)))
+
+    assert len(chunks) > 5
+    assert list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8-sig")))) == \
+        [["id", "name"]] + [[str(i), f"student {i}"] for i in range(50)]
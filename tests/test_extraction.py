@@ -0,0 +1,58 @@
+import os
+import signal
+import extraction
+from extraction import parse_files, EXTRACT_MAX_PAGES, EXTRACT_MEMORY_MB
+
+
+def idle_workers() -> list:
+    return extraction._idle_workers.get((EXTRACT_MEMORY_MB, EXTRACT_MAX_PAGES), [])
+
+
+def idle_pids() -> set[int]:
+    return {w.proc.pid for w in idle_workers()}
+
+
+def essays(tmp_path, n: int) -> list[str]:
+    paths = []
+    for i in range(n):
+        path = tmp_path / f"essay{i}.txt"
+        path.write_text(f"Essay {i}.")
+        paths.append(str(path))
+    return paths
+
+
+def test_worker_processes_are_reused_across_calls(tmp_path):
+    paths = essays(tmp_path, 4)
+
+    assert [r.text for r in parse_files(paths, workers=2)] == [f"Essay {i}." for i in range(4)]
+    first = idle_pids()
+    assert [r.text for r in parse_files(paths, workers=2)] == [f"Essay {i}." for i in range(4)]
+
+    assert len(first) == 2 and idle_pids() == first
+
+
+def test_worker_that_died_while_idle_is_replaced(tmp_path):
+    paths = essays(tmp_path, 2)
+    parse_files(paths, workers=2)
+    worker = idle_workers()[0]
+    dead = worker.proc.pid
+    os.kill(dead, signal.SIGKILL)
+    worker.proc.join(timeout=5)
+
+    results = parse_files(paths, workers=2)
+
+    assert [r.error for r in results] == [None, None]
+    assert dead not in idle_pids() and len(idle_pids()) == 2
+
+
+def test_timed_out_worker_is_replaced(tmp_path):
+    big = tmp_path / "big.txt"
+    big.write_text("word " * 5_000_000)
+    parse_files(essays(tmp_path, 1), workers=1)
+    before = idle_pids()
+
+    [result] = parse_files([str(big)], workers=1, timeout=0.01)
+
+    assert "timed out" in result.error
+    assert parse_files(essays(tmp_path, 1), workers=1)[0].text == "Essay 0."
+    assert idle_pids().isdisjoint(before) and len(idle_pids()) == 1
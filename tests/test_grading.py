@@ -0,0 +1,57 @@
+import pytest
+from openai import OpenAI
+from tests.conftest import OPENAI_URL
+
+
+def graded(a):
+    import app as A
+    return A.Submission.query.filter_by(assignment_id=a.id).order_by(A.Submission.id).all()
+
+
+def test_regrade_grades_every_submission(client, assignment, openai_calls):
+    resp = client.post(f"/api/assignments/{assignment.id}/regrade", json={"all": True})
+
+    assert resp.status_code == 200
+    assert resp.get_json()["regraded"] == 5 and resp.get_json()["errors"] == {}
+    assert openai_calls["chat"] == 5
+    for s in graded(assignment):
+        assert s.ai_feedback == "Clear thesis."
+        assert 80 <= s.ai_score < 100
+        assert s.prompt_tokens > 0 and s.completion_tokens == 20
+        assert s.rubric_hash
+
+
+def test_regrade_again_is_served_from_the_cache(client, assignment, openai_calls):
+    client.post(f"/api/assignments/{assignment.id}/regrade", json={"all": True})
+    first = [s.ai_grade for s in graded(assignment)]
+
+    resp = client.post(f"/api/assignments/{assignment.id}/regrade", json={"all": True})
+
+    assert resp.get_json()["regraded"] == 5
+    assert openai_calls["chat"] == 5
+    assert [s.ai_grade for s in graded(assignment)] == first
+    stats = client.get("/api/grading_cache/stats").get_json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (5, 5, 5)
+
+
+def test_batch_regrade_is_ingested(app, client, assignment, openai_calls):
+    import app as A
+    from jobs import GradingJob
+    from openai_batch import advance_batches, OpenAIBatch, BATCH_INGESTED
+
+    resp = client.post(f"/api/assignments/{assignment.id}/regrade", json={"all": True, "batch": True})
+    assert resp.status_code == 202
+
+    for _ in range(10):
+        if not OpenAIBatch.query.filter(OpenAIBatch.status != BATCH_INGESTED).count():
+            break
+        # a new client per step, like a worker restarting between polls
+        advance_batches(OpenAI(api_key="stub", base_url=OPENAI_URL), A.apply_batch_result, poll_seconds=0)
+    else:
+        pytest.fail("batch was never ingested")
+
+    assert openai_calls["chat"] == 0
+    subs = graded(assignment)
+    assert all(s.ai_feedback == "Clear thesis." and s.ai_score >= 80 for s in subs)
+    assert all(s.prompt_tokens > 0 and s.rubric_hash for s in subs)
+    assert GradingJob.query.count() == 0
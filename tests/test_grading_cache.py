@@ -0,0 +1,82 @@
+import datetime
+
+import sqlalchemy as sa
+
+import grading_cache
+from grading_cache import GradingCacheEntry, GradingCacheStats, lookup, store
+
+
+def make_submission(db):
+    from app import Assignment, Submission
+
+    a = Assignment(name="Essay 1", rubric="Thesis and evidence")
+    db.session.add(a)
+    db.session.flush()
+    s = Submission(assignment_id=a.id, student_name="Jo", file_path="jo.txt", ai_grade="Pending")
+    db.session.add(s)
+    db.session.commit()
+    return s
+
+
+def stats(db):
+    db.session.expire_all()
+    row = db.session.get(GradingCacheStats, 1)
+    return (row.hits, row.misses) if row else (0, 0)
+
+
+def test_store_conflict_keeps_the_callers_work(db, monkeypatch):
+    from app import Submission
+
+    sid = make_submission(db).id
+    now = datetime.datetime.utcnow()
+    # another worker stores the key between our lookup and our store...
+    db.session.add(GradingCacheEntry(key="k", model="m", prompt_version="v", feedback="theirs", grade="90",
+                                     hits=0, created_at=now, last_used_at=now))
+    db.session.commit()
+    # ...so our UPDATE finds nothing and our INSERT collides with theirs
+    real_update = grading_cache.update
+    monkeypatch.setattr(grading_cache, "update", lambda table: real_update(table).where(sa.false()))
+
+    db.session.get(Submission, sid).ai_grade = "88"
+    store("k", "m", "v", "ours", "88")
+    db.session.commit()
+
+    monkeypatch.undo()
+    db.session.expire_all()
+    assert db.session.get(Submission, sid).ai_grade == "88"
+    assert db.session.get(GradingCacheEntry, "k").feedback == "theirs"
+
+
+def test_store_does_not_commit(db):
+    s = make_submission(db)
+    s.ai_grade = "88"
+    store("k", "m", "v", "ours", "88")
+    db.session.rollback()
+    assert db.session.get(GradingCacheEntry, "k") is None
+    assert db.session.get(type(s), s.id).ai_grade == "Pending"
+
+
+def test_lookup_counts_land_after_the_callers_transaction(db):
+    store("k", "m", "v", "ours", "88")
+    db.session.commit()
+
+    assert lookup("k") == ("ours", "88")
+    assert lookup("missing") is None
+    assert "grading_cache" in db.session.info       # nothing written yet
+    db.session.commit()
+    assert stats(db) == (1, 1)
+    assert db.session.get(GradingCacheEntry, "k").hits == 1
+
+
+def test_worker_threads_commit_their_cache_entries(db):
+    from batch_grading import run_concurrently
+
+    def grade(i):
+        store(f"k{i}", "m", "v", "fb", str(80 + i))
+        return i
+
+    results = run_concurrently(grade, [(i,) for i in range(4)], max_in_flight=4)
+    assert results == [(0, None), (1, None), (2, None), (3, None)]
+    db.session.expire_all()
+    assert db.session.query(GradingCacheEntry).count() == 4
+    assert grading_cache.lookup("k3") == ("fb", "83")
@@ -0,0 +1,19 @@
+from benchmarks.bench_import import LAZY_MODULES, measure
+
+# Same budget as `python benchmarks/bench_import.py`; best of a few cold
+# starts so one slow run on a busy machine doesn't fail the suite.
+IMPORT_BUDGET_MS = 800
+RUNS = 3
+
+
+def test_app_imports_within_budget():
+    runs = [measure() for _ in range(RUNS)]
+    best_ms = min(next(us for us, depth, name in rows if name == "app" and depth == 0) for rows in runs) / 1000
+
+    assert best_ms <= IMPORT_BUDGET_MS
+
+
+def test_heavy_modules_load_lazily():
+    loaded = {name.split(".")[0] for _, _, name in measure()}
+
+    assert [m for m in LAZY_MODULES if m in loaded] == []
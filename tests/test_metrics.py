@@ -0,0 +1,60 @@
+import os
+import sys
+import logging
+import subprocess
+import textwrap
+import metrics
+from tests.conftest import BASE_DIR
+
+
+def sample(body: str, name: str, **labels) -> float:
+    """Value of one sample in a Prometheus text exposition (0 if absent)."""
+    for line in body.splitlines():
+        if line.startswith(name + "{") and all(f'{k}="{v}"' in line for k, v in labels.items()):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_requests_show_up_in_the_exposition(client):
+    before = sample(client.get("/api/metrics").text, "virtualta_http_request_duration_seconds_count",
+                    route="/api/health")
+    client.get("/api/health")
+    client.get("/api/health")
+
+    body = client.get("/api/metrics").text
+    assert sample(body, "virtualta_http_request_duration_seconds_count", route="/api/health") == before + 2
+    assert "# TYPE virtualta_span_duration_seconds histogram" in body
+
+
+def test_grading_threads_report_into_the_request_trace(client, assignment, caplog, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_SLOW_REQUEST_SECONDS", 1e-9)
+
+    with caplog.at_level(logging.WARNING):
+        client.post(f"/api/assignments/{assignment.id}/regrade", json={"all": True})
+
+    [line] = [r.getMessage() for r in caplog.records if "/regrade" in r.getMessage()]
+    assert line.count("openai_chat ") == 5
+
+
+def test_workers_are_summed_in_multiprocess_mode(tmp_path):
+    # prometheus_client picks its storage at import, so this runs in a fresh interpreter
+    script = textwrap.dedent("""
+        import os
+        import app as A
+
+        client = A.app.test_client()
+        for _ in range(2):
+            pid = os.fork()
+            if pid == 0:
+                A.app.test_client().get("/api/health")
+                os._exit(0)
+            os.waitpid(pid, 0)
+        print(client.get("/api/metrics").text)
+    """)
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path / "metrics"),
+           "DATABASE_URL": f"sqlite:///{tmp_path}/app.db"}
+    proc = subprocess.run([sys.executable, "-c", script], cwd=BASE_DIR, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert sample(proc.stdout, "virtualta_http_request_duration_seconds_count", route="/api/health") == 2
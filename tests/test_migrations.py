@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+# The schema db.create_all() made from the models at the baseline commit,
+# before any revision beyond init; every deployed database starts here.
+BASELINE_SCHEMA = """
+CREATE TABLE rubric (
+    id INTEGER NOT NULL, name VARCHAR(120) NOT NULL, body TEXT NOT NULL,
+    PRIMARY KEY (id), UNIQUE (name));
+CREATE TABLE assignments (
+    id INTEGER NOT NULL, name VARCHAR(180) NOT NULL, rubric TEXT, owner_email VARCHAR(255),
+    rubric_id INTEGER, due_date DATETIME, created_at DATETIME,
+    PRIMARY KEY (id), FOREIGN KEY(rubric_id) REFERENCES rubric (id));
+CREATE INDEX ix_assignments_owner_email ON assignments (owner_email);
+CREATE TABLE submissions (
+    id INTEGER NOT NULL, assignment_id INTEGER NOT NULL, student_name VARCHAR(180) NOT NULL,
+    file_path VARCHAR(300) NOT NULL, ai_feedback TEXT, ai_grade VARCHAR(20), final_grade VARCHAR(20),
+    created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(assignment_id) REFERENCES assignments (id));
+CREATE TABLE pins (
+    id INTEGER NOT NULL, assignment_id INTEGER NOT NULL, class_id INTEGER, pin_code VARCHAR(32) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (pin_code));
+CREATE TABLE submission_pins (
+    id INTEGER NOT NULL, pin VARCHAR(6) NOT NULL, class_id INTEGER NOT NULL, assignment_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+    PRIMARY KEY (id), UNIQUE (pin));
+INSERT INTO assignments (id, name, rubric) VALUES (1, 'Essay 1', 'Thesis and evidence');
+INSERT INTO submissions (id, assignment_id, student_name, file_path, ai_grade, final_grade)
+    VALUES (1, 1, 'Jo', 'uploads/jo.txt', '87%', '17/20');
+"""
+
+# The committed instance/virtualta.db predates owner_email and due_date.
+OLDER_SCHEMA = BASELINE_SCHEMA.replace(" owner_email VARCHAR(255),", "").replace(" due_date DATETIME,", "") \
+    .replace("CREATE INDEX ix_assignments_owner_email ON assignments (owner_email);", "")
+
+
+def head_revision():
+    from schema import _alembic_config
+    heads = ScriptDirectory.from_config(_alembic_config(None)).get_heads()
+    assert len(heads) == 1, heads
+    return heads[0]
+
+
+def build_db(path, script: str):
+    with sqlite3.connect(path) as conn:
+        conn.executescript(script)
+
+
+def schema_diff(db):
+    with db.engine.connect() as connection:
+        return compare_metadata(MigrationContext.configure(connection), db.metadata)
+
+
+@pytest.mark.parametrize("script", [BASELINE_SCHEMA, OLDER_SCHEMA], ids=["baseline", "pre-owner-email"])
+def test_existing_database_upgrades_to_head(make_app, tmp_path, script):
+    from extensions import db
+    from schema import migrate_database
+
+    path = tmp_path / "old.db"
+    build_db(path, script)
+    app = make_app(path)
+    with app.app_context():
+        assert migrate_database() == "upgraded"
+        assert schema_diff(db) == []
+        assert migrate_database() == "upgraded"     # running it again is a no-op
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT version_num FROM alembic_version").fetchall() == [(head_revision(),)]
+        # user data survives and the score backfill ran
+        assert conn.execute("SELECT student_name, ai_score, final_score FROM submissions").fetchall() \
+            == [("Jo", 87.0, 85.0)]
+
+
+def test_empty_database_is_created_at_head(make_app, tmp_path):
+    from extensions import db
+    from schema import migrate_database
+
+    path = tmp_path / "new.db"
+    app = make_app(path)
+    with app.app_context():
+        assert migrate_database() == "created"
+        assert schema_diff(db) == []
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT version_num FROM alembic_version").fetchall() == [(head_revision(),)]
+
+
+@pytest.mark.parametrize("revision", ["a1c4e7f20b13", "c3f81d6e2a97", "d94b0e3c7f21", "e58c2a1f9d46"])
+def test_column_revisions_skip_missing_tables(tmp_path, revision):
+    import sqlalchemy as sa
+    from alembic.operations import Operations
+    from schema import _alembic_config
+
+    module = ScriptDirectory.from_config(_alembic_config(None)).get_revision(revision).module
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    with engine.begin() as connection, Operations.context(MigrationContext.configure(connection)):
+        assert not module._has_column("grading_jobs", "phase")
+        module.upgrade()
+        module.downgrade()
+        assert sa.inspect(connection).get_table_names() == []
+
+
+def test_autogenerate_finds_nothing_at_head(make_app, tmp_path):
+    """The models and the revisions agree, so db-revision starts from a clean slate."""
+    import os
+    from schema import migrate_database, new_revision
+
+    app = make_app(tmp_path / "head.db")
+    with app.app_context():
+        migrate_database()
+        path = new_revision("probe")
+    try:
+        with open(path) as f:
+            source = f.read()
+        assert "op." not in source
+    finally:
+        os.unlink(path)
@@ -0,0 +1,16 @@
+from multi_grading import grade_multi
+
+
+def test_skipped_submissions_keep_their_share_of_the_usage():
+    usage = {"prompt_tokens": 1000, "cached_tokens": 200, "completion_tokens": 90}
+
+    def chat_fn(system, user):
+        return {"results": [{"id": "a", "feedback": "Good.", "grade": 90}]}, usage
+
+    answers, unanswered = grade_multi(chat_fn, "Rubric.", [("a", "first essay"), ("b", "second essay")])
+
+    assert list(answers) == ["a"] and answers["a"][:2] == ("Good.", 90)
+    assert list(unanswered) == ["b"]
+    for k in usage:
+        assert answers["a"][2][k] + unanswered["b"][k] == usage[k]
+    assert unanswered["b"]["prompt_tokens"] > 0
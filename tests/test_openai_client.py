@@ -0,0 +1,61 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import openai
+import pytest
+import openai_client
+from openai_client import OpenAIClientManager
+
+
+@pytest.fixture
+def failing_api():
+    """API answering every request with the status in its path (/429/..., /500/...). Yields (url, hits)."""
+    hits = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("content-length", 0)))
+            status = int(self.path.split("/")[1])
+            hits[status] = hits.get(status, 0) + 1
+            out = json.dumps({"error": {"message": "stub", "type": "stub", "code": None}}).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(out)))
+            self.send_header("retry-after-ms", "1")
+            self.end_headers()
+            self.wfile.write(out)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits
+    server.shutdown()
+
+
+def chat(url):
+    client = OpenAIClientManager(api_key="stub", base_url=url).get()
+    return client.chat.completions.create(model="stub", messages=[{"role": "user", "content": "hi"}])
+
+
+def test_rate_limits_are_left_to_the_caller(failing_api, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_MAX_RETRIES", 2)
+    url, hits = failing_api
+
+    with pytest.raises(openai.RateLimitError):
+        chat(f"{url}/429")
+
+    assert hits == {429: 1}
+
+
+def test_server_errors_are_still_retried(failing_api, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_MAX_RETRIES", 2)
+    url, hits = failing_api
+
+    with pytest.raises(openai.InternalServerError):
+        chat(f"{url}/500")
+
+    assert hits == {500: 3}
@@ -0,0 +1,161 @@
+import pytest
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+import pins
+from pins import Pin, PinCounter, PIN_SPACE, allocate_pins, permute_pin, bump_pin_cache_version
+from models.submission_pin import SubmissionPin
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    pins.pin_cache.invalidate()
+    yield
+    pins.pin_cache.invalidate()
+
+
+def test_allocation_skips_codes_of_submission_pins(db):
+    db.session.add(SubmissionPin(pin=permute_pin(0), class_id=1, assignment_id=1, student_id=7))
+    db.session.commit()
+
+    [pin] = allocate_pins(1, None)
+
+    assert pin.pin_code == permute_pin(1)
+
+
+def test_submission_pin_wins_a_shared_legacy_code(client, db):
+    db.session.add(Pin(assignment_id=1, class_id=1, pin_code="123456"))
+    db.session.add(SubmissionPin(pin="123456", class_id=1, assignment_id=2, student_id=7))
+    db.session.commit()
+
+    resp = client.get("/api/pins/123456")
+
+    assert resp.status_code == 200
+    assert resp.get_json()["assignment_id"] == 2 and resp.get_json()["student_id"] == 7
+
+
+def counter(db) -> int:
+    return db.session.get(PinCounter, "pins", populate_existing=True).next_value
+
+
+def test_permutation_is_a_bijection_on_six_digit_codes():
+    codes = {permute_pin(n) for n in range(PIN_SPACE)}
+
+    assert len(codes) == PIN_SPACE
+    assert all(len(c) == 6 and c.isdigit() for c in codes)
+    with pytest.raises(ValueError):
+        permute_pin(PIN_SPACE)
+
+
+def test_pins_follow_the_counter(client, db):
+    resp = client.post("/api/pins/bulk", json={"assignment_id": 1, "class_id": 2, "count": 3})
+    [single] = allocate_pins(1, 2)
+    db.session.commit()
+
+    assert resp.status_code == 201
+    assert [p["pin_code"] for p in resp.get_json()["pins"]] == [permute_pin(n) for n in range(3)]
+    assert single.pin_code == permute_pin(3)
+    assert counter(db) == 4
+
+
+def test_hand_picked_codes_are_skipped(client, db):
+    resp = client.post("/api/pins", json={"assignment_id": 1, "pin_code": permute_pin(1)})
+    assert resp.status_code == 201
+
+    resp = client.post("/api/pins/bulk", json={"assignment_id": 1, "count": 3})
+
+    assert [p["pin_code"] for p in resp.get_json()["pins"]] == [permute_pin(n) for n in (0, 2, 3)]
+    assert counter(db) == 4
+    assert client.post("/api/pins", json={"assignment_id": 1, "pin_code": permute_pin(0)}).status_code == 409
+
+
+def test_counter_moved_by_another_request_is_retried(db, monkeypatch):
+    allocate_pins(1, None)
+    db.session.commit()
+    raced = []
+
+    def permute_after_a_race(n):
+        if not raced:
+            # another worker takes codes 1-3 between our read and our update
+            table = PinCounter.__table__
+            with db.engine.begin() as conn:
+                conn.execute(update(table).where(table.c.name == "pins").values(next_value=4))
+            raced.append(n)
+        return permute_pin(n)
+    monkeypatch.setattr(pins, "permute_pin", permute_after_a_race)
+
+    codes = [p.pin_code for p in allocate_pins(1, None, 2)]
+    db.session.commit()
+
+    assert raced == [1]
+    assert codes == [permute_pin(4), permute_pin(5)]
+    assert counter(db) == 6
+
+
+def stats(client) -> dict:
+    return client.get("/api/pins/cache").get_json()
+
+
+def test_repeated_lookups_are_served_from_the_cache(client, db):
+    db.session.add(Pin(assignment_id=1, class_id=2, pin_code="424242"))
+    db.session.commit()
+    before = stats(client)
+
+    answers = [client.get("/api/pins/424242").get_json() for _ in range(3)]
+    for _ in range(2):
+        assert client.get("/api/pins/999999").status_code == 404
+
+    assert answers[0]["assignment_id"] == 1 and answers == [answers[0]] * 3
+    after = stats(client)
+    assert {k: after[k] - before[k] for k in ("misses", "hits", "negative_hits")} == \
+        {"misses": 2, "hits": 2, "negative_hits": 1}
+
+
+def test_created_and_deleted_pins_show_at_once(client, db):
+    assert client.get("/api/pins/424242").status_code == 404
+
+    resp = client.post("/api/pins", json={"assignment_id": 1, "pin_code": "424242"})
+    assert resp.status_code == 201
+    assert client.get("/api/pins/424242").status_code == 200
+
+    db.session.delete(db.session.get(Pin, resp.get_json()["id"]))
+    db.session.commit()
+    assert client.get("/api/pins/424242").status_code == 404
+
+
+def test_rolled_back_changes_keep_the_cache(client, db):
+    assert client.get("/api/pins/424242").status_code == 404
+    invalidations = stats(client)["invalidations"]
+
+    db.session.add(Pin(assignment_id=1, pin_code="424242"))
+    db.session.flush()
+    db.session.rollback()
+
+    assert stats(client)["invalidations"] == invalidations
+    assert client.get("/api/pins/424242").status_code == 404
+
+
+def test_failed_savepoint_keeps_earlier_changes_pending(client, db):
+    db.session.add(Pin(assignment_id=1, pin_code="111111"))
+    db.session.commit()
+    assert client.get("/api/pins/424242").status_code == 404
+
+    db.session.add(Pin(assignment_id=1, pin_code="424242"))
+    db.session.flush()
+    with pytest.raises(IntegrityError):
+        with db.session.begin_nested():
+            db.session.add(Pin(assignment_id=1, pin_code="111111"))
+    db.session.commit()
+
+    assert client.get("/api/pins/424242").status_code == 200
+
+
+def test_changes_from_other_processes_clear_the_cache(client, db, monkeypatch):
+    monkeypatch.setattr(pins, "PIN_CACHE_VERSION_CHECK", 0)
+    assert client.get("/api/pins/424242").status_code == 404
+
+    # another worker inserts a pin: no session events here, only the shared version row
+    with db.engine.begin() as conn:
+        conn.execute(Pin.__table__.insert().values(assignment_id=1, pin_code="424242"))
+        bump_pin_cache_version(conn)
+
+    assert client.get("/api/pins/424242").status_code == 200
@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+import time
+import pytest
+from sqlalchemy.exc import OperationalError
+import rate_limit
+from rate_limit import RateLimiter, RateLimitState, RateLimitBusy
+
+
+def test_concurrent_takes_wait_out_sqlite_locks(app, db):
+    limiter = RateLimiter("test:concurrent", rpm=600, tpm=10_000_000)
+    errors = []
+
+    def worker():
+        with app.app_context():
+            for _ in range(25):
+                try:
+                    assert limiter._try_take(10) == 0
+                except Exception as e:
+                    errors.append(e)
+
+    started = time.time()
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    assert errors == []
+    # every take landed: 200 requests out of 600, plus what refilled meanwhile
+    left = db.session.get(RateLimitState, "test:concurrent").request_tokens
+    assert 400 <= left <= 400 + elapsed * 600 / 60 + 1
+
+
+def locked(*args):
+    raise OperationalError("SELECT ...", {}, sqlite3.OperationalError("database is locked"))
+
+
+def test_lock_that_never_frees_fails_clearly(app, db, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_LOCK_RETRIES", 2)
+    monkeypatch.setattr(RateLimiter, "_locked_row", locked)
+
+    with pytest.raises(RateLimitBusy, match="stayed locked"):
+        RateLimiter("test:locked").acquire(10)
+
+
+def test_other_database_errors_are_not_retried(app, db, monkeypatch):
+    calls = []
+
+    def broken(*args):
+        calls.append(1)
+        raise OperationalError("SELECT ...", {}, sqlite3.OperationalError("no such table: rate_limit_state"))
+    monkeypatch.setattr(RateLimiter, "_locked_row", broken)
+
+    with pytest.raises(OperationalError):
+        RateLimiter("test:broken").acquire(10)
+    assert len(calls) == 1
+
+
+def test_settle_refunds_up_to_the_bucket_capacity(app, db):
+    limiter = RateLimiter("test:settle", rpm=600, tpm=10_000)
+    limiter.acquire(1_000)
+
+    limiter.settle(estimated=5_000, actual=100)
+    full = db.session.get(RateLimitState, "test:settle", populate_existing=True).token_tokens
+    limiter.settle(estimated=100, actual=600)
+    after = db.session.get(RateLimitState, "test:settle", populate_existing=True).token_tokens
+
+    assert full == 10_000
+    assert after == 9_500
@@ -0,0 +1,67 @@
+import random
+from array import array
+import pytest
+import similarity
+from similarity import minhash, shingles, estimate, SIMILARITY_NUM_PERM
+
+
+def reference_minhash(hashes):
+    """The definition minhash() must match exactly: stored signatures depend on it."""
+    if not hashes:
+        return array("I", [similarity._MAX32] * SIMILARITY_NUM_PERM)
+    p = similarity._PRIME
+    return array("I", (min((a * x + b) % p for x in hashes) & similarity._MAX32
+                       for a, b in similarity._PERMUTATIONS))
+
+
+@pytest.mark.parametrize("n", [0, 1, 3, 1000, similarity.MINHASH_BLOCK + 17])
+def test_minhash_matches_the_integer_definition(n):
+    rng = random.Random(n)
+    p = similarity._PRIME
+    hashes = {rng.getrandbits(64) for _ in range(n)}
+    if n:
+        hashes |= {0, p - 1, p, p + 1, (1 << 64) - 1}
+
+    assert minhash(hashes) == reference_minhash(hashes)
+
+
+def test_edited_copy_scores_close_to_its_jaccard_similarity():
+    rng = random.Random(3)
+    words = [f"w{rng.randrange(5000)}" for _ in range(600)]
+    edited = [f"x{i}" if rng.random() < 0.03 else w for i, w in enumerate(words)]
+    a, b = shingles(" ".join(words)), shingles(" ".join(edited))
+
+    jaccard = len(a & b) / len(a | b)
+
+    assert abs(estimate(minhash(a), minhash(b)) - jaccard) < 0.15
+
+
+def test_regrade_indexes_the_submissions(client, assignment):
+    client.post(f"/api/assignments/{assignment.id}/regrade", json={"all": True})
+
+    report = client.get(f"/api/assignments/{assignment.id}/similarity").get_json()
+
+    assert report["unindexed"] == 0
+    assert len(report["pairs"]) == 10
+
+
+def test_copying_past_the_grading_budget_is_found(client, db, tmp_path):
+    import app as A
+
+    rng = random.Random(7)
+    shared = " ".join(f"s{rng.randrange(50000)}" for _ in range(8000))
+    a = A.Assignment(name="Long essay", rubric="Anything.", grading_mode="truncate")
+    db.session.add(a)
+    db.session.flush()
+    for name in ("A", "B"):
+        own = " ".join(f"{name}{rng.randrange(50000)}" for _ in range(2500))
+        assert len(own) > A.SUBMISSION_CHAR_BUDGET
+        path = tmp_path / f"{name}.txt"
+        path.write_text(own + " " + shared)
+        db.session.add(A.Submission(assignment_id=a.id, student_name=name, file_path=str(path)))
+    db.session.commit()
+
+    client.post(f"/api/assignments/{a.id}/regrade", json={"all": True})
+    report = client.get(f"/api/assignments/{a.id}/similarity").get_json()
+
+    assert [p["student_names"] for p in report["pairs"]] == [["A", "B"]]
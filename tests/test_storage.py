@@ -0,0 +1,92 @@
+import io
+import os
+import storage
+from storage import StoredObject, stage_stream, store_staged, release
+
+
+def stage(data: bytes = b"same essay bytes"):
+    return stage_stream("essay.txt", io.BytesIO(data))
+
+
+def refcount(db, path):
+    obj = db.session.get(StoredObject, path)
+    return obj.refcount if obj is not None else 0
+
+
+def release_now_unlink_later(db, path):
+    """Commit a release() of the last reference, but hold back its file removal."""
+    release(path)
+    held = db.session.info.pop("storage_unlink")
+    db.session.commit()
+    return held
+
+
+def test_store_dedupes_and_cleans_up_temp_copies(db):
+    first, second = stage(), stage()
+    path, deduped = store_staged(first)
+    assert store_staged(second) == (path, True) and not deduped
+    db.session.commit()
+
+    assert refcount(db, path) == 2
+    assert not os.path.exists(first.tmp_path) and not os.path.exists(second.tmp_path)
+
+
+def test_last_release_deletes_the_file(db):
+    path, _ = store_staged(stage())
+    db.session.commit()
+    release(path)
+    assert os.path.exists(path)
+    db.session.commit()
+
+    assert refcount(db, path) == 0
+    assert not os.path.exists(path)
+    assert os.listdir(os.path.join(storage.objects_dir(), "tmp")) == []
+
+
+def test_release_finishing_late_keeps_a_reupload(db):
+    path, _ = store_staged(stage())
+    db.session.commit()
+    held = release_now_unlink_later(db, path)
+
+    # the re-upload sees the file, then the release's removal runs
+    assert store_staged(stage()) == (path, True)
+    db.session.commit()
+    for p in held:
+        storage._remove_object(p)
+
+    assert refcount(db, path) == 1
+    assert os.path.exists(path)
+
+
+def test_release_between_store_and_commit_is_restored(db):
+    path, _ = store_staged(stage())
+    db.session.commit()
+    held = release_now_unlink_later(db, path)
+
+    assert store_staged(stage()) == (path, True)
+    for p in held:
+        storage._remove_object(p)
+    assert not os.path.exists(path)
+    db.session.commit()
+
+    assert refcount(db, path) == 1
+    with open(path, "rb") as f:
+        assert f.read() == b"same essay bytes"
+
+
+def test_rollback_drops_the_temp_copy(db):
+    staged = stage(b"never committed")
+    store_staged(staged)
+    db.session.rollback()
+
+    assert not os.path.exists(staged.tmp_path)
+
+
+def test_objects_go_under_the_app_upload_folder(app, db, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+
+    path, _ = store_staged(stage(b"stored elsewhere"))
+    db.session.commit()
+
+    assert path.startswith(os.path.join(str(tmp_path), "objects") + os.sep)
+    assert os.path.exists(path)
@@ -0,0 +1,76 @@
+import io
+import zipfile
+import pytest
+import zip_import
+from storage import discard_staged
+from zip_import import ZipLimitError, stage_archive
+
+
+def archive(entries: dict, compression=zipfile.ZIP_DEFLATED) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression) as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def accept(name: str) -> bool:
+    return name.rsplit(".", 1)[-1] in {"txt", "pdf", "docx"}
+
+
+def stage(entries: dict, **kwargs):
+    staged, skipped = stage_archive(archive(entries, **kwargs), accept)
+    names = sorted(item.filename for item in staged)
+    for item in staged:
+        discard_staged(item)
+    return names, skipped
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(zip_import, "ZIP_MAX_ENTRY_BYTES", 1000)
+    monkeypatch.setattr(zip_import, "ZIP_MAX_ENTRIES", 5)
+    monkeypatch.setattr(zip_import, "ZIP_MAX_TOTAL_BYTES", 5000)
+    monkeypatch.setattr(zip_import, "ZIP_RATIO_MIN_BYTES", 100)
+    monkeypatch.setattr(zip_import, "ZIP_MAX_RATIO", 10)
+
+
+def test_large_entries_of_other_types_are_only_skipped(db, limits):
+    names, skipped = stage({"class/a_Ann.txt": "essay", "class/lecture.mp4": bytes(3000)},
+                           compression=zipfile.ZIP_STORED)
+
+    assert names == ["a_Ann.txt"]
+    assert skipped == [{"filename": "class/lecture.mp4", "error": "invalid file type"}]
+
+
+def test_oversized_submission_is_skipped_not_rejected(db, limits):
+    names, skipped = stage({"a_Ann.txt": "essay", "b_Bob.txt": "x" * 2000, "c_Cy.txt": "y" * 500})
+
+    assert names == ["a_Ann.txt"]
+    assert [s["filename"] for s in skipped] == ["b_Bob.txt", "c_Cy.txt"]
+    assert "size limit" in skipped[0]["error"]
+    assert skipped[1]["error"] == "suspicious compression ratio"
+
+
+@pytest.mark.parametrize("entries", [
+    pytest.param({f"{i}_S.txt": "essay" for i in range(6)}, id="entry count"),
+    pytest.param({f"{i}.mp4": bytes(900) for i in range(5)} | {"a_Ann.txt": ""}, id="total size"),
+])
+def test_archive_over_the_whole_archive_limits_is_rejected(db, limits, entries):
+    with pytest.raises(ZipLimitError):
+        stage(entries)
+
+
+def test_upload_reports_skipped_entries(client, assignment, limits):
+    data = {
+        "assignment_id": str(assignment.id),
+        "file": (archive({"a_Ann.txt": "essay", "b_Bob.txt": "x" * 2000}), "class.zip"),
+    }
+
+    resp = client.post("/api/upload_submissions_zip", data=data, content_type="multipart/form-data")
+
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert len(body["created_ids"]) == 1
+    assert [s["filename"] for s in body["skipped"]] == ["b_Bob.txt"]
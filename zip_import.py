@@ -0,0 +1,111 @@
+# zip_import.py
+import os
+import zipfile
+import posixpath
+from storage import StagedUpload, stage_stream, discard_staged
+
+# Limits for POST /api/upload_submissions_zip. Sizes are checked twice:
+# first against what the archive's central directory declares, then
+# against the bytes actually decompressed, since the directory can lie.
+ZIP_MAX_UPLOAD_BYTES = int(os.getenv("ZIP_MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+ZIP_MAX_ENTRIES = int(os.getenv("ZIP_MAX_ENTRIES", "2000"))
+ZIP_MAX_ENTRY_BYTES = int(os.getenv("ZIP_MAX_ENTRY_BYTES", str(25 * 1024 * 1024)))
+ZIP_MAX_TOTAL_BYTES = int(os.getenv("ZIP_MAX_TOTAL_BYTES", str(512 * 1024 * 1024)))
+# Uncompressed/compressed size allowed for entries over ZIP_RATIO_MIN_BYTES
+# (small text files legitimately compress very well).
+ZIP_MAX_RATIO = float(os.getenv("ZIP_MAX_RATIO", "100"))
+ZIP_RATIO_MIN_BYTES = 1024 * 1024
+
+
+class ZipLimitError(ValueError):
+    """The archive breaks one of the ZIP_MAX_* limits (likely a zip bomb); nothing is imported."""
+
+
+def entry_name(info: zipfile.ZipInfo) -> str:
+    """File name of an entry without its folders (LMS exports nest them)."""
+    return posixpath.basename(info.filename.replace("\\", "/"))
+
+
+def skip_reason(info: zipfile.ZipInfo, accept) -> str | None:
+    """Why an entry is left out, or None to import it. Directories return ""."""
+    name = entry_name(info)
+    if info.is_dir() or not name:
+        return ""
+    if "__MACOSX/" in info.filename or name.startswith("."):
+        return ""
+    if not accept(name):
+        return "invalid file type"
+    if info.flag_bits & 0x1:
+        return "encrypted"
+    return None
+
+
+def check_archive(zf: zipfile.ZipFile, accept) -> tuple[list[zipfile.ZipInfo], list[dict]]:
+    """
+    (entries to import, skipped) of the archive, from its declared sizes.
+    Entry count and total size are checked over the whole archive and
+    raise ZipLimitError; the per-entry size and ratio limits only apply to
+    entries that would be imported, and one over them is skipped.
+    """
+    infos = zf.infolist()
+    if len(infos) > ZIP_MAX_ENTRIES:
+        raise ZipLimitError(f"archive has {len(infos)} entries, the limit is {ZIP_MAX_ENTRIES}")
+    total = sum(info.file_size for info in infos)
+    if total > ZIP_MAX_TOTAL_BYTES:
+        raise ZipLimitError(f"archive is {total} bytes uncompressed, the limit is {ZIP_MAX_TOTAL_BYTES}")
+    accepted, skipped = [], []
+    for info in infos:
+        reason = skip_reason(info, accept)
+        if reason is None and info.file_size > ZIP_MAX_ENTRY_BYTES:
+            reason = f"over the {ZIP_MAX_ENTRY_BYTES} byte size limit"
+        if reason is None and info.file_size > ZIP_RATIO_MIN_BYTES \
+                and info.file_size > ZIP_MAX_RATIO * max(1, info.compress_size):
+            reason = "suspicious compression ratio"
+        if reason is None:
+            accepted.append(info)
+        elif reason:
+            skipped.append({"filename": info.filename, "error": reason})
+    return accepted, skipped
+
+
+class _CappedReader:
+    """Reads a member stream, raising ZipLimitError once it yields more than allowed."""
+
+    def __init__(self, raw, name: str, limit: int):
+        self.raw, self.name, self.limit, self.count = raw, name, limit, 0
+
+    def read(self, n: int = -1) -> bytes:
+        chunk = self.raw.read(n)
+        self.count += len(chunk)
+        if self.count > self.limit:
+            raise ZipLimitError(f"{self.name} decompresses past the size limit")
+        return chunk
+
+
+def stage_archive(stream, accept) -> tuple[list[StagedUpload], list[dict]]:
+    """
+    Decompress the accepted entries of a ZIP (a seekable file object) one at
+    a time into staged uploads, never unpacking the whole archive. Returns
+    (staged, skipped); skipped lists {"filename", "error"} of entries left
+    out. On any error the entries staged so far are discarded.
+    """
+    staged, skipped = [], []
+    try:
+        with zipfile.ZipFile(stream) as zf:
+            budget = ZIP_MAX_TOTAL_BYTES
+            accepted, skipped = check_archive(zf, accept)
+            for info in accepted:
+                limit = min(ZIP_MAX_ENTRY_BYTES, info.file_size, budget)
+                try:
+                    with zf.open(info) as raw:
+                        item = stage_stream(entry_name(info), _CappedReader(raw, info.filename, limit))
+                except NotImplementedError:
+                    skipped.append({"filename": info.filename, "error": "unsupported compression"})
+                    continue
+                staged.append(item)
+                budget -= item.size
+    except BaseException:
+        for item in staged:
+            discard_staged(item)
+        raise
+    return staged, skipped